@@ -1,7 +1,20 @@
+import mimetypes
+import os
+import uuid
+
 import requests
 from xml.etree import ElementTree
 import util
 
+# read/write size used when streaming content to and from the repository
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# maxItems requested per page when listing collections
+PAGE_SIZE = 1000
+
+# connections to the repository kept open for reuse, shared by the worker threads of a client
+POOL_SIZE = 32
+
 
 ######################################
 # convenience (module) functions
@@ -10,32 +23,159 @@ def fullGroupId(groupId):
     return groupId if groupId.startswith('GROUP_') else 'GROUP_' + groupId
 
 
+# 'fields' and 'include' query parameters, which limit the properties returned for an entity
+def projectionParams(fields=None, include=None, params=None):
+    params = dict(params or {})
+    if fields:
+        params['fields'] = ','.join(fields)
+    if include:
+        params['include'] = ','.join(include)
+    return params or None
+
+
+# whether the permissions of a node (include=permissions) differ from the desired
+# ones: inheritance, or the authority, role and access status of the local entries
+def permissionsChanged(current, desired):
+    current = current or {}
+    inheritance = lambda p: str(p.get('isInheritanceEnabled', True)).lower()
+    if inheritance(current) != inheritance(desired):
+        return True
+    key = lambda p: (p['authorityId'], p['name'], p.get('accessStatus', 'ALLOWED'))
+    return sorted(map(key, current.get('locallySet') or [])) != sorted(map(key, desired.get('locallySet') or []))
+
+
+def _toBytes(value):
+    if not isinstance(value, (bytes, type(u''))):
+        value = str(value)
+    return value if isinstance(value, bytes) else value.encode('utf-8')
+
+
+#############################################
+# multipart/form-data body that is read on demand, so a large file is sent
+# in chunks instead of being loaded into memory by requests.
+# content is a file path or a binary file-like object.
+class MultipartFileStream(object):
+    def __init__(self, content, name=None, fields=None, fieldName='filedata', mimeType=None,
+                 chunkSize=STREAM_CHUNK_SIZE, callback=None):
+        if hasattr(content, 'read'):
+            self.file = content
+            self.ownsFile = False
+            name = name or os.path.basename(getattr(content, 'name', 'content'))
+        else:
+            self.file = open(content, 'rb')
+            self.ownsFile = True
+            name = name or os.path.basename(content)
+
+        self.fileSize = self._remainingSize(self.file)
+        self.chunkSize = chunkSize
+        self.callback = callback
+        self.boundary = uuid.uuid4().hex
+        self.contentType = 'multipart/form-data; boundary=' + self.boundary
+
+        mimeType = mimeType or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        head = b''
+        for key, value in sorted((fields or {}).items()):
+            head += (b'--' + _toBytes(self.boundary) + b'\r\n' +
+                     b'Content-Disposition: form-data; name="' + _toBytes(key) + b'"\r\n\r\n' +
+                     _toBytes(value) + b'\r\n')
+        head += (b'--' + _toBytes(self.boundary) + b'\r\n' +
+                 b'Content-Disposition: form-data; name="' + _toBytes(fieldName) + b'"; filename="' +
+                 _toBytes(name) + b'"\r\n' +
+                 b'Content-Type: ' + _toBytes(mimeType) + b'\r\n\r\n')
+        self.head = head
+        self.tail = b'\r\n--' + _toBytes(self.boundary) + b'--\r\n'
+        self.totalSize = len(self.head) + self.fileSize + len(self.tail)
+        self.position = 0
+
+    @staticmethod
+    def _remainingSize(f):
+        try:
+            return os.fstat(f.fileno()).st_size - f.tell()
+        except (AttributeError, IOError, OSError, ValueError):
+            start = f.tell()
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            f.seek(start)
+            return end - start
+
+    def __len__(self):
+        return self.totalSize
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunkSize)
+            if not chunk:
+                break
+            yield chunk
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.totalSize - self.position
+
+        chunk = b''
+        headEnd = len(self.head)
+        fileEnd = headEnd + self.fileSize
+        while len(chunk) < size and self.position < self.totalSize:
+            wanted = size - len(chunk)
+            if self.position < headEnd:
+                part = self.head[self.position:self.position + wanted]
+            elif self.position < fileEnd:
+                part = self.file.read(min(wanted, fileEnd - self.position))
+                if not part:
+                    raise IOError('content ended after ' + str(self.position - headEnd) + ' of ' +
+                                  str(self.fileSize) + ' bytes')
+            else:
+                offset = self.position - fileEnd
+                part = self.tail[offset:offset + wanted]
+            chunk += part
+            self.position += len(part)
+
+        if chunk and self.callback:
+            self.callback(self.position, self.totalSize)
+        return chunk
+
+    def close(self):
+        if self.ownsFile:
+            self.file.close()
+
+
 #############################################
 class AcsClient:
     ######################################
     # constructor
-    def __init__(self, urlbase, user, pw, use_session=True):
+    def __init__(self, urlbase, user, pw, use_session=True, pageSize=PAGE_SIZE, poolSize=POOL_SIZE):
         self.urlbase = urlbase
+        self.pageSize = pageSize
         self.api_prefix = urlbase + '/alfresco/api/-default-/public/alfresco/versions/1'
         self.gs_api_prefix = urlbase + '/alfresco/api/-default-/public/gs/versions/1'
         self.web_script_api_prefix = urlbase + '/alfresco/s/api'
         self.user = user
         self.pw = pw
         self.auth = (user, pw)
+        self.use_session = use_session
+        # one session for all the threads: its connection pool is thread-safe, and keeps up to
+        # poolSize connections alive, however many short-lived worker pools use the client
+        self.session = requests
         if use_session:
             self.session = requests.Session()
-        else:
-            self.session = requests
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=poolSize)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+
+    # close the connections of the session
+    def close(self):
+        if self.use_session:
+            self.session.close()
 
     @classmethod
-    def fromConfig(cls, filename=None, stage='dev'):
+    def fromConfig(cls, filename=None, stage='dev', poolSize=POOL_SIZE):
         conf = util.getConfig(filename, stage)
         user = conf and conf['user']
         pw = conf and conf['password']
         urlbase = conf and (conf['url'] or conf['urlbase'])
 
         if user and pw and urlbase:
-            return cls(urlbase, user, pw)
+            return cls(urlbase, user, pw, poolSize=poolSize)
         else:
             return None
 
@@ -43,26 +183,50 @@ class AcsClient:
     # get, post and put
     def handleResponse(self, response):
         if response.ok:
-            if response.headers['Content-Type'].startswith('application/json'):
+            contentType = response.headers.get('Content-Type', '')
+            if response.status_code == requests.codes.no_content:
+                return None
+            elif contentType.startswith('application/json'):
                 return response.json()
-            elif response.headers['Content-Type'].startswith('text/xml'):
+            elif contentType.startswith('text/xml'):
                 return ElementTree.fromstring(response.text)
-            elif response.headers['Content-Type'].startswith('text'):
+            elif contentType.startswith('text'):
                 return response.text
             else:
-                return response.raw
+                # the body has already been read unless the request was streamed
+                return response.content
         else:
             response.raise_for_status()
 
-    def _get(self, url):
-        response = self.session.get(url, auth=self.auth)
+    def _get(self, url, params=None):
+        response = self.session.get(url, auth=self.auth, params=params)
         if response.status_code == requests.codes.not_found:
             return None
         else:
             return self.handleResponse(response)
 
-    def _post(self, url, json=None, data=None, files=None):
-        response = self.session.post(url, auth=self.auth, json=json, data=data, files=files)
+    # iterate the entries of a paged v1 collection, fetching pageSize items per request
+    def _getPaged(self, url, params=None):
+        params = dict(params or {})
+        skipCount = 0
+        while True:
+            params['skipCount'] = skipCount
+            params['maxItems'] = self.pageSize
+            r = self._get(url, params)
+            if not (r and r['list']):
+                return
+
+            entries = r['list']['entries']
+            for entry in entries:
+                yield entry
+
+            pagination = r['list'].get('pagination') or {}
+            if not entries or not pagination.get('hasMoreItems'):
+                return
+            skipCount += len(entries)
+
+    def _post(self, url, json=None, data=None, files=None, headers=None):
+        response = self.session.post(url, auth=self.auth, json=json, data=data, files=files, headers=headers)
         return self.handleResponse(response)
 
     def _put(self, url, json=None, data=None, files=None):
@@ -75,9 +239,9 @@ class AcsClient:
 
     ######################################
     # groups API
-    def getGroup(self, id):
+    def getGroup(self, id, fields=None):
         url = self.api_prefix + '/groups/' + fullGroupId(id)
-        r = self._get(url)
+        r = self._get(url, projectionParams(fields))
         return r and r['entry']
 
     def createRootGroup(self, id, displayName):
@@ -92,10 +256,14 @@ class AcsClient:
         r = self._post(url, json=data)
         return r and r['entry']
 
+    # iterate all groups page by page
+    def getGroups(self, fields=None, where=None):
+        url = self.api_prefix + '/groups'
+        return self._getPaged(url, projectionParams(fields, params={'where': where} if where else None))
+
     def getGroupMembers(self, groupId):
         url = self.api_prefix + '/groups/' + fullGroupId(groupId) + '/members'
-        r = self._get(url)
-        return r and r['list'] and r['list'].r['entries']
+        return list(self._getPaged(url))
 
     def addGroupMember(self, groupId, memberId, memberType='GROUP'):
         url = self.api_prefix + '/groups/' + fullGroupId(groupId) + '/members'
@@ -110,17 +278,60 @@ class AcsClient:
 
         return r
 
+    def removeGroupMember(self, groupId, memberId):
+        url = self.api_prefix + '/groups/' + fullGroupId(groupId) + '/members/' + memberId
+        try:
+            self._delete(url)
+        except requests.exceptions.HTTPError as ex:
+            if ex.response.status_code != requests.codes.not_found:
+                raise
+            # else member already removed
+
+    # make the members of a group match desiredMembers, a list of member ids
+    # (groups prefixed with 'GROUP_') or {"id": ..., "memberType": ...} dicts.
+    # only the difference is sent; with removeExtra=False existing members are kept.
+    # returns {"add": [...], "remove": [...], "unchanged": n, "dryRun": bool}.
+    def syncGroupMembers(self, groupId, desiredMembers, removeExtra=True, dryRun=False, maxWorkers=4):
+        current = set(m['entry']['id'] for m in self.getGroupMembers(groupId))
+
+        desired = {}
+        for m in desiredMembers:
+            memberId = m['id'] if isinstance(m, dict) else m
+            memberType = m.get('memberType') if isinstance(m, dict) else None
+            memberType = memberType or ('GROUP' if memberId.startswith('GROUP_') else 'PERSON')
+            if memberType == 'GROUP':
+                memberId = fullGroupId(memberId)
+            desired[memberId] = memberType
+
+        toAdd = sorted(memberId for memberId in desired if memberId not in current)
+        toRemove = sorted(memberId for memberId in current if memberId not in desired) if removeExtra else []
+        report = {"add": toAdd, "remove": toRemove, "unchanged": len(set(desired) & current), "dryRun": dryRun}
+
+        if not dryRun:
+            def apply(change):
+                action, memberId = change
+                if action == 'add':
+                    self.addGroupMember(groupId, memberId, desired[memberId])
+                else:
+                    self.removeGroupMember(groupId, memberId)
+
+            changes = [('add', memberId) for memberId in toAdd] + [('remove', memberId) for memberId in toRemove]
+            util.parallel_map(apply, changes, maxWorkers)
+
+        return report
+
     ######################################
     # nodes API
-    def getNodeById(self, nodeId):
+    # fields and include are lists, e.g. fields=['id'] or include=['permissions']
+    def getNodeById(self, nodeId, fields=None, include=None):
         url = self.api_prefix + '/nodes/' + nodeId
-        r = self._get(url)
+        r = self._get(url, projectionParams(fields, include))
         return r and r['entry']
 
-    def getNodeByPath(self, path):
+    def getNodeByPath(self, path, fields=None, include=None):
         path = path if path.startswith('Sites/') else 'Sites/' + path
-        url = self.api_prefix + '/nodes/-root-?relativePath=' + path
-        r = self._get(url)
+        url = self.api_prefix + '/nodes/-root-'
+        r = self._get(url, projectionParams(fields, include, {'relativePath': path}))
         return r and r['entry']
 
     def createFolder(self, parentId, folderName):
@@ -129,11 +340,136 @@ class AcsClient:
         r = self._post(url, json=data)
         return r and r['entry']
 
+    # create a folder path below Company Home, e.g. a bulk import targetPath,
+    # with any missing intermediate folders in one request
+    def createFolderPath(self, path):
+        names = [name for name in path.strip('/').split('/') if name]
+        if names and names[0] == 'Company Home':
+            names = names[1:]
+        url = self.api_prefix + '/nodes/-root-/children'
+        data = {"name": names[-1], "nodeType": "cm:folder", "relativePath": '/'.join(names[:-1])}
+        try:
+            r = self._post(url, json=data)
+        except requests.exceptions.HTTPError as ex:
+            if ex.response.status_code != requests.codes.conflict:
+                raise
+            # else the folder exists
+            r = self._get(self.api_prefix + '/nodes/-root-',
+                          projectionParams(['id', 'name'], params={'relativePath': '/'.join(names)}))
+        return r and r['entry']
+
+    # iterate the children of a node page by page, e.g. fields=['id', 'name']
+    # relativePath lists the children of a folder below parentId, e.g. parentId='-root-'
+    # and relativePath='Sites/mysite/documentLibrary'
+    def getChildren(self, parentId, fields=None, include=None, where=None, relativePath=None):
+        url = self.api_prefix + '/nodes/' + parentId + '/children'
+        params = {}
+        if where:
+            params['where'] = where
+        if relativePath:
+            params['relativePath'] = relativePath
+        return self._getPaged(url, projectionParams(fields, include, params))
+
+    # one page of the children of a node: {'entries': [...], 'pagination': {...}}, or None.
+    # pagination.totalItems allows the remaining pages to be requested at once.
+    def getChildrenPage(self, parentId, skipCount=0, maxItems=None, fields=None, include=None, where=None):
+        url = self.api_prefix + '/nodes/' + parentId + '/children'
+        params = {'skipCount': skipCount, 'maxItems': maxItems or self.pageSize}
+        if where:
+            params['where'] = where
+        r = self._get(url, projectionParams(fields, include, params))
+        return r and r['list']
+
+    # map of child name to child entry, listed with one request per page
+    # included properties are also added to fields, which would leave them out otherwise
+    def getChildrenByName(self, parentId, fields=('id', 'name'), where=None, include=None):
+        fields = list(fields) + list(include or [])
+        return dict((c['entry']['name'], c['entry']) for c in self.getChildren(parentId, fields, include, where))
+
+    # make sure the named folders exist directly below parentId. the children are
+    # listed once and only the missing folders are created, maxWorkers at a time.
+    # returns (map of name to folder entry, list of created names). include, e.g.
+    # ['permissions'], is added to the entries of the existing folders.
+    def ensureFolders(self, parentId, names, maxWorkers=4, include=None):
+        existing = self.getChildrenByName(parentId, include=include)
+        missing = [name for name in names if name not in existing]
+
+        def create(name):
+            try:
+                return self.createFolder(parentId, name)
+            except requests.exceptions.HTTPError as ex:
+                if ex.response.status_code != requests.codes.conflict:
+                    raise
+                # else created since the children were listed
+                r = self._get(self.api_prefix + '/nodes/' + parentId,
+                              projectionParams(['id', 'name'], params={'relativePath': name}))
+                return r and r['entry']
+
+        for name, folder in zip(missing, util.parallel_map(create, missing, maxWorkers)):
+            existing[name] = folder
+
+        return dict((name, existing[name]) for name in names), missing
+
     def uploadContent(self, folderId, files):
         url = self.api_prefix + '/nodes/' + folderId + '/children'
         r = self._post(url, files=files)
         return r and r['entry']
 
+    # stream a file path or binary file-like object to the folder in chunks.
+    # fields are extra form fields, e.g. {'overwrite': 'true'}.
+    # callback(bytesSent, totalBytes) is called as the upload progresses.
+    def uploadContentStream(self, folderId, content, name=None, fields=None, callback=None,
+                            chunkSize=STREAM_CHUNK_SIZE):
+        url = self.api_prefix + '/nodes/' + folderId + '/children'
+        body = MultipartFileStream(content, name=name, fields=fields, chunkSize=chunkSize, callback=callback)
+        try:
+            r = self._post(url, data=body, headers={'Content-Type': body.contentType})
+        finally:
+            body.close()
+        return r and r['entry']
+
+    # stream the content of a node to dest, a file path or a binary file-like object.
+    # a path is written to '<dest>.part' first and renamed once complete.
+    # returns the number of bytes written, or None if the node does not exist.
+    def downloadContent(self, nodeId, dest, callback=None, chunkSize=STREAM_CHUNK_SIZE):
+        url = self.api_prefix + '/nodes/' + nodeId + '/content'
+        response = self.session.get(url, auth=self.auth, stream=True)
+        try:
+            if response.status_code == requests.codes.not_found:
+                return None
+            response.raise_for_status()
+
+            total = int(response.headers.get('Content-Length') or 0)
+            written = 0
+            out = dest if hasattr(dest, 'write') else open(dest + '.part', 'wb')
+            try:
+                for chunk in response.iter_content(chunk_size=chunkSize):
+                    out.write(chunk)
+                    written += len(chunk)
+                    if callback:
+                        callback(written, total)
+            except Exception:
+                # no partial download is left behind
+                if out is not dest:
+                    out.close()
+                    os.remove(dest + '.part')
+                raise
+            finally:
+                if out is not dest:
+                    out.close()
+
+            if out is not dest:
+                os.rename(dest + '.part', dest)
+            return written
+        finally:
+            response.close()
+
+    # isInheritanceEnabled, inherited and locallySet permissions of a node
+    def getPermissions(self, id):
+        url = self.api_prefix + '/nodes/' + id
+        r = self._get(url, projectionParams(['id', 'permissions'], ['permissions']))
+        return r and r['entry'].get('permissions')
+
     def setPermissions(self, id, permissions):
         url = self.api_prefix + '/nodes/' + id
         data = {"permissions": permissions}
@@ -147,6 +483,11 @@ class AcsClient:
         result = self._get(url)
         return result and result['data']
 
+    def getRule(self, folderId, ruleId):
+        url = self.web_script_api_prefix + '/node/workspace/SpacesStore/' + folderId + '/ruleset/rules/' + ruleId
+        result = self._get(url)
+        return result and result['data']
+
     def createRule(self, folderId, ruleData):
         url = self.web_script_api_prefix + '/node/workspace/SpacesStore/' + folderId + '/ruleset/rules'
         result = self._post(url, json=ruleData)
@@ -164,9 +505,9 @@ class AcsClient:
 
     ######################################
     # people API
-    def getUser(self, name):
+    def getUser(self, name, fields=None, include=None):
         url = self.api_prefix + '/people/' + name
-        result = self._get(url)
+        result = self._get(url, projectionParams(fields, include))
         return result and result['entry']
 
     # both firstName and email are required fields
@@ -185,15 +526,14 @@ class AcsClient:
         r = self._post(url, json=data)
         return r and r['entry']
 
-    def getSite(self, siteId):
+    def getSite(self, siteId, fields=None, include=None):
         url = self.api_prefix + '/sites/' + siteId
-        r = self._get(url)
+        r = self._get(url, projectionParams(fields, include))
         return r and r['entry']
 
-    def getSites(self):
+    def getSites(self, fields=None):
         url = self.api_prefix + '/sites'
-        r = self._get(url)
-        return r and r['list'] and r['list']['entries']
+        return list(self._getPaged(url, projectionParams(fields)))
 
     def addSiteUser(self, siteId, username, role='SiteConsumer'):
         url = self.api_prefix + '/sites/' + siteId + '/members'
@@ -206,10 +546,21 @@ class AcsClient:
         r = self._get(url)
         return r
 
+    # group memberships of a site, with one request
+    def getSiteGroups(self, siteId):
+        url = self.web_script_api_prefix + '/sites/' + siteId + '/memberships'
+        r = self._get(url, {'authorityType': 'GROUP'})
+        return [m for m in (r or []) if m['authority']['fullName'].startswith('GROUP_')]
+
     def addSiteGroup(self, siteId, group, role='SiteConsumer'):
         url = self.web_script_api_prefix + '/sites/' + siteId + '/memberships'
-        if not self.getGroup(group):
-            self.createGroup(group, group)
+        if not self.getGroup(group, fields=['id']):
+            try:
+                self.createGroup(group, group)
+            except requests.exceptions.HTTPError as ex:
+                if ex.response.status_code != requests.codes.conflict:
+                    raise
+                # else created meanwhile, e.g. for another site provisioned at the same time
         data = {"role": role, "group": {"fullName": fullGroupId(group)}}
         r = self._post(url, json=data)
         return r
@@ -252,7 +603,20 @@ class AcsClient:
         exception = r.find('./ErrorInformation/Exception')
 
 
-        return {"currentStatus": text_or_blank(currentStatus), "lastResult": text_or_blank(resultOfLastExecution), "durationInNS": text_or_blank(duration_in_ns), "nodesPerSecond": nodes_per_second, "exception": text_or_blank(exception)}
+        return {"currentStatus": text_or_blank(currentStatus), "lastResult": text_or_blank(resultOfLastExecution), "durationInNS": text_or_blank(duration_in_ns), "nodesPerSecond": nodes_per_second, "exception": text_or_blank(exception),
+                "totalNodesWritten": total_nodes_written,
+                "sourceStatistics": self._statistics(r.find('SourceStatistics')),
+                "targetStatistics": self._statistics(r.find('TargetStatistics'))}
+
+    # counters of a statistics element, e.g. {"ContentNodesCreated": 10, "ContentBytesWritten": 2048}
+    def _statistics(self, element):
+        stats = {}
+        for child in (element if element is not None else []):
+            try:
+                stats[child.tag] = int(child.text)
+            except (TypeError, ValueError):
+                pass
+        return stats
 
     def _calculate_total_nodes_written(self, response):
         def to_int_or_zero(element):
@@ -291,10 +655,10 @@ class AcsClient:
         r = self._post(url, json=data)
         return r and r['entry']
 
+    # all root categories, page by page
     def getRootRecordCategories(self):
         url = self.gs_api_prefix + '/file-plans/-filePlan-/categories'
-        r = self._get(url)
-        return r and r['list'] and r['list']['entries']
+        return list(self._getPaged(url))
 
     def createRootRecordCategory(self, name):
         url = self.gs_api_prefix + '/file-plans/-filePlan-/categories'
@@ -302,10 +666,10 @@ class AcsClient:
         r = self._post(url, json=data)
         return r and r['entry']
 
+    # all child categories and record folders, page by page
     def getRecordCategoriesAndFolders(self, parentId):
         url = self.gs_api_prefix + '/record-categories/' + parentId + '/children'
-        r = self._get(url)
-        return r and r['list'] and r['list']['entries']
+        return list(self._getPaged(url))
 
     def createRecordCategory(self, parentId, name):
         url = self.gs_api_prefix + '/record-categories/' + parentId + '/children'
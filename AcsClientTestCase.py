@@ -1,8 +1,13 @@
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
 import responses
 
 from AcsClient import AcsClient
+import util
 
 
 class AcsClientTestCase(unittest.TestCase):
@@ -36,6 +41,29 @@ class AcsClientTestCase(unittest.TestCase):
         self.assertTrue(ret)
         self.assertEqual(ret['id'], '12345678-ccdb-4a97-a823-9315ebea500a')
 
+    @responses.activate
+    def testGetNodeByPathWithFields(self):
+        url = 'http://localhost:8080/alfresco/api/-default-/public/alfresco/versions/1/nodes/-root-'
+        responses.add(responses.GET, url, json={'entry': {'id': '1234'}}, status=200)
+
+        ret = self.acsClient.getNodeByPath('mysite/documentLibrary/my folder', fields=['id'], include=['permissions'])
+        self.assertEqual(ret, {'id': '1234'})
+        self.assertEqual(responses.calls[0].request.params,
+                         {'relativePath': 'Sites/mysite/documentLibrary/my folder', 'fields': 'id',
+                          'include': 'permissions'})
+
+    @responses.activate
+    def testCreateFolderPath(self):
+        url = 'http://localhost:8080/alfresco/api/-default-/public/alfresco/versions/1/nodes/-root-'
+        responses.add(responses.POST, url + '/children', status=409)
+        responses.add(responses.GET, url, json={'entry': {'id': '1234', 'name': '2018'}}, status=200)
+
+        ret = self.acsClient.createFolderPath('/Company Home/Sites/mysite/documentLibrary/2018')
+        self.assertEqual(ret['id'], '1234')
+        self.assertEqual(json.loads(responses.calls[0].request.body),
+                         {'name': '2018', 'nodeType': 'cm:folder', 'relativePath': 'Sites/mysite/documentLibrary'})
+        self.assertEqual(responses.calls[1].request.params['relativePath'], 'Sites/mysite/documentLibrary/2018')
+
     @responses.activate
     def testGetSite(self):
         url = 'http://localhost:8080/alfresco/api/-default-/public/alfresco/versions/1/sites/mysite'
@@ -80,6 +108,161 @@ class AcsClientTestCase(unittest.TestCase):
         self.assertEqual(ret['role'], 'SiteConsumer')
         self.assertEqual(ret['authority']['shortName'], 'test_group')
 
+    @responses.activate
+    def testUploadContentStream(self):
+        url = 'http://localhost:8080/alfresco/api/-default-/public/alfresco/versions/1/nodes/folder1/children'
+        sent = {}
+
+        def callback(request):
+            sent['contentType'] = request.headers['Content-Type']
+            sent['contentLength'] = request.headers['Content-Length']
+            sent['body'] = request.body if isinstance(request.body, bytes) else b''.join(request.body)
+            return (201, {'Content-Type': 'application/json'}, '{"entry": {"id": "doc1", "name": "big.pdf"}}')
+
+        responses.add_callback(responses.POST, url, callback=callback)
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'big.pdf')
+            with open(path, 'wb') as f:
+                f.write(b'x' * 300000)
+
+            progress = []
+            ret = self.acsClient.uploadContentStream('folder1', path, fields={'overwrite': 'true'},
+                                                     callback=lambda done, total: progress.append((done, total)),
+                                                     chunkSize=65536)
+        finally:
+            shutil.rmtree(tmpdir)
+
+        self.assertEqual(ret['id'], 'doc1')
+        self.assertTrue(sent['contentType'].startswith('multipart/form-data; boundary='))
+        self.assertEqual(int(sent['contentLength']), len(sent['body']))
+        self.assertTrue(b'name="overwrite"\r\n\r\ntrue\r\n' in sent['body'])
+        self.assertTrue(b'filename="big.pdf"\r\nContent-Type: application/pdf\r\n\r\n' + b'x' * 300000 in sent['body'])
+        self.assertEqual(progress[-1], (len(sent['body']), len(sent['body'])))
+
+    @responses.activate
+    def testDownloadContent(self):
+        url = 'http://localhost:8080/alfresco/api/-default-/public/alfresco/versions/1/nodes/doc1/content'
+        responses.add(responses.GET, url, body=b'y' * 200000, status=200, content_type='application/pdf')
+        url = 'http://localhost:8080/alfresco/api/-default-/public/alfresco/versions/1/nodes/missing/content'
+        responses.add(responses.GET, url, status=404)
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            dest = os.path.join(tmpdir, 'doc1.pdf')
+            ret = self.acsClient.downloadContent('doc1', dest, chunkSize=65536)
+            self.assertEqual(ret, 200000)
+            self.assertEqual(os.path.getsize(dest), 200000)
+            self.assertFalse(os.path.exists(dest + '.part'))
+            self.assertEqual(self.acsClient.downloadContent('missing', os.path.join(tmpdir, 'missing')), None)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    @responses.activate
+    def testDownloadContentFailure(self):
+        url = 'http://localhost:8080/alfresco/api/-default-/public/alfresco/versions/1/nodes/doc1/content'
+        responses.add(responses.GET, url, body=b'y' * 200000, status=200, content_type='application/pdf')
+
+        def callback(written, total):
+            if written > 65536:
+                raise IOError('connection reset')
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            dest = os.path.join(tmpdir, 'doc1.pdf')
+            self.assertRaises(IOError, self.acsClient.downloadContent, 'doc1', dest, callback, 65536)
+            self.assertEqual(os.listdir(tmpdir), [])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    @responses.activate
+    def testSyncGroupMembers(self):
+        url = 'http://localhost:8080/alfresco/api/-default-/public/alfresco/versions/1/groups/GROUP_team/members'
+
+        def addResponses():
+            responses.add(responses.GET, url, status=200, json={'list': {
+                'pagination': {'count': 2, 'hasMoreItems': True, 'skipCount': 0, 'maxItems': 2},
+                'entries': [{'entry': {'id': 'alice', 'memberType': 'PERSON'}},
+                            {'entry': {'id': 'GROUP_old', 'memberType': 'GROUP'}}]}})
+            responses.add(responses.GET, url, status=200, json={'list': {
+                'pagination': {'count': 1, 'hasMoreItems': False, 'skipCount': 2, 'maxItems': 2},
+                'entries': [{'entry': {'id': 'bob', 'memberType': 'PERSON'}}]}})
+            responses.add(responses.POST, url, status=201, json={'entry': {'id': 'GROUP_new', 'memberType': 'GROUP'}})
+            responses.add(responses.DELETE, url + '/GROUP_old', status=204)
+
+        self.acsClient.pageSize = 2
+        addResponses()
+        report = self.acsClient.syncGroupMembers('team', ['alice', 'bob', 'GROUP_new'], dryRun=True)
+        self.assertEqual(report['add'], ['GROUP_new'])
+        self.assertEqual(report['remove'], ['GROUP_old'])
+        self.assertEqual(report['unchanged'], 2)
+        self.assertEqual(len(responses.calls), 2)
+        self.assertTrue('skipCount=2' in responses.calls[1].request.url)
+
+        responses.reset()
+        addResponses()
+        self.acsClient.syncGroupMembers('team', ['alice', 'bob', 'GROUP_new'])
+        methods = sorted(call.request.method for call in responses.calls)
+        self.assertEqual(methods, ['DELETE', 'GET', 'GET', 'POST'])
+
+    @responses.activate
+    def testGetBulkImportStatus(self):
+        url = 'http://localhost:8080/alfresco/s/bulkfsimport/status.xml'
+        xml = ('<BulkImportStatus><CurrentStatus>In Progress</CurrentStatus>'
+               '<DurationInNS>2000000000</DurationInNS>'
+               '<SourceStatistics><FilesScanned>40</FilesScanned></SourceStatistics>'
+               '<TargetStatistics><SpaceNodesCreated>5</SpaceNodesCreated>'
+               '<ContentNodesCreated>15</ContentNodesCreated><ContentBytesWritten>4096</ContentBytesWritten>'
+               '</TargetStatistics></BulkImportStatus>')
+        responses.add(responses.GET, url, body=xml, status=200, content_type='text/xml')
+
+        status = self.acsClient.getBulkImportStatus()
+        self.assertEqual(status['currentStatus'], 'In Progress')
+        self.assertEqual(status['totalNodesWritten'], 20)
+        self.assertEqual(float(status['nodesPerSecond']), 10.0)
+        self.assertEqual(status['sourceStatistics'], {'FilesScanned': 40})
+        self.assertEqual(status['targetStatistics']['ContentBytesWritten'], 4096)
+
+    def testGetConfig(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'acs.yml')
+            with open(path, 'w') as f:
+                f.write('default:\n  url: http://localhost:8080\n  user: admin\n'
+                        'prod:\n  url: https://acs.example.com\n')
+            conf = util.getConfig(path, 'prod')
+            self.assertEqual(conf, {'url': 'https://acs.example.com', 'user': 'admin'})
+            self.assertEqual(util.getConfig(path, 'dev')['url'], 'http://localhost:8080')
+
+            # the config is not cached unless asked for, as it holds the passwords
+            cacheFile = os.path.join(tmpdir, '.acs.yml.prod.cache.json')
+            self.assertFalse(os.path.exists(cacheFile))
+
+            # the merged config is cached on disk for the next run, until the content of the file changes
+            conf = util.getConfig(path, 'prod', cache=True)
+            self.assertTrue(os.path.isfile(cacheFile))
+            self.assertEqual(os.stat(cacheFile).st_mode & 0o077, 0)
+            conf['user'] = 'changed'
+            self.assertEqual(util.getConfig(path, 'prod', cache=True)['user'], 'admin')
+            st = os.stat(path)
+            with open(path, 'w') as f:
+                f.write('default:\n  url: http://localhost:8080\n  user: other-admin\n')
+            self.assertEqual(util.getConfig(path, 'prod', cache=True)['user'], 'other-admin')
+            # an edit that keeps the size and the mtime
+            with open(path, 'w') as f:
+                f.write('default:\n  url: http://localhost:8080\n  user: other-admio\n')
+            os.utime(path, (st.st_atime, st.st_mtime))
+            self.assertEqual(util.getConfig(path, 'prod', cache=True)['user'], 'other-admio')
+
+            # a config that json cannot hold as is is not cached
+            with open(path, 'w') as f:
+                f.write('default:\n  ports: {1: a}\n')
+            self.assertEqual(util.getConfig(path, 'test', cache=True), {'ports': {1: 'a'}})
+            self.assertFalse(os.path.exists(os.path.join(tmpdir, '.acs.yml.test.cache.json')))
+        finally:
+            shutil.rmtree(tmpdir)
+
 ###########################
 # main
 if __name__ == '__main__':
@@ -0,0 +1,217 @@
+# export of the documents below a repository folder, e.g. a site's
+# documentLibrary, into a bulk import source directory: the folder tree, the
+# content of every document, and a shadow metadata file
+# (<name>.metadata.properties.xml, as written by migrate.py) with its type,
+# aspects and properties, so that the export can be bulk imported elsewhere.
+#
+# the tree is listed as by AcsInventory (whose inventory is written as well),
+# and each page of documents is queued for a second pool of workers that stream
+# the content to disk while the listing goes on. the queue is bounded, so the
+# listing waits for the downloads rather than holding a large tree in memory.
+#
+# every document written is appended to a ledger (tab separated: id,
+# modifiedAt, size, path). an export run again with the same ledger skips the
+# documents that were not modified since, and whose file is still there.
+
+import logging
+import os
+import threading
+import time
+from xml.etree.ElementTree import Element, SubElement
+
+try:
+    from Queue import Queue
+except ImportError:  # python 3
+    from queue import Queue
+
+import util
+from AcsInventory import AcsInventory, LIST_FIELDS
+from BulkImportMonitor import METADATA_SUFFIX
+
+# properties maintained by the repository, not written to the metadata files
+EXCLUDED_PROPERTIES = set(['cm:versionLabel', 'cm:versionType', 'cm:autoVersion', 'cm:autoVersionOnUpdateProps',
+                           'cm:initialVersion', 'cm:lastThumbnailModification', 'cm:lockOwner', 'cm:lockType',
+                           'cm:lockLifetime', 'cm:expiryDate', 'cm:workingCopyOwner', 'cm:likesRatingSchemeCount',
+                           'cm:likesRatingSchemeTotal'])
+EXCLUDED_ASPECTS = set(['cm:auditable', 'cm:thumbnailModification', 'cm:lockable', 'cm:workingcopy',
+                        'cm:checkedOut', 'rn:renditioned', 'cm:likesRatingSchemeRollups'])
+# separator of multiple values in the metadata files, that of the bulk import unless it is configured otherwise.
+# the bulk import splits the values on it and has no escape for it
+MULTI_VALUED_SEPARATOR = ','
+
+
+# text of a property value in a metadata file; multiple values are joined by separator
+def _text(value, separator=MULTI_VALUED_SEPARATOR):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, list):
+        return separator.join(_text(v, separator) for v in value)
+    if isinstance(value, (int, float)):
+        return str(value)
+    return value
+
+
+# shadow metadata (properties element) of a node listed with include=properties,aspectNames.
+# a multi-valued property with a value containing separator would be split apart by the bulk import:
+# it is logged, and written all the same
+def nodeMetadata(entry, separator=MULTI_VALUED_SEPARATOR):
+    properties = Element('properties')
+
+    def add(key, value):
+        if value is None or value == '' or isinstance(value, dict):
+            return
+        if isinstance(value, list) and len(value) > 1 and [v for v in value if separator in _text(v, separator)]:
+            logging.warning('a value of ' + key + ' of ' + entry['name'] + " contains the separator '" +
+                            separator + "' of its multiple values, give another --separator")
+        SubElement(properties, 'entry', {'key': key}).text = _text(value, separator)
+
+    add('type', entry.get('nodeType'))
+    aspects = [a for a in entry.get('aspectNames') or [] if a not in EXCLUDED_ASPECTS and not a.startswith('sys:')]
+    if aspects:
+        add('aspects', aspects)
+    add('cm:name', entry['name'])
+    add('cm:created', entry.get('createdAt'))
+    add('cm:creator', (entry.get('createdByUser') or {}).get('id'))
+    add('cm:modified', entry.get('modifiedAt'))
+    add('cm:modifier', (entry.get('modifiedByUser') or {}).get('id'))
+    for key, value in sorted((entry.get('properties') or {}).items()):
+        if key not in EXCLUDED_PROPERTIES and not key.startswith('sys:'):
+            add(key, value)
+    return properties
+
+
+#############################################
+# documents exported by earlier runs
+class ExportLedger:
+    ######################################
+    # constructor
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.documents = {}
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) == 4 and fields[2].isdigit():  # not a line cut short by an interrupted run
+                        self.documents[fields[0]] = (fields[1], int(fields[2]), fields[3])
+        self.out = open(path, 'a')
+
+    # whether the document was exported to path, unchanged since, and its file is still there
+    def isExported(self, entry, path, dest):
+        previous = self.documents.get(entry['id'])
+        if not previous or previous[0] != entry.get('modifiedAt') or previous[2] != path:
+            return False
+        try:
+            return os.path.getsize(dest) == previous[1]
+        except OSError:
+            return False
+
+    def add(self, entry, path, size):
+        with self.lock:
+            self.out.write('\t'.join([entry['id'], entry.get('modifiedAt') or '', str(size), path]) + '\n')
+            self.out.flush()
+
+    def close(self):
+        self.out.close()
+
+
+#############################################
+class AcsExport(AcsInventory):
+    listFields = LIST_FIELDS + ['createdAt', 'modifiedAt', 'createdByUser', 'modifiedByUser', 'properties',
+                                'aspectNames']
+    listInclude = ['properties', 'aspectNames']
+
+    ######################################
+    # constructor
+    # output: directory the tree is exported into; ledger: optional ExportLedger;
+    # separator: separator of multiple values, that configured for the bulk import
+    def __init__(self, acsClient, output, workers=4, pageSize=None, downloadWorkers=8, ledger=None,
+                 separator=MULTI_VALUED_SEPARATOR):
+        AcsInventory.__init__(self, acsClient, workers, pageSize)
+        self.output = output
+        self.separator = separator
+        self.downloadWorkers = downloadWorkers
+        self.ledger = ledger
+        self.downloads = Queue(maxsize=downloadWorkers * 100)
+        self.stats.update({'downloaded': 0, 'downloadedBytes': 0, 'unchanged': 0, 'deleted': 0,
+                           'downloadErrors': 0})
+        self.failedDownloads = []
+
+    ######################################
+    # export the tree below rootId, write its inventory to the csv file inventoryFile and return the counts
+    def export(self, rootId, inventoryFile):
+        start = time.time()
+        util.make_dirs(self.output)
+        threads = [threading.Thread(target=self._download, name='export-' + str(i))
+                   for i in range(self.downloadWorkers)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        try:
+            self.crawl(rootId, inventoryFile)
+        finally:
+            for t in threads:
+                self.downloads.put(None)
+            for t in threads:
+                t.join()
+
+        seconds = time.time() - start
+        self.stats['seconds'] = round(seconds, 3)
+        self.stats['MBPerSecond'] = round(self.stats['downloadedBytes'] / 1048576.0 / seconds, 2) if seconds else 0
+        logging.info('exported ' + str(self.stats['downloaded']) + ' document(s), ' +
+                     str(self.stats['downloadedBytes']) + ' bytes (' + str(self.stats['MBPerSecond']) + ' MB/s), ' +
+                     str(self.stats['unchanged']) + ' unchanged, ' + str(self.stats['deleted']) +
+                     ' deleted meanwhile, in ' + str(self.stats['seconds']) + ' seconds' +
+                     (', ' + str(self.stats['downloadErrors']) + ' download(s) FAILED'
+                      if self.stats['downloadErrors'] else ''))
+        return self.stats
+
+    # write the folders and metadata of a page of children, and queue the content of its documents
+    def _listed(self, path, entries):
+        directory = os.path.join(self.output, *path.split('/')) if path else self.output
+        util.make_dirs(directory)
+        for entry in entries:
+            dest = os.path.join(directory, entry['name'])
+            childPath = path + '/' + entry['name'] if path else entry['name']
+            if entry.get('isFolder'):
+                util.make_dirs(dest)
+            elif self.ledger and self.ledger.isExported(entry, childPath, dest):
+                with self.lock:
+                    self.stats['unchanged'] += 1
+                continue
+            self._writeMetadata(dest + METADATA_SUFFIX, entry)
+            if not entry.get('isFolder'):
+                self.downloads.put((entry, childPath, dest))
+
+    def _writeMetadata(self, path, entry):
+        with open(path + '.tmp', 'wb') as f:
+            f.write(util.metadata_xml(nodeMetadata(entry, self.separator)))
+        os.rename(path + '.tmp', path)
+
+    def _download(self):
+        while True:
+            task = self.downloads.get()
+            if task is None:
+                return
+            entry, path, dest = task
+            try:
+                size = self.acsClient.downloadContent(entry['id'], dest)
+                if size is None:
+                    logging.warning('deleted during the export: ' + path)
+                    with self.lock:
+                        self.stats['deleted'] += 1
+                    continue
+                expected = (entry.get('content') or {}).get('sizeInBytes')
+                if expected is not None and size != expected:
+                    raise Exception(str(size) + ' bytes downloaded, ' + str(expected) + ' expected')
+                if self.ledger:
+                    self.ledger.add(entry, path, size)
+                with self.lock:
+                    self.stats['downloaded'] += 1
+                    self.stats['downloadedBytes'] += size
+            except Exception as ex:
+                logging.error('cannot export ' + path + ': ' + str(ex))
+                with self.lock:
+                    self.stats['downloadErrors'] += 1
+                    self.failedDownloads.append(path)
@@ -0,0 +1,234 @@
+# inventory of a repository folder tree, e.g. /Sites/mysite/documentLibrary
+# after a bulk import, and its reconciliation with what was migrated.
+#
+# the tree is crawled by a pool of workers sharing a queue of pages to list:
+# (folder, path, skipCount). the first page of a folder tells how many
+# children it has, and its remaining pages are queued at once, so that a
+# folder with 100k+ children is listed by all workers, one page each. only
+# the fields of the inventory are requested, and each page is written to the
+# inventory (csv) as it arrives, so memory does not grow with the size of a
+# folder.
+#
+# the inventory is compared with the bulk import source directories written by
+# migrate.py, or with its content manifest, by path relative to the crawled
+# folder: missing (not in the repository), extra (not migrated) and mismatched
+# (different size) documents.
+
+import csv
+import logging
+import os
+import posixpath
+import threading
+import time
+from xml.etree import ElementTree
+
+try:
+    from Queue import Queue
+except ImportError:  # python 3
+    from queue import Queue
+
+from BulkImportMonitor import METADATA_SUFFIX
+
+INVENTORY_FIELDS = ['path', 'name', 'id', 'type', 'size', 'mimeType']
+
+REPORT_FIELDS = ['status', 'path', 'expectedSize', 'size', 'id', 'source']
+
+# fields requested for the children of a folder
+LIST_FIELDS = ['id', 'name', 'nodeType', 'isFolder', 'content']
+
+
+#############################################
+class AcsInventory:
+    # fields and includes requested for the children of a folder
+    listFields = LIST_FIELDS
+    listInclude = None
+
+    ######################################
+    # constructor
+    def __init__(self, acsClient, workers=8, pageSize=None):
+        self.acsClient = acsClient
+        self.workers = workers
+        self.pageSize = pageSize or acsClient.pageSize
+        self.lock = threading.Lock()
+        self.stats = {'folders': 0, 'documents': 0, 'bytes': 0, 'pages': 0, 'errors': 0}
+        self.failed = []
+
+    ######################################
+    # write the inventory of the tree below rootId to the csv file out and return the counts
+    def crawl(self, rootId, out):
+        start = time.time()
+        tasks = Queue()
+        with open(out + '.tmp', 'w') as f:
+            writer = csv.writer(f)
+            writer.writerow(INVENTORY_FIELDS)
+
+            def work():
+                while True:
+                    task = tasks.get()
+                    try:
+                        if task is None:
+                            return
+                        self._listPage(task, tasks, writer)
+                    except Exception as ex:
+                        logging.error('cannot list ' + (task[1] or '/') + ' at ' + str(task[2]) + ': ' + str(ex))
+                        with self.lock:
+                            self.stats['errors'] += 1
+                            self.failed.append(task[1] or '/')
+                    finally:
+                        tasks.task_done()
+
+            threads = [threading.Thread(target=work, name='inventory-' + str(i)) for i in range(self.workers)]
+            for t in threads:
+                t.daemon = True
+                t.start()
+            tasks.put((rootId, '', 0))
+            tasks.join()
+            for t in threads:
+                tasks.put(None)
+            for t in threads:
+                t.join()
+        os.rename(out + '.tmp', out)
+
+        self.stats['seconds'] = round(time.time() - start, 3)
+        logging.info('inventory of ' + str(self.stats['documents']) + ' document(s) and ' + str(self.stats['folders']) +
+                     ' folder(s), ' + str(self.stats['bytes']) + ' bytes, in ' + str(self.stats['pages']) +
+                     ' page(s) and ' + str(self.stats['seconds']) + ' seconds' +
+                     (', ' + str(self.stats['errors']) + ' listing(s) FAILED' if self.stats['errors'] else ''))
+        return self.stats
+
+    # list one page of a folder, write its children and queue their listings
+    def _listPage(self, task, tasks, writer):
+        folderId, path, skipCount = task
+        page = self.acsClient.getChildrenPage(folderId, skipCount, self.pageSize, self.listFields, self.listInclude)
+        entries = [e['entry'] for e in (page or {}).get('entries', [])]
+        pagination = (page or {}).get('pagination') or {}
+
+        # the remaining pages of the folder, all at once when the total is known
+        if skipCount == 0 and entries and pagination.get('hasMoreItems'):
+            step = len(entries)
+            total = pagination.get('totalItems')
+            if total:
+                for s in range(step, total, step):
+                    tasks.put((folderId, path, s))
+            else:
+                tasks.put((folderId, path, step))
+        elif skipCount and entries and pagination.get('hasMoreItems') and not pagination.get('totalItems'):
+            tasks.put((folderId, path, skipCount + len(entries)))
+
+        rows = []
+        folders = documents = size = 0
+        for entry in entries:
+            childPath = path + '/' + entry['name'] if path else entry['name']
+            content = entry.get('content') or {}
+            if entry.get('isFolder'):
+                folders += 1
+                tasks.put((entry['id'], childPath, 0))
+            else:
+                documents += 1
+                size += content.get('sizeInBytes') or 0
+            rows.append([childPath, entry['name'], entry['id'], entry.get('nodeType', ''),
+                         '' if entry.get('isFolder') else content.get('sizeInBytes', 0), content.get('mimeType', '')])
+
+        with self.lock:
+            writer.writerows(rows)
+            self.stats['pages'] += 1
+            self.stats['folders'] += folders
+            self.stats['documents'] += documents
+            self.stats['bytes'] += size
+        self._listed(path, entries)
+
+    # called by a worker with the children of the folder at path, once they are written
+    def _listed(self, path, entries):
+        pass
+
+
+#############################################
+# expected documents: path relative to the imported folder -> (size, source).
+# the bulk import names a node with the cm:name of its shadow metadata file,
+# if there is one, and otherwise with the file name.
+
+def _shadowName(path):
+    try:
+        for entry in ElementTree.parse(path).getroot().findall('entry'):
+            if entry.get('key') == 'cm:name' and entry.text:
+                return entry.text
+    except (IOError, OSError, ElementTree.ParseError) as ex:
+        logging.warning('cannot read ' + path + ': ' + str(ex))
+    return None
+
+
+# content files below bulk import source directories (shadow metadata files
+# are not documents); the size of a broken link is None
+def expectedFromTrees(directories):
+    expected = {}
+    for directory in directories:
+        for dirpath, dirnames, filenames in os.walk(directory):
+            relDir = os.path.relpath(dirpath, directory)
+            shadows = set(f for f in filenames if f.endswith(METADATA_SUFFIX))
+            for f in filenames:
+                if f in shadows:
+                    continue
+                source = os.path.join(dirpath, f)
+                try:
+                    size = os.path.getsize(source)
+                except OSError:
+                    size = None
+                name = f
+                if f + METADATA_SUFFIX in shadows:
+                    name = _shadowName(source + METADATA_SUFFIX) or f
+                expected[name if relDir == '.' else relDir.replace(os.sep, '/') + '/' + name] = (size, source)
+    return expected
+
+
+# the documents of a content manifest (ContentManifest), whose output paths
+# start with the seqno, the directory imported; seqnos limits them to some sequences
+def expectedFromManifest(path, seqnos=None):
+    expected = {}
+    with open(path, 'r') as f:
+        for row in csv.DictReader(f):
+            if seqnos and row['seqno'] not in seqnos:
+                continue
+            name = row.get('name', os.path.basename(row['output']))
+            if not name:
+                continue  # not written by migrate.py
+            relPath = posixpath.join(posixpath.dirname(row['output'].split('/', 1)[1]), name)
+            expected[relPath] = (int(row['size']) if row['size'] else None, row['source'])
+    return expected
+
+
+#############################################
+# compare an inventory file with the expected documents, write the differences
+# to the csv file report and return the counts. the inventory is read as a stream;
+# only the expected documents are held in memory.
+def reconcile(inventoryFile, expected, report):
+    expected = dict(expected)
+    counts = {'expected': len(expected), 'matched': 0, 'missing': 0, 'extra': 0, 'mismatched': 0}
+    with open(report, 'w') as out:
+        writer = csv.DictWriter(out, REPORT_FIELDS)
+        writer.writeheader()
+        with open(inventoryFile, 'r') as f:
+            for row in csv.DictReader(f):
+                if row['size'] == '':
+                    continue  # folders have no size
+                size = int(row['size'])
+                if row['path'] not in expected:
+                    counts['extra'] += 1
+                    writer.writerow({'status': 'extra', 'path': row['path'], 'size': size, 'id': row['id']})
+                    continue
+                expectedSize, source = expected.pop(row['path'])
+                if expectedSize is not None and expectedSize != size:
+                    counts['mismatched'] += 1
+                    writer.writerow({'status': 'mismatched', 'path': row['path'], 'expectedSize': expectedSize,
+                                     'size': size, 'id': row['id'], 'source': source})
+                else:
+                    counts['matched'] += 1
+
+        for path in sorted(expected):
+            expectedSize, source = expected[path]
+            counts['missing'] += 1
+            writer.writerow({'status': 'missing', 'path': path, 'expectedSize': expectedSize, 'source': source})
+
+    logging.info('reconciliation: ' + str(counts['expected']) + ' expected, ' + str(counts['matched']) +
+                 ' matched, ' + str(counts['missing']) + ' missing, ' + str(counts['extra']) + ' extra, ' +
+                 str(counts['mismatched']) + ' mismatched')
+    return counts
@@ -0,0 +1,411 @@
+# plan and apply the provisioning of acs.py as a diff: the current state of
+# groups, admin members, sites, site memberships, folders and their
+# permissions, rules and file plan categories is read in bulk with paged
+# listings, compared with the configuration, and only the differences are
+# written. changes run in phases (e.g. a site before its folders, a folder
+# before its permissions); the changes of one phase run maxWorkers at a time.
+
+import hashlib
+import json
+import logging
+
+import util
+from AcsClient import fullGroupId, permissionsChanged
+
+ADMINISTRATORS = 'GROUP_ALFRESCO_ADMINISTRATORS'
+
+# phases of the changes
+GROUPS = 0        # root group
+AUTHORITIES = 1   # groups, app users, sites, rm site
+MEMBERSHIPS = 2   # group members, site roles, folders, root categories
+CONTENT = 3       # permissions, rules, child categories
+
+
+#############################################
+class Change:
+    def __init__(self, phase, action, target, func):
+        self.phase = phase
+        self.action = action
+        self.target = target
+        self.func = func
+
+    def __str__(self):
+        return self.action + ' ' + self.target
+
+
+# rules folder of a rules.yml entry, as syncFolderRules resolves it
+def ruleFolderPath(folder):
+    return folder if folder.find('/documentLibrary') >= 0 else folder + '/documentLibrary'
+
+
+# the locallySet permissions of folder roles, as acs.setFolderPermissions sets them
+def folderPermissions(roles):
+    locallySet = [{"authorityId": fullGroupId(r['group']), "name": r['role'], "accessStatus": "ALLOWED"}
+                  for r in roles or [] if 'role' in r and 'group' in r]
+    return {"isInheritanceEnabled": "false", "locallySet": locallySet} if locallySet else None
+
+
+# value reduced to the keys configured in like, recursively, with booleans and
+# 'true'/'false' in one form and lists of names (e.g. ruleType) sorted, so that
+# a rule read from the repository compares equal to its rules.yml entry
+def normalizeRule(value, like=None):
+    like = value if like is None else like
+    if isinstance(like, dict):
+        value = value if isinstance(value, dict) else {}
+        return dict((k, normalizeRule(value.get(k), v)) for k, v in like.items())
+    if isinstance(like, list):
+        if not isinstance(value, list) or len(value) != len(like):
+            return value
+        items = [normalizeRule(v, l) for v, l in zip(value, like)]
+        return sorted(items, key=str) if all(not isinstance(l, (dict, list)) for l in like) else items
+    if isinstance(value, bool) or str(value).lower() in ('true', 'false'):
+        return str(value).lower() == 'true'
+    return value
+
+
+# hash of a rule normalized to the keys configured in like
+def ruleDigest(rule, like=None):
+    text = json.dumps(normalizeRule(rule, like), sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+# whether an existing rule, a getRules summary, differs from its rules.yml
+# entry. the full rule is read with getRule only when the summary matches.
+def ruleChanged(acs, folderId, summary, rule):
+    configured = dict((k, v) for k, v in rule.items() if k in summary)
+    if ruleDigest(summary, configured) != ruleDigest(configured):
+        return True
+    return ruleDigest(acs.getRule(folderId, summary['id']), rule) != ruleDigest(rule)
+
+
+#############################################
+class AcsPlanner:
+    ######################################
+    # constructor
+    # conf: acs.yml stage config, rules: rules.yml, filePlan: filePlan.yml
+    def __init__(self, acs, conf, rules=None, filePlan=None, maxWorkers=4):
+        self.acs = acs
+        self.conf = conf or {}
+        self.rules = rules or []
+        self.filePlan = filePlan
+        self.maxWorkers = maxWorkers
+        self.state = None
+        # ids of nodes created while applying, for the changes of later phases
+        self.nodeIds = {}
+
+    ######################################
+    # read the current state
+    def gather(self):
+        acs = self.acs
+        conf = self.conf
+        state = {}
+        state['groups'] = set(g['entry']['id'] for g in acs.getGroups(fields=['id']))
+        state['admins'] = set(m['entry']['id'] for m in acs.getGroupMembers(ADMINISTRATORS))
+        appUsers = conf.get('adminAppUsers') or []
+        found = util.parallel_map(lambda u: acs.getUser(u['name'], fields=['id', 'capabilities']), appUsers,
+                                  self.maxWorkers)
+        state['users'] = set(u['name'] for u, f in zip(appUsers, found) if f)
+        # app users already admin, e.g. through a nested group, are not added to ADMINISTRATORS
+        state['adminUsers'] = set(u['name'] for u, f in zip(appUsers, found)
+                                  if f and (f.get('capabilities') or {}).get('isAdmin'))
+
+        state['sites'] = set(s['entry']['id'] for s in acs.getSites(fields=['id']))
+        existingSites = [site for site in conf.get('sites') or [] if site['id'] in state['sites']]
+
+        def siteState(site):
+            roles = dict((m['authority']['fullName'], m['role']) for m in acs.getSiteGroups(site['id']))
+            folders = {}
+            if site.get('folders'):
+                folders = dict((c['entry']['name'], c['entry']) for c in
+                               acs.getChildren('-root-', fields=['id', 'name', 'permissions'],
+                                               include=['permissions'], where='(isFolder=true)',
+                                               relativePath='Sites/' + site['id'] + '/documentLibrary'))
+            return roles, folders
+
+        state['siteGroups'] = {}
+        state['folders'] = {}
+        for site, (roles, folders) in zip(existingSites, util.parallel_map(siteState, existingSites,
+                                                                           self.maxWorkers)):
+            state['siteGroups'][site['id']] = roles
+            state['folders'][site['id']] = folders
+
+        state['rules'] = self._gatherRules(state)
+        state['filePlan'] = self._gatherFilePlan()
+        self.state = state
+        return state
+
+    # existing rules of each configured rules folder and the titles of those
+    # that differ from their configuration: {folder: (folderId, [rule], changed)}
+    def _gatherRules(self, state):
+        acs = self.acs
+        configured = self._folderRules()
+
+        def folderRules(folder):
+            siteId = ruleFolderPath(folder).split('/')[0]
+            if siteId not in state['sites']:
+                return None
+            node = acs.getNodeByPath(ruleFolderPath(folder), fields=['id'])
+            if not node:
+                return None
+            rules = acs.getRules(node['id']) or []
+            byTitle = dict((rule['title'], rule) for rule in configured[folder])
+            changed = set(r['title'] for r in rules
+                          if r['title'] in byTitle and ruleChanged(acs, node['id'], r, byTitle[r['title']]))
+            return node['id'], rules, changed
+
+        folders = sorted(configured)
+        return dict((f, r) for f, r in zip(folders, util.parallel_map(folderRules, folders, self.maxWorkers)) if r)
+
+    # rm site, its group roles and the existing category tree, one listing per existing category
+    def _gatherFilePlan(self):
+        if not self.filePlan:
+            return None
+        acs = self.acs
+        state = {'site': acs.getRmSite(), 'groups': {}, 'categories': {}}
+        if not state['site']:
+            return state
+        state['groups'] = dict((m['authority']['fullName'], m['role']) for m in acs.getSiteGroups('rm'))
+
+        # tree of {name: {'id': ..., 'nodeType': ..., 'children': {...}}} for the configured categories
+        def children(entries, configured):
+            tree = dict((c['entry']['name'], {'id': c['entry']['id'], 'nodeType': c['entry']['nodeType'],
+                                              'children': {}}) for c in entries or [])
+            pending = [(tree[c['name']], c['children']) for c in configured
+                       if c['name'] in tree and c.get('children') and c.get('nodeType') != 'recordFolder']
+            listings = util.parallel_map(lambda p: acs.getRecordCategoriesAndFolders(p[0]['id']), pending,
+                                         self.maxWorkers)
+            for (node, configuredChildren), entries in zip(pending, listings):
+                node['children'] = children(entries, configuredChildren)
+            return tree
+
+        state['categories'] = children(acs.getRootRecordCategories(), self.filePlan.get('categories') or [])
+        return state
+
+    def _folderRules(self):
+        folderRules = {}
+        for rule in self.rules:
+            for f in rule['folders']:
+                folderRules.setdefault(f, []).append(rule['rule'])
+        return folderRules
+
+    ######################################
+    # the changes that make the repository match the configuration
+    def plan(self):
+        if self.state is None:
+            self.gather()
+        changes = []
+        changes.extend(self._planGroups())
+        changes.extend(self._planSites())
+        changes.extend(self._planRules())
+        changes.extend(self._planFilePlan())
+        return sorted(changes, key=lambda c: c.phase)
+
+    def _planGroups(self):
+        acs = self.acs
+        conf = self.conf
+        state = self.state
+        changes = []
+        groups = set(state['groups'])
+
+        def createGroup(group, phase=AUTHORITIES):
+            if fullGroupId(group) not in groups:
+                groups.add(fullGroupId(group))
+                changes.append(Change(phase, 'create group', fullGroupId(group),
+                                      lambda: acs.createGroup(group, group)))
+
+        rootGroup = conf.get('rootGroup')
+        if rootGroup and fullGroupId(rootGroup) not in groups:
+            groups.add(fullGroupId(rootGroup))
+            changes.append(Change(GROUPS, 'create root group', fullGroupId(rootGroup),
+                                  lambda: acs.createRootGroup(rootGroup, rootGroup)))
+
+        adminMembers = []
+        if conf.get('adminGroup'):
+            createGroup(conf['adminGroup'])
+            adminMembers.append((fullGroupId(conf['adminGroup']), 'GROUP'))
+        for user in conf.get('adminAppUsers') or []:
+            if user['name'] not in state['users']:
+                changes.append(Change(AUTHORITIES, 'create app user', user['name'],
+                                      lambda user=user: acs.createAdminAppUser(user['name'], user['password'])))
+            if user['name'] not in state['adminUsers']:
+                adminMembers.append((user['name'], 'PERSON'))
+        for memberId, memberType in adminMembers:
+            if memberId not in state['admins']:
+                changes.append(Change(MEMBERSHIPS, 'add member', memberId + ' to ' + ADMINISTRATORS,
+                                      lambda m=memberId, t=memberType: acs.addGroupMember(ADMINISTRATORS, m, t)))
+
+        # groups of site and folder roles
+        roles = []
+        for site in conf.get('sites') or []:
+            roles.extend(site.get('roles') or [])
+            for folder in site.get('folders') or []:
+                roles.extend(folder.get('roles') or [])
+        if self.filePlan:
+            roles.extend(self.filePlan.get('roles') or [])
+        for r in roles:
+            if 'role' in r and 'group' in r:
+                createGroup(r['group'])
+        return changes
+
+    def _planSites(self):
+        acs = self.acs
+        state = self.state
+        changes = []
+        for site in self.conf.get('sites') or []:
+            siteId = site['id']
+            exists = siteId in state['sites']
+            if not exists:
+                changes.append(Change(AUTHORITIES, 'create site', siteId,
+                                      lambda site=site: acs.createSite(site['id'], site['title'],
+                                                                       site['description'])))
+            changes.extend(self._planSiteRoles(siteId, site.get('roles'), state['siteGroups'].get(siteId, {})))
+
+            folders = state['folders'].get(siteId, {})
+            for folder in site.get('folders') or []:
+                path = 'Sites/' + siteId + '/documentLibrary/' + folder['name']
+                existing = folders.get(folder['name'])
+                if existing:
+                    self.nodeIds[path] = existing['id']
+                else:
+                    changes.append(Change(MEMBERSHIPS, 'create folder', path,
+                                          lambda path=path: self._createFolder(path)))
+
+                permissions = folderPermissions(folder.get('roles'))
+                if permissions and (not existing or permissionsChanged(existing.get('permissions'), permissions)):
+                    changes.append(Change(CONTENT, 'set permissions', path,
+                                          lambda path=path, p=permissions: acs.setPermissions(self.nodeIds[path],
+                                                                                              p)))
+        return changes
+
+    def _planSiteRoles(self, siteId, roles, current):
+        changes = []
+        for r in roles or []:
+            if 'role' in r and 'group' in r and current.get(fullGroupId(r['group'])) != r['role']:
+                changes.append(Change(MEMBERSHIPS, 'add site role', r['group'] + ' as ' + r['role'] + ' to ' + siteId,
+                                      lambda r=r: self.acs.addSiteGroup(siteId, r['group'], r['role'])))
+        return changes
+
+    def _createFolder(self, path):
+        folder = self.acs.createFolderPath(path)
+        self.nodeIds[path] = folder['id']
+        return folder
+
+    def _planRules(self):
+        acs = self.acs
+        changes = []
+        for folder, rules in sorted(self._folderRules().items()):
+            path = ruleFolderPath(folder)
+            folderId, existingRules, changed = self.state['rules'].get(folder, (None, [], set()))
+            existing = dict((r['title'], r) for r in existingRules)
+            if folderId:
+                self.nodeIds['rules:' + path] = folderId
+
+            for rule in rules:
+                title = rule['title']
+                if title not in existing:
+                    changes.append(Change(CONTENT, 'create rule', '"' + title + '" in ' + path,
+                                          lambda path=path, rule=rule: acs.createRule(self._ruleFolderId(path),
+                                                                                      rule)))
+                elif title in changed:
+                    changes.append(Change(CONTENT, 'update rule', '"' + title + '" in ' + path,
+                                          lambda folderId=folderId, rule=rule, ruleId=existing[title]['id']:
+                                          acs.updateRule(folderId, ruleId, rule)))
+            titles = set(rule['title'] for rule in rules)
+            for title, rule in sorted(existing.items()):
+                if title not in titles:
+                    changes.append(Change(CONTENT, 'delete rule', '"' + title + '" from ' + path,
+                                          lambda folderId=folderId, ruleId=rule['id']:
+                                          acs.deleteRule(folderId, ruleId)))
+        return changes
+
+    # id of a rules folder, looked up when it did not exist at planning time
+    def _ruleFolderId(self, path):
+        key = 'rules:' + path
+        if key not in self.nodeIds:
+            node = self.acs.getNodeByPath(path, fields=['id'])
+            if not node:
+                raise Exception('rules folder ' + path + ' does not exist')
+            self.nodeIds[key] = node['id']
+        return self.nodeIds[key]
+
+    def _planFilePlan(self):
+        filePlan = self.filePlan
+        if not filePlan:
+            return []
+        acs = self.acs
+        state = self.state['filePlan']
+        changes = []
+        if not state['site']:
+            changes.append(Change(AUTHORITIES, 'create rm site', filePlan['title'],
+                                  lambda: acs.createRmSite(filePlan['title'], filePlan['description'],
+                                                           filePlan['compliance'])))
+        changes.extend(self._planSiteRoles('rm', filePlan.get('roles'), state['groups']))
+
+        for category in filePlan.get('categories') or []:
+            existing = state['categories'].get(category['name'])
+            if existing:
+                changes.extend(self._planCategories(existing, category.get('children') or []))
+            else:
+                changes.append(Change(MEMBERSHIPS, 'create category', category['name'] + self._size(category),
+                                      lambda c=category: self._createCategories(None, [c])))
+        return changes
+
+    def _planCategories(self, existing, children):
+        changes = []
+        if existing['nodeType'] == 'rma:recordFolder':
+            return changes
+        for child in children:
+            current = existing['children'].get(child['name'])
+            if current:
+                if child.get('nodeType') != 'recordFolder':
+                    changes.extend(self._planCategories(current, child.get('children') or []))
+            else:
+                changes.append(Change(CONTENT, 'create ' + ('record folder' if child.get('nodeType') == 'recordFolder'
+                                                            else 'category'), child['name'] + self._size(child),
+                                      lambda parentId=existing['id'], c=child: self._createCategories(parentId, [c])))
+        return changes
+
+    # number of nodes below a category created along with it
+    def _size(self, category):
+        def count(c):
+            return sum(1 + count(child) for child in c.get('children') or [])
+        n = count(category) if category.get('nodeType') != 'recordFolder' else 0
+        return ' (and ' + str(n) + ' below)' if n else ''
+
+    # create categories (and record folders) below parentId, or root categories
+    def _createCategories(self, parentId, categories):
+        acs = self.acs
+        for category in categories:
+            if parentId is None:
+                node = acs.createRootRecordCategory(category['name'])
+            elif category.get('nodeType') == 'recordFolder':
+                node = acs.createRecordFolder(parentId, category['name'])
+            else:
+                node = acs.createRecordCategory(parentId, category['name'])
+            if category.get('children') and category.get('nodeType') != 'recordFolder':
+                self._createCategories(node['id'], category['children'])
+
+    ######################################
+    # print the changes
+    def report(self, changes):
+        if not changes:
+            logging.info('no changes')
+        for change in changes:
+            logging.info('  ' + str(change))
+        logging.info(str(len(changes)) + ' change(s)')
+
+    # run the changes phase by phase. returns the changes that failed
+    def apply(self, changes):
+        failed = []
+        for phase in sorted(set(c.phase for c in changes)):
+            def run(change):
+                try:
+                    change.func()
+                    logging.info(str(change))
+                    return None
+                except Exception as ex:
+                    logging.error(str(change) + ' failed: ' + str(ex))
+                    return change
+            failed.extend(c for c in util.parallel_map(run, [c for c in changes if c.phase == phase],
+                                                       self.maxWorkers) if c)
+        return failed
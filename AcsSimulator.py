@@ -0,0 +1,957 @@
+#!/usr/bin/python2.7
+# In-memory stand-in for the Alfresco repository endpoints used by AcsClient,
+# served over localhost HTTP for load and regression testing.
+#
+# example:
+#   sim = AcsSimulator(latency=0.005, errorRate=0.0, pageSize=100).start()
+#   acs = AcsClient(sim.url, 'admin', 'admin')
+#   ...
+#   print(sim.requestCounts)
+#   sim.stop()
+#
+# or standalone: ./AcsSimulator.py --port 8080 --latency 0.01
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from xml.etree import ElementTree
+from xml.etree.ElementTree import Element, SubElement
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs, unquote
+except ImportError:  # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+    from urllib import unquote
+
+API_PREFIX = '/alfresco/api/-default-/public/alfresco/versions/1'
+GS_API_PREFIX = '/alfresco/api/-default-/public/gs/versions/1'
+WEB_SCRIPT_PREFIX = '/alfresco/s/api'
+BULK_IMPORT_PREFIX = '/alfresco/s/bulkfsimport'
+
+# node fields returned when no 'fields' parameter is given
+NODE_FIELDS = ['id', 'name', 'nodeType', 'isFolder', 'isFile', 'parentId', 'createdAt', 'modifiedAt',
+               'createdByUser', 'modifiedByUser', 'content']
+
+# TargetStatistics reported by bulkfsimport/status.xml
+TARGET_STATISTICS = ['SpaceNodesCreated', 'SpaceNodesReplaced', 'SpaceNodesSkipped', 'SpacePropertiesWritten',
+                     'ContentNodesCreated', 'ContentNodesReplaced', 'ContentNodesSkipped', 'ContentBytesWritten',
+                     'ContentPropertiesWritten', 'ContentVersionsCreated']
+
+METADATA_SUFFIX = '.metadata.properties.xml'
+
+
+class SimulatorError(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+        self.message = message
+
+
+def _now():
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000+0000', time.gmtime())
+
+
+def _boolValue(value):
+    return value if isinstance(value, bool) else str(value).lower() == 'true'
+
+
+#############################################
+class AcsSimulator:
+    ######################################
+    # constructor
+    # latency: seconds added to every request, or a (min, max) range
+    # errorRate: fraction of requests answered with errorStatus
+    # pageSize: upper bound for maxItems on paged collections
+    # importRate: nodes per second written by a simulated bulk import
+    def __init__(self, host='127.0.0.1', port=0, latency=0, errorRate=0.0, errorStatus=503, pageSize=1000,
+                 importRate=1000.0, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.errorRate = errorRate
+        self.errorStatus = errorStatus
+        self.pageSize = pageSize
+        self.importRate = importRate
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.concurrent = 0
+        self.server = None
+        self.thread = None
+        self.routes = self._routes()
+        self.reset()
+
+    ######################################
+    # state
+    def reset(self):
+        with self.lock:
+            self.nodes = {}
+            self.children = {}
+            self.groups = {}
+            self.groupMembers = {}
+            self.people = {}
+            self.sites = {}
+            self.siteMemberships = {}
+            self.rules = {}
+            self.rmSite = None
+            self.filePlanId = None
+            self.bulkImport = {'status': 'Idle', 'result': '', 'job': None, 'exception': '',
+                               'durationInNS': 0, 'statistics': dict((s, 0) for s in TARGET_STATISTICS)}
+
+            self.rootId = self._createNode(None, 'Company Home', 'cm:folder')['id']
+            self.sitesId = self._createNode(self.rootId, 'Sites', 'cm:folder')['id']
+            self.people['admin'] = {'id': 'admin', 'firstName': 'Administrator', 'email': 'admin@alfresco.com',
+                                    'enabled': True}
+            self.groups['GROUP_ALFRESCO_ADMINISTRATORS'] = {'id': 'GROUP_ALFRESCO_ADMINISTRATORS',
+                                                            'displayName': 'ALFRESCO_ADMINISTRATORS', 'isRoot': True}
+            self.groupMembers['GROUP_ALFRESCO_ADMINISTRATORS'] = {'admin': 'PERSON'}
+        self.resetStats()
+
+    def resetStats(self):
+        with self.lock:
+            self.requestCounts = {}
+            self.requestTotal = 0
+            self.errorTotal = 0
+            # connections opened by the clients, and the most requests served at a time
+            self.connectionTotal = 0
+            self.maxConcurrent = self.concurrent
+
+    ######################################
+    # server
+    @property
+    def url(self):
+        return 'http://' + self.host + ':' + str(self.server.server_address[1])
+
+    def start(self):
+        simulator = self
+
+        class Handler(_RequestHandler):
+            pass
+        Handler.simulator = simulator
+
+        self.server = _ThreadingHTTPServer((self.host, self.port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    ######################################
+    # request dispatch
+    def _routes(self):
+        routes = [
+            # groups
+            ('GET', API_PREFIX + '/groups', self.listGroups),
+            ('POST', API_PREFIX + '/groups', self.createGroup),
+            ('GET', API_PREFIX + '/groups/{id}', self.getGroup),
+            ('GET', API_PREFIX + '/groups/{id}/members', self.listGroupMembers),
+            ('POST', API_PREFIX + '/groups/{id}/members', self.addGroupMember),
+            ('DELETE', API_PREFIX + '/groups/{id}/members/{memberId}', self.removeGroupMember),
+            # nodes
+            ('GET', API_PREFIX + '/nodes/{id}', self.getNode),
+            ('PUT', API_PREFIX + '/nodes/{id}', self.updateNode),
+            ('GET', API_PREFIX + '/nodes/{id}/children', self.listChildren),
+            ('POST', API_PREFIX + '/nodes/{id}/children', self.createChild),
+            ('GET', API_PREFIX + '/nodes/{id}/content', self.getContent),
+            # people
+            ('POST', API_PREFIX + '/people', self.createPerson),
+            ('GET', API_PREFIX + '/people/{id}', self.getPerson),
+            # sites
+            ('GET', API_PREFIX + '/sites', self.listSites),
+            ('POST', API_PREFIX + '/sites', self.createSite),
+            ('GET', API_PREFIX + '/sites/{id}', self.getSite),
+            ('GET', API_PREFIX + '/sites/{id}/containers', self.listContainers),
+            ('GET', API_PREFIX + '/sites/{id}/containers/{containerId}', self.getContainer),
+            ('GET', API_PREFIX + '/sites/{id}/members', self.listSiteMembers),
+            ('POST', API_PREFIX + '/sites/{id}/members', self.addSiteMembers),
+            # records management
+            ('GET', GS_API_PREFIX + '/gs-sites/rm', self.getRmSite),
+            ('POST', GS_API_PREFIX + '/gs-sites', self.createRmSite),
+            ('GET', GS_API_PREFIX + '/file-plans/-filePlan-/categories', self.listRootCategories),
+            ('POST', GS_API_PREFIX + '/file-plans/-filePlan-/categories', self.createRootCategory),
+            ('GET', GS_API_PREFIX + '/record-categories/{id}/children', self.listCategoryChildren),
+            ('POST', GS_API_PREFIX + '/record-categories/{id}/children', self.createCategoryChild),
+            # web scripts
+            ('GET', WEB_SCRIPT_PREFIX + '/node/workspace/SpacesStore/{id}/ruleset/rules', self.listRules),
+            ('POST', WEB_SCRIPT_PREFIX + '/node/workspace/SpacesStore/{id}/ruleset/rules', self.createRule),
+            ('GET', WEB_SCRIPT_PREFIX + '/node/workspace/SpacesStore/{id}/ruleset/rules/{ruleId}', self.getRule),
+            ('PUT', WEB_SCRIPT_PREFIX + '/node/workspace/SpacesStore/{id}/ruleset/rules/{ruleId}', self.updateRule),
+            ('DELETE', WEB_SCRIPT_PREFIX + '/node/workspace/SpacesStore/{id}/ruleset/rules/{ruleId}',
+             self.deleteRule),
+            ('GET', WEB_SCRIPT_PREFIX + '/sites/{id}/memberships', self.listSiteMemberships),
+            ('POST', WEB_SCRIPT_PREFIX + '/sites/{id}/memberships', self.addSiteMembership),
+            ('GET', WEB_SCRIPT_PREFIX + '/sites/{id}/memberships/{authority}', self.getSiteMembership),
+            # bulk import
+            ('POST', BULK_IMPORT_PREFIX + '/initiate', self.initiateBulkImport),
+            ('GET', BULK_IMPORT_PREFIX + '/status.xml', self.getBulkImportStatus),
+        ]
+        compiled = []
+        for method, template, handler in routes:
+            pattern = re.escape(template).replace('\\{', '{').replace('\\}', '}')
+            pattern = re.sub('{(\\w+)}', '(?P<\\1>[^/]+)', pattern)
+            label = method + ' ' + template.split('/versions/1')[-1].replace('/alfresco/s', '')
+            compiled.append((method, re.compile('^' + pattern + '$'), handler, label))
+        return compiled
+
+    # returns (status, contentType, body) for one request
+    def dispatch(self, method, path, query, headers, body):
+        with self.lock:
+            self.concurrent += 1
+            self.maxConcurrent = max(self.maxConcurrent, self.concurrent)
+        try:
+            return self._dispatch(method, path, query, headers, body)
+        finally:
+            with self.lock:
+                self.concurrent -= 1
+
+    def _dispatch(self, method, path, query, headers, body):
+        for routeMethod, pattern, handler, label in self.routes:
+            match = pattern.match(path)
+            if match and routeMethod == method:
+                break
+        else:
+            label = method + ' <unknown>'
+            handler = None
+
+        with self.lock:
+            self.requestTotal += 1
+            self.requestCounts[label] = self.requestCounts.get(label, 0) + 1
+
+        delay = self.latency
+        if isinstance(delay, (tuple, list)):
+            delay = self.random.uniform(delay[0], delay[1])
+        if delay:
+            time.sleep(delay)
+
+        if handler is None:
+            return self._error(404, 'no simulated endpoint for ' + method + ' ' + path)
+
+        if self.errorRate and self.random.random() < self.errorRate:
+            with self.lock:
+                self.errorTotal += 1
+            return self._error(self.errorStatus, 'simulated error')
+
+        params = dict((k, v[-1]) for k, v in parse_qs(query, keep_blank_values=True).items())
+        pathArgs = dict((k, unquote(v)) for k, v in match.groupdict().items())
+        try:
+            with self.lock:
+                result = handler(params=params, headers=headers, body=body, **pathArgs)
+        except SimulatorError as ex:
+            return self._error(ex.status, ex.message)
+
+        if result is None:
+            return 204, None, b''
+        status, payload = result if isinstance(result, tuple) else (200, result)
+        if isinstance(payload, Element):
+            return status, 'text/xml;charset=UTF-8', ElementTree.tostring(payload)
+        if isinstance(payload, _Content):
+            return status, payload.mimeType, payload.read()
+        return status, 'application/json;charset=UTF-8', json.dumps(payload).encode('utf-8')
+
+    def _error(self, status, message):
+        body = {"error": {"statusCode": status, "briefSummary": message}}
+        return status, 'application/json;charset=UTF-8', json.dumps(body).encode('utf-8')
+
+    ######################################
+    # helpers
+    def _json(self, body):
+        try:
+            return json.loads(body.decode('utf-8')) if body else {}
+        except ValueError:
+            raise SimulatorError(400, 'invalid json')
+
+    def _page(self, entries, params):
+        skipCount = int(params.get('skipCount', 0))
+        maxItems = min(int(params.get('maxItems', 100)), self.pageSize)
+        page = entries[skipCount:skipCount + maxItems]
+        return {"list": {"pagination": {"count": len(page), "hasMoreItems": skipCount + len(page) < len(entries),
+                                        "totalItems": len(entries), "skipCount": skipCount, "maxItems": maxItems},
+                         "entries": [{"entry": e} for e in page]}}
+
+    def _project(self, entry, params):
+        fields = params.get('fields')
+        if not fields:
+            return entry
+        wanted = set(f.strip() for f in fields.split(','))
+        return dict((k, v) for k, v in entry.items() if k in wanted)
+
+    ######################################
+    # nodes
+    def _createNode(self, parentId, name, nodeType, properties=None, content=None):
+        if parentId is not None:
+            siblings = self.children.setdefault(parentId, {})
+            if name in siblings:
+                raise SimulatorError(409, 'duplicate child name not allowed: ' + name)
+        isFolder = content is None
+        node = {'id': str(uuid.uuid4()), 'name': name, 'nodeType': nodeType, 'isFolder': isFolder,
+                'isFile': not isFolder, 'parentId': parentId, 'createdAt': _now(), 'modifiedAt': _now(),
+                'createdByUser': {'id': 'admin', 'displayName': 'Administrator'},
+                'modifiedByUser': {'id': 'admin', 'displayName': 'Administrator'},
+                'properties': dict(properties or {}), 'aspectNames': ['cm:auditable'],
+                'permissions': {'isInheritanceEnabled': True, 'locallySet': []}}
+        if content is not None:
+            node['content'] = {'mimeType': content.mimeType, 'sizeInBytes': content.size, 'encoding': 'UTF-8'}
+            node['_content'] = content
+        self.nodes[node['id']] = node
+        if parentId is not None:
+            self.children[parentId][name] = node['id']
+        return node
+
+    def _resolveNode(self, nodeId, relativePath=None):
+        if nodeId == '-root-':
+            nodeId = self.rootId
+        node = self.nodes.get(nodeId)
+        if node is None:
+            raise SimulatorError(404, 'node ' + nodeId + ' not found')
+        for name in (relativePath or '').strip('/').split('/'):
+            if name:
+                childId = self.children.get(node['id'], {}).get(name)
+                if childId is None:
+                    raise SimulatorError(404, 'path ' + relativePath + ' not found')
+                node = self.nodes[childId]
+        return node
+
+    def _resolvePath(self, path):
+        path = path.strip('/')
+        if path.startswith('Company Home'):
+            path = path[len('Company Home'):]
+        return self._resolveNode(self.rootId, path)
+
+    def _ensureFolderPath(self, parent, relativePath):
+        for name in (relativePath or '').strip('/').split('/'):
+            if name:
+                childId = self.children.get(parent['id'], {}).get(name)
+                parent = self.nodes[childId] if childId else self._createNode(parent['id'], name, 'cm:folder')
+        return parent
+
+    def _nodeEntry(self, node, params, defaultIncludes=()):
+        include = set(defaultIncludes)
+        include.update(i.strip() for i in params.get('include', '').split(',') if i.strip())
+        entry = dict((k, node[k]) for k in NODE_FIELDS if k in node)
+        if 'properties' in include:
+            entry['properties'] = node['properties']
+        if 'aspectNames' in include:
+            entry['aspectNames'] = node['aspectNames']
+        if 'permissions' in include:
+            perms = node['permissions']
+            entry['permissions'] = {'isInheritanceEnabled': perms['isInheritanceEnabled'],
+                                    'locallySet': perms['locallySet'], 'inherited': [],
+                                    'settable': ['Contributor', 'Collaborator', 'Coordinator', 'Editor',
+                                                 'Consumer']}
+        if 'path' in include:
+            entry['path'] = {'name': self._pathOf(node)}
+        return self._project(entry, params)
+
+    def _pathOf(self, node):
+        names = []
+        parentId = node['parentId']
+        while parentId:
+            parent = self.nodes[parentId]
+            names.insert(0, parent['name'])
+            parentId = parent['parentId']
+        return '/' + '/'.join(names)
+
+    def getNode(self, id, params, **kwargs):
+        node = self._resolveNode(id, params.get('relativePath'))
+        return {"entry": self._nodeEntry(node, params, ('properties', 'aspectNames'))}
+
+    def updateNode(self, id, params, body, **kwargs):
+        node = self._resolveNode(id)
+        data = self._json(body)
+        if 'name' in data:
+            node['name'] = data['name']
+        if 'properties' in data:
+            node['properties'].update(data['properties'])
+        if 'permissions' in data:
+            perms = data['permissions']
+            if 'isInheritanceEnabled' in perms:
+                node['permissions']['isInheritanceEnabled'] = _boolValue(perms['isInheritanceEnabled'])
+            if 'locallySet' in perms:
+                node['permissions']['locallySet'] = [
+                    {'authorityId': p['authorityId'], 'name': p['name'],
+                     'accessStatus': p.get('accessStatus', 'ALLOWED')} for p in perms['locallySet']]
+        node['modifiedAt'] = _now()
+        return {"entry": self._nodeEntry(node, params, ('properties', 'aspectNames'))}
+
+    def listChildren(self, id, params, **kwargs):
+        parent = self._resolveNode(id, params.get('relativePath'))
+        children = [self.nodes[c] for c in self.children.get(parent['id'], {}).values()]
+        where = params.get('where', '')
+        if 'isFolder=true' in where:
+            children = [c for c in children if c['isFolder']]
+        elif 'isFile=true' in where:
+            children = [c for c in children if c['isFile']]
+        children.sort(key=lambda c: (not c['isFolder'], c['name']))
+        page = self._page(children, params)
+        for e in page['list']['entries']:
+            e['entry'] = self._nodeEntry(e['entry'], params)
+        return page
+
+    def createChild(self, id, params, headers, body, **kwargs):
+        parent = self._resolveNode(id)
+        contentType = headers.get('Content-Type', '')
+        if contentType.startswith('multipart/form-data'):
+            fields, files = _parseMultipart(contentType, body)
+            filename, data = files.get('filedata', (None, b''))
+            name = fields.get('name') or filename
+            parent = self._ensureFolderPath(parent, fields.get('relativePath'))
+            existingId = self.children.get(parent['id'], {}).get(name)
+            content = _Content(data=data, name=name)
+            if existingId and _boolValue(fields.get('overwrite', 'false')):
+                node = self.nodes[existingId]
+                node['_content'] = content
+                node['content'] = {'mimeType': content.mimeType, 'sizeInBytes': content.size, 'encoding': 'UTF-8'}
+            else:
+                node = self._createNode(parent['id'], name, fields.get('nodeType', 'cm:content'), content=content)
+        else:
+            data = self._json(body)
+            parent = self._ensureFolderPath(parent, data.get('relativePath'))
+            node = self._createNode(parent['id'], data['name'], data.get('nodeType', 'cm:folder'),
+                                    data.get('properties'))
+        return 201, {"entry": self._nodeEntry(node, params, ('properties', 'aspectNames'))}
+
+    def getContent(self, id, **kwargs):
+        node = self._resolveNode(id)
+        if '_content' not in node:
+            raise SimulatorError(400, 'node ' + id + ' has no content')
+        return node['_content']
+
+    ######################################
+    # groups
+    def _isMember(self, authorityId, groupId, seen=None):
+        seen = seen or set()
+        members = self.groupMembers.get(groupId, {})
+        if authorityId in members:
+            return True
+        for memberId, memberType in members.items():
+            if memberType == 'GROUP' and memberId not in seen:
+                seen.add(memberId)
+                if self._isMember(authorityId, memberId, seen):
+                    return True
+        return False
+
+    def _groupId(self, id):
+        return id if id.startswith('GROUP_') else 'GROUP_' + id
+
+    def listGroups(self, params, **kwargs):
+        return self._page([self.groups[g] for g in sorted(self.groups)], params)
+
+    def createGroup(self, params, body, **kwargs):
+        data = self._json(body)
+        groupId = self._groupId(data['id'])
+        if groupId in self.groups:
+            raise SimulatorError(409, 'group ' + groupId + ' already exists')
+        parentIds = data.get('parentIds') or []
+        for parentId in parentIds:
+            if parentId not in self.groups:
+                raise SimulatorError(404, 'parent group ' + parentId + ' not found')
+        self.groups[groupId] = {'id': groupId, 'displayName': data.get('displayName', groupId),
+                                'isRoot': not parentIds}
+        self.groupMembers[groupId] = {}
+        for parentId in parentIds:
+            self.groupMembers[parentId][groupId] = 'GROUP'
+        return 201, {"entry": self.groups[groupId]}
+
+    def getGroup(self, id, params, **kwargs):
+        group = self.groups.get(self._groupId(id))
+        if group is None:
+            raise SimulatorError(404, 'group ' + id + ' not found')
+        return {"entry": self._project(group, params)}
+
+    def listGroupMembers(self, id, params, **kwargs):
+        groupId = self._groupId(id)
+        if groupId not in self.groups:
+            raise SimulatorError(404, 'group ' + id + ' not found')
+        members = sorted(self.groupMembers[groupId].items())
+        return self._page([{'id': m, 'memberType': t, 'displayName': m} for m, t in members], params)
+
+    def addGroupMember(self, id, body, **kwargs):
+        groupId = self._groupId(id)
+        data = self._json(body)
+        if groupId not in self.groups:
+            raise SimulatorError(404, 'group ' + id + ' not found')
+        memberId = data['id']
+        if memberId in self.groupMembers[groupId]:
+            raise SimulatorError(409, memberId + ' is already a member of ' + groupId)
+        known = self.groups if data.get('memberType') == 'GROUP' else self.people
+        if memberId not in known:
+            raise SimulatorError(404, 'authority ' + memberId + ' not found')
+        self.groupMembers[groupId][memberId] = data.get('memberType', 'PERSON')
+        return 201, {"entry": {'id': memberId, 'memberType': data.get('memberType', 'PERSON')}}
+
+    def removeGroupMember(self, id, memberId, **kwargs):
+        members = self.groupMembers.get(self._groupId(id), {})
+        if memberId not in members:
+            raise SimulatorError(404, memberId + ' is not a member of ' + id)
+        del members[memberId]
+        return None
+
+    ######################################
+    # people
+    def _personEntry(self, person, params):
+        entry = dict(person)
+        entry['capabilities'] = {'isAdmin': self._isMember(person['id'], 'GROUP_ALFRESCO_ADMINISTRATORS'),
+                                 'isGuest': False, 'isMutable': True}
+        return self._project(entry, params)
+
+    def createPerson(self, params, body, **kwargs):
+        data = self._json(body)
+        if not data.get('firstName') or not data.get('email'):
+            raise SimulatorError(400, 'firstName and email are required')
+        if data['id'] in self.people:
+            raise SimulatorError(409, 'person ' + data['id'] + ' already exists')
+        person = dict((k, v) for k, v in data.items() if k != 'password')
+        person['enabled'] = True
+        self.people[data['id']] = person
+        return 201, {"entry": self._personEntry(person, params)}
+
+    def getPerson(self, id, params, **kwargs):
+        if id not in self.people:
+            raise SimulatorError(404, 'person ' + id + ' not found')
+        return {"entry": self._personEntry(self.people[id], params)}
+
+    ######################################
+    # sites
+    def _createSite(self, siteId, title, description, visibility, preset='site-dashboard'):
+        if siteId in self.sites:
+            raise SimulatorError(409, 'site ' + siteId + ' already exists')
+        siteNode = self._createNode(self.sitesId, siteId, 'st:site')
+        docLib = self._createNode(siteNode['id'], 'documentLibrary', 'cm:folder')
+        site = {'id': siteId, 'guid': siteNode['id'], 'title': title, 'description': description,
+                'visibility': visibility, 'preset': preset, 'role': 'SiteManager'}
+        self.sites[siteId] = {'entry': site, 'containers': {'documentLibrary': docLib['id']}}
+        self.siteMemberships[siteId] = {'admin': 'SiteManager'}
+        return site
+
+    def _site(self, id):
+        if id not in self.sites:
+            raise SimulatorError(404, 'site ' + id + ' not found')
+        return self.sites[id]
+
+    def listSites(self, params, **kwargs):
+        return self._page([self._project(self.sites[s]['entry'], params) for s in sorted(self.sites)], params)
+
+    def createSite(self, params, body, **kwargs):
+        data = self._json(body)
+        site = self._createSite(data['id'], data.get('title', data['id']), data.get('description', ''),
+                                data.get('visibility', 'PUBLIC'))
+        return 201, {"entry": site}
+
+    def getSite(self, id, params, **kwargs):
+        return {"entry": self._project(self._site(id)['entry'], params)}
+
+    def listContainers(self, id, params, **kwargs):
+        containers = self._site(id)['containers']
+        return self._page([{'id': c, 'folderId': n} for c, n in sorted(containers.items())], params)
+
+    def getContainer(self, id, containerId, params, **kwargs):
+        containers = self._site(id)['containers']
+        if containerId not in containers:
+            raise SimulatorError(404, 'container ' + containerId + ' not found')
+        return {"entry": {'id': containers[containerId], 'folderId': containerId}}
+
+    def listSiteMembers(self, id, params, **kwargs):
+        self._site(id)
+        members = [{'id': a, 'role': r, 'person': {'id': a}}
+                   for a, r in sorted(self.siteMemberships[id].items()) if not a.startswith('GROUP_')]
+        return self._page(members, params)
+
+    def addSiteMembers(self, id, params, body, **kwargs):
+        self._site(id)
+        data = self._json(body)
+        added = []
+        for member in (data if isinstance(data, list) else [data]):
+            if member['id'] not in self.people:
+                raise SimulatorError(404, 'person ' + member['id'] + ' not found')
+            self.siteMemberships[id][member['id']] = member.get('role', 'SiteConsumer')
+            added.append({'id': member['id'], 'role': self.siteMemberships[id][member['id']]})
+        return 201, ({"entry": added[0]} if len(added) == 1 else self._page(added, {}))
+
+    ######################################
+    # site memberships web script
+    def _membership(self, siteId, authority):
+        role = self.siteMemberships[siteId][authority]
+        isGroup = authority.startswith('GROUP_')
+        shortName = authority[len('GROUP_'):] if isGroup else authority
+        return {'url': WEB_SCRIPT_PREFIX + '/sites/' + siteId + '/memberships/' + authority, 'role': role,
+                'authority': {'fullName': authority, 'authorityType': 'GROUP' if isGroup else 'USER',
+                              'shortName': shortName, 'displayName': shortName}}
+
+    def listSiteMemberships(self, id, **kwargs):
+        self._site(id)
+        return [self._membership(id, a) for a in sorted(self.siteMemberships[id])]
+
+    def getSiteMembership(self, id, authority, **kwargs):
+        self._site(id)
+        if authority not in self.siteMemberships[id]:
+            raise SimulatorError(404, authority + ' is not a member of site ' + id)
+        return self._membership(id, authority)
+
+    def addSiteMembership(self, id, body, **kwargs):
+        self._site(id)
+        data = self._json(body)
+        if 'group' in data:
+            authority = data['group']['fullName']
+            if authority not in self.groups:
+                raise SimulatorError(404, 'group ' + authority + ' not found')
+        else:
+            authority = data['person']['userName']
+            if authority not in self.people:
+                raise SimulatorError(404, 'person ' + authority + ' not found')
+        self.siteMemberships[id][authority] = data['role']
+        return self._membership(id, authority)
+
+    ######################################
+    # rules web script
+    def _ruleSummary(self, folderId, rule):
+        summary = dict((k, rule[k]) for k in ('id', 'title', 'description', 'ruleType', 'disabled') if k in rule)
+        summary['url'] = WEB_SCRIPT_PREFIX + '/node/workspace/SpacesStore/' + folderId + '/ruleset/rules/' + rule['id']
+        return summary
+
+    def _folderRules(self, folderId):
+        self._resolveNode(folderId)
+        return self.rules.setdefault(folderId, [])
+
+    def _findRule(self, folderId, ruleId):
+        for rule in self._folderRules(folderId):
+            if rule['id'] == ruleId:
+                return rule
+        raise SimulatorError(404, 'rule ' + ruleId + ' not found')
+
+    def listRules(self, id, **kwargs):
+        return {"data": [self._ruleSummary(id, r) for r in self._folderRules(id)]}
+
+    def getRule(self, id, ruleId, **kwargs):
+        rule = dict(self._findRule(id, ruleId))
+        rule['owningNode'] = {'nodeRef': 'workspace://SpacesStore/' + id, 'name': self.nodes[id]['name']}
+        return {"data": rule}
+
+    def createRule(self, id, body, **kwargs):
+        rule = self._json(body)
+        rule['id'] = str(uuid.uuid4())
+        self._folderRules(id).append(rule)
+        return {"data": self._ruleSummary(id, rule)}
+
+    def updateRule(self, id, ruleId, body, **kwargs):
+        rule = self._findRule(id, ruleId)
+        rule.clear()
+        rule.update(self._json(body))
+        rule['id'] = ruleId
+        return {"data": self._ruleSummary(id, rule)}
+
+    def deleteRule(self, id, ruleId, **kwargs):
+        rules = self._folderRules(id)
+        rules.remove(self._findRule(id, ruleId))
+        return {}
+
+    ######################################
+    # records management
+    def getRmSite(self, params, **kwargs):
+        if not self.rmSite:
+            raise SimulatorError(404, 'rm site not found')
+        return {"entry": self._project(self.rmSite, params)}
+
+    def createRmSite(self, body, **kwargs):
+        if self.rmSite:
+            raise SimulatorError(409, 'rm site already exists')
+        data = self._json(body)
+        site = self._createSite('rm', data.get('title', 'Records Management'), data.get('description', ''),
+                                'PUBLIC', 'rm-site-dashboard')
+        self.filePlanId = self._createNode(site['guid'], 'filePlan', 'rma:filePlan')['id']
+        self.rmSite = dict(site, compliance=data.get('compliance', 'STANDARD'))
+        return 201, {"entry": self.rmSite}
+
+    def _categoryEntry(self, node, params):
+        entry = dict((k, node[k]) for k in ('id', 'name', 'nodeType', 'parentId', 'createdAt', 'modifiedAt'))
+        return self._project(entry, params)
+
+    def _categoryChildren(self, parentId, params, nodeTypes):
+        children = [self.nodes[c] for c in self.children.get(parentId, {}).values()]
+        children = sorted([c for c in children if c['nodeType'] in nodeTypes], key=lambda c: c['name'])
+        page = self._page(children, params)
+        for e in page['list']['entries']:
+            e['entry'] = self._categoryEntry(e['entry'], params)
+        return page
+
+    def _filePlan(self):
+        if not self.filePlanId:
+            raise SimulatorError(404, 'file plan not found')
+        return self.filePlanId
+
+    def listRootCategories(self, params, **kwargs):
+        return self._categoryChildren(self._filePlan(), params, ('rma:recordCategory',))
+
+    def createRootCategory(self, params, body, **kwargs):
+        data = self._json(body)
+        node = self._createNode(self._filePlan(), data['name'], 'rma:recordCategory')
+        return 201, {"entry": self._categoryEntry(node, params)}
+
+    def listCategoryChildren(self, id, params, **kwargs):
+        self._category(id)
+        return self._categoryChildren(id, params, ('rma:recordCategory', 'rma:recordFolder'))
+
+    def createCategoryChild(self, id, params, body, **kwargs):
+        self._category(id)
+        data = self._json(body)
+        node = self._createNode(id, data['name'], data.get('nodeType', 'rma:recordCategory'))
+        return 201, {"entry": self._categoryEntry(node, params)}
+
+    def _category(self, id):
+        node = self._resolveNode(id)
+        if node['nodeType'] != 'rma:recordCategory':
+            raise SimulatorError(400, 'node ' + id + ' is not a record category')
+        return node
+
+    ######################################
+    # bulk import
+    # progress is derived from the time since the import started, so a job
+    # takes (number of nodes / importRate) seconds.
+    def initiateBulkImport(self, body, **kwargs):
+        if self.bulkImport['status'] != 'Idle':
+            raise SimulatorError(500, 'a bulk import is already in progress')
+
+        fields = dict((k, v[-1]) for k, v in parse_qs(body.decode('utf-8')).items())
+        sourceDirectory = fields.get('sourceDirectory', '')
+        targetPath = fields.get('targetPath', '')
+        job = {'sourceDirectory': sourceDirectory, 'targetPath': targetPath,
+               'batchSize': int(fields.get('batchSize', 20)), 'numThreads': int(fields.get('numThreads', 10)),
+               'replace': fields.get('existingFileMode', 'REPLACE') == 'REPLACE', 'start': time.time(),
+               'folders': [], 'files': [], 'error': ''}
+        try:
+            self._resolvePath(targetPath)
+            if not os.path.isdir(sourceDirectory):
+                raise SimulatorError(400, 'source directory ' + sourceDirectory + ' does not exist')
+            job['folders'], job['files'] = _scanSource(sourceDirectory)
+        except SimulatorError as ex:
+            job['error'] = ex.message
+
+        job['total'] = len(job['folders']) + len(job['files'])
+        job['bytes'] = sum(f[1] for f in job['files'])
+        self.bulkImport.update({'status': 'In Progress', 'result': '', 'job': job, 'exception': '',
+                                'durationInNS': 0, 'statistics': dict((s, 0) for s in TARGET_STATISTICS)})
+        return {"sourceDirectory": sourceDirectory, "targetPath": targetPath}
+
+    def _updateBulkImport(self):
+        state = self.bulkImport
+        job = state['job']
+        if state['status'] == 'Idle' or job is None:
+            return
+
+        elapsed = time.time() - job['start']
+        if self.importRate:
+            elapsed = min(elapsed, job['total'] / float(self.importRate))
+        done = min(job['total'], int(round(elapsed * self.importRate))) if self.importRate else job['total']
+        state['durationInNS'] = int(elapsed * 1000000000)
+        stats = state['statistics']
+        folders = min(done, len(job['folders']))
+        files = done - folders
+        stats['SpaceNodesCreated'] = folders
+        stats['ContentNodesCreated'] = files
+        stats['ContentBytesWritten'] = sum(f[1] for f in job['files'][:files])
+        stats['ContentPropertiesWritten'] = files
+
+        if job['error']:
+            state.update({'status': 'Idle', 'result': 'Failed', 'exception': job['error']})
+        elif done >= job['total']:
+            self._completeBulkImport(job)
+            state.update({'status': 'Idle', 'result': 'Succeeded'})
+
+    def _completeBulkImport(self, job):
+        target = self._resolvePath(job['targetPath'])
+        for relativePath in job['folders']:
+            self._ensureFolderPath(target, relativePath)
+        for relativePath, size, name in job['files']:
+            parent = self._ensureFolderPath(target, os.path.dirname(relativePath))
+            content = _Content(path=os.path.join(job['sourceDirectory'], relativePath), size=size, name=name)
+            existingId = self.children.get(parent['id'], {}).get(name)
+            if existingId and job['replace']:
+                self.nodes[existingId]['_content'] = content
+            elif not existingId:
+                self._createNode(parent['id'], name, 'cm:content', content=content)
+
+    def getBulkImportStatus(self, **kwargs):
+        self._updateBulkImport()
+        state = self.bulkImport
+        job = state['job'] or {}
+        root = Element('BulkImportStatus')
+        SubElement(root, 'CurrentStatus').text = state['status']
+        if state['result']:
+            SubElement(root, 'ResultOfLastExecution').text = state['result']
+        SubElement(root, 'SourceDirectory').text = job.get('sourceDirectory', '')
+        SubElement(root, 'TargetSpace').text = job.get('targetPath', '')
+        SubElement(root, 'BatchSize').text = str(job.get('batchSize', ''))
+        SubElement(root, 'NumThreads').text = str(job.get('numThreads', ''))
+        SubElement(root, 'DurationInNS').text = str(state['durationInNS'])
+        target = SubElement(root, 'TargetStatistics')
+        for name in TARGET_STATISTICS:
+            SubElement(target, name).text = str(state['statistics'][name])
+        if state['exception']:
+            SubElement(SubElement(root, 'ErrorInformation'), 'Exception').text = state['exception']
+        return root
+
+
+#############################################
+# content stored in memory, or read from a file on demand
+class _Content:
+    def __init__(self, data=None, path=None, size=None, name=''):
+        import mimetypes
+        self.data = data
+        self.path = path
+        self.size = len(data) if data is not None else size
+        self.mimeType = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    def read(self):
+        if self.data is not None:
+            return self.data
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+
+# list the folders and content files below a bulk import source directory.
+# a content file is named from cm:name in its shadow metadata file when present.
+def _scanSource(sourceDirectory):
+    folders = []
+    files = []
+    for dirpath, dirnames, filenames in os.walk(sourceDirectory, followlinks=True):
+        relativeDir = os.path.relpath(dirpath, sourceDirectory)
+        relativeDir = '' if relativeDir == '.' else relativeDir
+        for d in sorted(dirnames):
+            folders.append(os.path.join(relativeDir, d))
+        for f in sorted(filenames):
+            if f.endswith(METADATA_SUFFIX):
+                continue
+            path = os.path.join(dirpath, f)
+            name = f
+            if os.path.isfile(path + METADATA_SUFFIX):
+                try:
+                    for entry in ElementTree.parse(path + METADATA_SUFFIX).getroot().findall('entry'):
+                        if entry.get('key') == 'cm:name' and entry.text:
+                            name = entry.text
+                except ElementTree.ParseError:
+                    pass
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            files.append((os.path.join(relativeDir, f), size, name))
+    return folders, files
+
+
+def _parseMultipart(contentType, body):
+    boundary = contentType.split('boundary=')[-1].strip().strip('"').encode('utf-8')
+    fields = {}
+    files = {}
+    for part in body.split(b'--' + boundary):
+        if b'\r\n\r\n' not in part:
+            continue
+        head, data = part.split(b'\r\n\r\n', 1)
+        if data.endswith(b'\r\n'):
+            data = data[:-2]
+        disposition = head.decode('utf-8')
+        name = re.search('name="([^"]*)"', disposition)
+        filename = re.search('filename="([^"]*)"', disposition)
+        if not name:
+            continue
+        if filename:
+            files[name.group(1)] = (filename.group(1), data)
+        else:
+            fields[name.group(1)] = data.decode('utf-8')
+    return fields, files
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # headers and body are written separately
+    simulator = None
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.simulator.lock:
+            self.simulator.connectionTotal += 1
+
+    def _handle(self, method):
+        parsed = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        status, contentType, payload = self.simulator.dispatch(method, parsed.path, parsed.query, self.headers,
+                                                               body)
+        self.send_response(status)
+        if contentType:
+            self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if method != 'HEAD':
+            self.wfile.write(payload)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def log_message(self, format, *args):
+        logging.debug('simulator: ' + (format % args))
+
+
+#############################################
+# get commandline arguments
+def getArgs():
+    parser = argparse.ArgumentParser(description='Serve a simulated Alfresco repository on localhost')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to each request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail')
+    parser.add_argument('--page-size', type=int, default=1000, help='maximum maxItems per page')
+    parser.add_argument('--import-rate', type=float, default=1000.0, help='bulk import nodes per second')
+    return parser.parse_args()
+
+
+#############################################
+# main
+def main():
+    logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s', datefmt='%m/%d/%Y %H:%M:%S',
+                        level=logging.INFO)
+    args = getArgs()
+    simulator = AcsSimulator(args.host, args.port, args.latency, args.error_rate, pageSize=args.page_size,
+                             importRate=args.import_rate).start()
+    logging.info('simulated repository listening on ' + simulator.url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+#############################################
+if __name__ == "__main__":
+    main()
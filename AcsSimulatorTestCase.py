@@ -0,0 +1,436 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from xml.etree import ElementTree
+
+import requests
+
+import acs
+import AcsInventory
+import util
+from AcsClient import AcsClient, permissionsChanged
+from AcsExport import AcsExport, ExportLedger, nodeMetadata
+from AcsPlanner import AcsPlanner, ruleChanged
+from AcsSimulator import AcsSimulator
+from BulkImportMonitor import METADATA_SUFFIX, BulkImportMonitor
+from BulkImportScheduler import BulkImportScheduler
+from BulkImportTuner import BulkImportTuner
+
+
+class AcsSimulatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.simulator = AcsSimulator(pageSize=5).start()
+        self.acsClient = AcsClient(self.simulator.url, 'admin', 'admin')
+
+    def tearDown(self):
+        self.simulator.stop()
+        self.acsClient = None
+
+    def testSiteAndFolders(self):
+        self.assertEqual(self.acsClient.getSite('mysite'), None)
+        self.acsClient.createSite('mysite', 'My Site', 'My Site')
+        docLib = self.acsClient.getDocumentLibrary('mysite')
+        for i in range(12):
+            self.acsClient.createFolder(docLib['id'], 'folder' + str(i))
+
+        self.assertEqual(self.acsClient.getNodeByPath('mysite/documentLibrary/folder3')['name'], 'folder3')
+        self.assertRaises(requests.exceptions.HTTPError, self.acsClient.createFolder, docLib['id'], 'folder3')
+        self.assertEqual(self.simulator.requestCounts['POST /nodes/{id}/children'], 13)
+
+    def testEnsureFolders(self):
+        self.acsClient.createSite('mysite', 'My Site', 'My Site')
+        docLib = self.acsClient.getDocumentLibrary('mysite')
+        self.acsClient.createFolder(docLib['id'], 'existing')
+
+        self.simulator.resetStats()
+        names = ['existing'] + ['new' + str(i) for i in range(7)]
+        folders, created = self.acsClient.ensureFolders(docLib['id'], names)
+        self.assertEqual(sorted(folders), sorted(names))
+        self.assertEqual(created, names[1:])
+        self.assertEqual(self.simulator.requestCounts['GET /nodes/{id}/children'], 1)
+        self.assertEqual(self.simulator.requestCounts['POST /nodes/{id}/children'], 7)
+
+        self.simulator.resetStats()
+        folders, created = self.acsClient.ensureFolders(docLib['id'], names)
+        self.assertEqual(created, [])
+        self.assertEqual(self.simulator.requestTotal, 2)
+
+    def testPermissionsChanged(self):
+        self.acsClient.createSite('mysite', 'My Site', 'My Site')
+        docLib = self.acsClient.getDocumentLibrary('mysite')
+        folder = self.acsClient.createFolder(docLib['id'], 'folder1')
+        permissions = {'isInheritanceEnabled': 'false',
+                       'locallySet': [{'authorityId': 'GROUP_g1', 'name': 'Consumer', 'accessStatus': 'ALLOWED'},
+                                      {'authorityId': 'GROUP_g2', 'name': 'Collaborator', 'accessStatus': 'ALLOWED'}]}
+        self.assertTrue(permissionsChanged(self.acsClient.getPermissions(folder['id']), permissions))
+
+        self.acsClient.setPermissions(folder['id'], permissions)
+        self.assertFalse(permissionsChanged(self.acsClient.getPermissions(folder['id']),
+                                            dict(permissions, locallySet=permissions['locallySet'][::-1])))
+        self.assertTrue(permissionsChanged(self.acsClient.getPermissions(folder['id']),
+                                           dict(permissions, locallySet=permissions['locallySet'][:1])))
+
+        folders, created = self.acsClient.ensureFolders(docLib['id'], ['folder1'], include=['permissions'])
+        self.assertFalse(permissionsChanged(folders['folder1']['permissions'], permissions))
+
+        # the permissions are not written again, but their groups are created when missing
+        self.acsClient.createRootGroup('uw_groups', 'uw_groups')
+        self.simulator.resetStats()
+        self.assertFalse(acs.setFolderPermissions(self.acsClient, folder['id'], [{'role': 'Consumer', 'group': 'g1'},
+                                                                                 {'role': 'Collaborator', 'group': 'g2'}]))
+        self.assertEqual(self.simulator.requestCounts.get('PUT /nodes/{id}'), None)
+        self.assertTrue(self.acsClient.getGroup('GROUP_g1') and self.acsClient.getGroup('GROUP_g2'))
+
+    def testPlanAndApply(self):
+        conf = {'rootGroup': 'uw_groups', 'adminGroup': 'admins',
+                'adminAppUsers': [{'name': 'app-user', 'password': 'pw'}],
+                'sites': [{'id': 'mysite', 'title': 'My Site', 'description': 'My Site',
+                           'roles': [{'role': 'SiteConsumer', 'group': 'readers'}],
+                           'folders': [{'name': 'folder1', 'roles': [{'role': 'Consumer', 'group': 'f1-readers'}]},
+                                       {'name': 'folder2'}]}]}
+        rules = [{'folders': ['mysite'], 'rule': {'title': 'rule1', 'description': 'first', 'disabled': False}}]
+        filePlan = {'title': 'RM', 'description': 'RM', 'compliance': 'DOD5015',
+                    'categories': [{'name': 'c1', 'children': [{'name': 'c1.1'}]}]}
+
+        planner = AcsPlanner(self.acsClient, conf, rules, filePlan)
+        changes = planner.plan()
+        self.assertEqual(planner.apply(changes), [])
+
+        self.simulator.resetStats()
+        self.assertEqual([str(c) for c in AcsPlanner(self.acsClient, conf, rules, filePlan).plan()], [])
+        self.assertEqual(self.simulator.requestCounts.get('POST /nodes/{id}/children'), None)
+
+        rules[0]['rule']['description'] = 'changed'
+        conf['sites'][0]['folders'][1]['roles'] = [{'role': 'Collaborator', 'group': 'readers'}]
+        changes = AcsPlanner(self.acsClient, conf, rules, filePlan).plan()
+        self.assertEqual(sorted(str(c) for c in changes),
+                         ['set permissions Sites/mysite/documentLibrary/folder2',
+                          'update rule "rule1" in mysite/documentLibrary'])
+
+    def testStateFile(self):
+        directory = tempfile.mkdtemp()
+        confFile = os.path.join(directory, 'acs.yml')
+        stateFile = os.path.join(directory, 'state.json')
+        conf = {'rootGroup': 'uw_groups', 'adminGroup': 'admins', 'adminAppUsers': [],
+                'sites': [{'id': 'site1', 'title': 'Site 1', 'description': 'Site 1'},
+                          {'id': 'site2', 'title': 'Site 2', 'description': 'Site 2'}]}
+
+        def run(*options):
+            with open(confFile, 'w') as f:
+                json.dump({'default': conf}, f)  # json is yaml
+            acs.main(['-c', confFile, '-r', '', '-f', '', '--url', self.simulator.url, '-p', 'admin',
+                      '--state', stateFile] + list(options))
+            with open(stateFile) as f:
+                return sorted(json.load(f)[self.simulator.url]['resources'])
+
+        try:
+            self.assertEqual(run(), ['admins', 'rootGroup', 'site:site1', 'site:site2'])
+            self.simulator.resetStats()
+            run()
+            self.assertEqual(self.simulator.requestTotal, 0)
+
+            conf['sites'][0]['roles'] = [{'role': 'SiteConsumer', 'group': 'readers'}]
+            run()
+            self.assertEqual([(m['authority']['fullName'], m['role']) for m in self.acsClient.getSiteGroups('site1')],
+                             [('GROUP_readers', 'SiteConsumer')])
+            self.assertEqual(self.simulator.requestCounts.get('GET /sites/{id}'), 1)
+
+            del conf['sites'][1]
+            self.assertEqual(run(), ['admins', 'rootGroup', 'site:site1'])
+            conf['sites'].append({'id': 'site3', 'title': 'Site 3', 'description': 'Site 3'})
+            self.assertEqual(run('--apply'), ['admins', 'rootGroup', 'site:site1', 'site:site3'])
+            del conf['sites'][1]
+            self.assertEqual(run('--apply'), ['admins', 'rootGroup', 'site:site1'])
+
+            conf['sites'].append({'id': 'site4', 'title': 'Site 4', 'description': 'Site 4'})
+            self.assertRaises(SystemExit, run, '--verify')
+            with open(stateFile) as f:
+                self.assertEqual(json.load(f)[self.simulator.url]['resources'], {})
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(acs.adminsConfig(None), {'adminGroup': None, 'adminAppUsers': []})
+
+    def testPagedGroupMembers(self):
+        self.acsClient.createRootGroup('uw_groups', 'uw_groups')
+        for i in range(12):
+            self.acsClient.createGroup('g' + str(i), 'g' + str(i))
+
+        members = self.acsClient.getGroupMembers('uw_groups')
+        self.assertEqual(len(members), 12)
+        self.assertEqual(self.simulator.requestCounts['GET /groups/{id}/members'], 3)
+
+    def testRules(self):
+        self.acsClient.createSite('mysite', 'My Site', 'My Site')
+        docLib = self.acsClient.getDocumentLibrary('mysite')
+        self.acsClient.createRule(docLib['id'], {'title': 'r1', 'ruleType': ['inbound']})
+        rules = self.acsClient.getRules(docLib['id'])
+        self.assertEqual([r['title'] for r in rules], ['r1'])
+        self.acsClient.deleteRule(docLib['id'], rules[0]['id'])
+        self.assertEqual(self.acsClient.getRules(docLib['id']), [])
+
+    def testRuleChanged(self):
+        self.acsClient.createSite('mysite', 'My Site', 'My Site')
+        docLib = self.acsClient.getDocumentLibrary('mysite')
+        rule = {'title': 'r1', 'ruleType': ['update', 'inbound'], 'disabled': False,
+                'action': {'actionDefinitionName': 'composite-action', 'actions': [{'actionDefinitionName': 'a1'}]}}
+        self.acsClient.createRule(docLib['id'], dict(rule, ruleType=['inbound', 'update'], disabled='false'))
+        summary = self.acsClient.getRules(docLib['id'])[0]
+
+        self.assertFalse(ruleChanged(self.acsClient, docLib['id'], summary, rule))
+        self.assertTrue(ruleChanged(self.acsClient, docLib['id'], summary, dict(rule, action={'actions': []})))
+        self.simulator.resetStats()
+        self.assertTrue(ruleChanged(self.acsClient, docLib['id'], summary, dict(rule, disabled=True)))
+        self.assertEqual(self.simulator.requestTotal, 0)
+
+    def testSyncFolderRules(self):
+        self.acsClient.createSite('mysite', 'My Site', 'My Site')
+        rules = [{'title': 'r1', 'ruleType': ['inbound'], 'disabled': False},
+                 {'title': 'r2', 'ruleType': ['update'], 'disabled': False}]
+        post = 'POST /api/node/workspace/SpacesStore/{id}/ruleset/rules'
+        put = 'PUT /api/node/workspace/SpacesStore/{id}/ruleset/rules/{ruleId}'
+
+        self.simulator.resetStats()
+        acs.syncFolderRules(self.acsClient, 'mysite', rules)
+        self.assertEqual((self.simulator.requestCounts.get(post), self.simulator.requestCounts.get(put)), (2, None))
+
+        # unchanged rules are not written again
+        self.simulator.resetStats()
+        acs.syncFolderRules(self.acsClient, 'mysite', rules)
+        self.assertEqual((self.simulator.requestCounts.get(post), self.simulator.requestCounts.get(put)), (None, None))
+
+        rules[1]['disabled'] = True
+        self.simulator.resetStats()
+        acs.syncFolderRules(self.acsClient, 'mysite', rules)
+        self.assertEqual((self.simulator.requestCounts.get(post), self.simulator.requestCounts.get(put)), (None, 1))
+        docLib = self.acsClient.getDocumentLibrary('mysite')
+        self.assertEqual(sorted(r['title'] for r in self.acsClient.getRules(docLib['id'])), ['r1', 'r2'])
+
+    def testFilePlanCategories(self):
+        self.acsClient.createRmSite()
+        categories = [{'name': 'c1', 'children': [{'name': 'c1.1', 'children': [
+                          {'name': 'f1', 'nodeType': 'recordFolder', 'children': [{'name': 'not created'}]}]},
+                                                 {'name': 'c1.2'}]},
+                      {'name': 'c2'}]
+        createRoot = 'POST /file-plans/-filePlan-/categories'
+        createChild = 'POST /record-categories/{id}/children'
+        listChildren = 'GET /record-categories/{id}/children'
+
+        def run():
+            self.simulator.resetStats()
+            acs.createOrUpdateCategories(self.acsClient, categories, 4)
+            counts = self.simulator.requestCounts
+            return [counts.get(label, 0) for label in (createRoot, createChild, listChildren)]
+
+        # the children of the categories created are not listed, record folders are leaves
+        self.assertEqual(run(), [2, 3, 0])
+        names = [c['entry']['name'] for c in self.acsClient.getRootRecordCategories()]
+        self.assertEqual(sorted(names), ['c1', 'c2'])
+        c1 = [c['entry']['id'] for c in self.acsClient.getRootRecordCategories() if c['entry']['name'] == 'c1'][0]
+        children = dict((c['entry']['name'], c['entry']) for c in self.acsClient.getRecordCategoriesAndFolders(c1))
+        self.assertEqual(sorted(children), ['c1.1', 'c1.2'])
+        f1 = self.acsClient.getRecordCategoriesAndFolders(children['c1.1']['id'])
+        self.assertEqual([(c['entry']['name'], c['entry']['nodeType']) for c in f1], [('f1', 'rma:recordFolder')])
+
+        # a second run creates nothing: the categories with children are listed, level by level
+        self.assertEqual(run(), [0, 0, 2])
+        categories[0]['children'][1]['children'] = [{'name': 'c1.2.1'}]
+        self.assertEqual(run(), [0, 1, 3])
+
+    def testBulkImport(self):
+        self.acsClient.createSite('mysite', 'My Site', 'My Site')
+        source = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(source, 'a', 'b'))
+            for name in ('one.txt', 'two.txt'):
+                with open(os.path.join(source, 'a', 'b', name), 'w') as f:
+                    f.write('content')
+
+            self.acsClient.startBulkImport(source, '/Sites/mysite/documentLibrary')
+            status = self.acsClient.getBulkImportStatus()
+            while status['currentStatus'] != 'Idle':
+                time.sleep(0.01)
+                status = self.acsClient.getBulkImportStatus()
+        finally:
+            shutil.rmtree(source)
+
+        self.assertEqual(status['lastResult'], 'Succeeded')
+        self.assertTrue(self.acsClient.getNodeByPath('mysite/documentLibrary/a/b/two.txt'))
+
+    def testInventory(self):
+        self.acsClient.createSite('mysite', 'My Site', 'My Site')
+        source = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(source, 'a'))
+            for i in range(12):
+                with open(os.path.join(source, 'a', str(i) + '.txt'), 'w') as f:
+                    f.write('content')
+            self.acsClient.startBulkImport(source, '/Sites/mysite/documentLibrary')
+            while self.acsClient.getBulkImportStatus()['currentStatus'] != 'Idle':
+                time.sleep(0.01)
+            with open(os.path.join(source, 'a', '12.txt'), 'w') as f:
+                f.write('content')
+
+            expected = AcsInventory.expectedFromTrees([source])
+            docLib = self.acsClient.getDocumentLibrary('mysite')
+            inventory = AcsInventory.AcsInventory(self.acsClient, workers=4)
+            stats = inventory.crawl(docLib['id'], os.path.join(source, 'inventory.csv'))
+            counts = AcsInventory.reconcile(os.path.join(source, 'inventory.csv'), expected,
+                                            os.path.join(source, 'report.csv'))
+        finally:
+            shutil.rmtree(source)
+
+        self.assertEqual((stats['folders'], stats['documents'], stats['pages'], stats['errors']), (1, 12, 4, 0))
+        self.assertEqual((counts['matched'], counts['missing'], counts['extra']), (12, 1, 0))
+
+    def testExport(self):
+        self.acsClient.createSite('mysite', 'My Site', 'My Site')
+        docLib = self.acsClient.getDocumentLibrary('mysite')
+        folder = self.acsClient.createFolder(docLib['id'], 'a')
+        for i in range(7):
+            self.acsClient.uploadContentStream(folder['id'], io.BytesIO(b'content'), name=str(i) + '.txt')
+
+        output = tempfile.mkdtemp()
+        try:
+            runs = []
+            for i in range(2):
+                ledger = ExportLedger(output + '.ledger')
+                export = AcsExport(self.acsClient, os.path.join(output, 'export'), workers=2, downloadWorkers=3,
+                                   ledger=ledger)
+                runs.append(export.export(docLib['id'], os.path.join(output, 'inventory.csv')))
+                ledger.close()
+            with open(os.path.join(output, 'export', 'a', '6.txt'), 'rb') as f:
+                content = f.read()
+            metadata = ElementTree.parse(os.path.join(output, 'export', 'a', '6.txt' + METADATA_SUFFIX)).getroot()
+        finally:
+            shutil.rmtree(output)
+            os.remove(output + '.ledger')
+
+        self.assertEqual(content, b'content')
+        self.assertEqual(metadata.find("entry[@key='cm:name']").text, '6.txt')
+        self.assertEqual(metadata.find("entry[@key='type']").text, 'cm:content')
+        self.assertEqual((runs[0]['downloaded'], runs[0]['downloadedBytes'], runs[0]['unchanged']), (7, 49, 0))
+        self.assertEqual((runs[1]['downloaded'], runs[1]['unchanged']), (0, 7))
+
+    def testExportMultipleValues(self):
+        entry = {'name': 'a.txt', 'nodeType': 'cm:content', 'aspectNames': ['cm:titled', 'cm:auditable'],
+                 'properties': {'my:tags': ['a', 'b,c'], 'my:count': 2, 'my:flag': True}}
+        metadata = ElementTree.fromstring(util.metadata_xml(nodeMetadata(entry)))
+        self.assertEqual(metadata.find("entry[@key='aspects']").text, 'cm:titled')
+        self.assertEqual(metadata.find("entry[@key='my:tags']").text, 'a,b,c')
+        self.assertEqual(metadata.find("entry[@key='my:count']").text, '2')
+        self.assertEqual(metadata.find("entry[@key='my:flag']").text, 'true')
+        metadata = ElementTree.fromstring(util.metadata_xml(nodeMetadata(entry, '|')))
+        self.assertEqual(metadata.find("entry[@key='my:tags']").text, 'a|b,c')
+
+    def testConnectionReuse(self):
+        self.simulator.latency = 0.01
+        self.acsClient.createSite('mysite', 'My Site', 'My Site')
+        self.simulator.resetStats()
+        for i in range(3):
+            util.parallel_map(lambda n: self.acsClient.getSite('mysite'), range(8), 4)
+        self.assertEqual(self.simulator.requestTotal, 24)
+        self.assertTrue(self.simulator.connectionTotal <= 4)
+
+    def testParallelSitesWorkers(self):
+        self.simulator.latency = 0.01
+        sites = [{'id': 'site' + str(i), 'title': 'Site', 'description': 'Site',
+                  'folders': [{'name': 'f' + str(j)} for j in range(6)]} for i in range(2)]
+        acs.createOrUpdateSites(self.acsClient, sites, 4)
+        self.assertTrue(self.simulator.maxConcurrent <= 4)
+        self.assertEqual(len(self.acsClient.getChildrenByName(self.acsClient.getDocumentLibrary('site1')['id'])), 6)
+
+    def testParallelSitesSharedGroup(self):
+        self.acsClient.createRootGroup('uw_groups', 'uw_groups')
+        self.simulator.latency = 0.02
+        sites = [{'id': 'site' + str(i), 'title': 'Site', 'description': 'Site',
+                  'roles': [{'role': 'SiteConsumer', 'group': 'shared'}]} for i in range(8)]
+        acs.createOrUpdateSites(self.acsClient, sites, 8)
+        for site in sites:
+            self.assertEqual([m['authority']['fullName'] for m in self.acsClient.getSiteGroups(site['id'])],
+                             ['GROUP_shared'])
+
+    def testSchedulerRetryDelay(self):
+        self.acsClient.createSite('mysite', 'My Site', 'My Site')
+        job = {'sourceDirectory': '/nonexistent', 'targetPath': '/Sites/mysite/documentLibrary', 'nodes': 1}
+        scheduler = BulkImportScheduler([self.acsClient], pollInterval=0.02, maxRetries=2, retryDelay=0.1)
+        start = time.time()
+        results = scheduler.run([job])
+        self.assertEqual([r['lastResult'] for r in results], ['Failed'] * 3)
+        self.assertTrue(time.time() - start >= 0.3)  # 0.1 and 0.2 seconds before the retries
+
+    # a bulk import started elsewhere, which keeps the simulator busy for seconds
+    def startOtherImport(self, seconds):
+        self.acsClient.createSite('other', 'Other', 'Other')
+        source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source)
+        with open(os.path.join(source, 'a.txt'), 'w') as f:
+            f.write('content')
+        self.simulator.importRate = 1.0 / seconds
+        self.acsClient.startBulkImport(source, '/Sites/other/documentLibrary')
+        return source
+
+    def testSchedulerWaitsForBusyNode(self):
+        source = self.startOtherImport(0.3)
+        job = {'sourceDirectory': source, 'targetPath': '/Sites/other/documentLibrary', 'nodes': 1}
+        results = BulkImportScheduler([self.acsClient], pollInterval=0.05, maxWait=5).run([job])
+        self.assertEqual([r['lastResult'] for r in results], ['Succeeded'])
+
+    def testSchedulerBusyNodeKeepsTrial(self):
+        source = self.startOtherImport(0.3)
+        job = {'sourceDirectory': source, 'targetPath': '/Sites/other/documentLibrary', 'nodes': 1}
+        tuner = BulkImportTuner(None, self.acsClient.urlbase, [(20, 4), (50, 10)])
+        results = BulkImportScheduler([self.acsClient], pollInterval=0.05, tuner=tuner, maxWait=5).run([job])
+        self.assertEqual([r['lastResult'] for r in results], ['Succeeded'])
+        self.assertEqual([(t['batchSize'], t['numThreads']) for t in tuner.trials], [(20, 4)])
+        self.assertEqual(tuner.grid, [(50, 10)])
+
+    def testSchedulerMaxWait(self):
+        source = self.startOtherImport(30)
+        job = {'sourceDirectory': source, 'targetPath': '/Sites/other/documentLibrary', 'nodes': 1}
+        start = time.time()
+        results = BulkImportScheduler([self.acsClient], pollInterval=0.05, maxWait=0.2).run([job])
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual([r['lastResult'] for r in results], ['Failed'])
+        self.assertTrue('idle' in results[0]['exception'])
+
+    def testSchedulerMonitor(self):
+        source = self.startOtherImport(0.2)
+        self.simulator.importRate = 5.0
+        while self.acsClient.getBulkImportStatus()['currentStatus'].lower() != 'idle':
+            time.sleep(0.05)
+        job = {'name': 'a', 'sourceDirectory': source, 'targetPath': '/Sites/other/documentLibrary', 'nodes': 1}
+        monitor = BulkImportMonitor(self.acsClient)
+        results = BulkImportScheduler([self.acsClient], pollInterval=0.05, monitor=monitor).run([job])
+        self.assertEqual([r['lastResult'] for r in results], ['Succeeded'])
+        self.assertTrue(len(monitor.samples) >= 2)
+        self.assertEqual(set(s['job'] for s in monitor.samples), set(['[' + self.acsClient.urlbase + '] a']))
+        self.assertEqual(monitor.samples[-1]['status'].lower(), 'idle')
+        self.assertEqual(monitor.samples[-1]['expectedNodes'], 1)
+
+    def testSyncAdmins(self):
+        self.acsClient.createGroup('nested_admins', 'nested_admins', 'GROUP_ALFRESCO_ADMINISTRATORS')
+        self.acsClient.createAdminAppUser('nested', 'secret')
+        self.acsClient.addGroupMember('GROUP_nested_admins', 'nested', 'PERSON')
+        acs.syncAdmins(self.acsClient, {'adminGroup': None, 'adminAppUsers': [{'name': 'nested', 'password': 'secret'},
+                                                                              {'name': 'app', 'password': 'secret'}]})
+        members = set(m['entry']['id'] for m in self.acsClient.getGroupMembers('GROUP_ALFRESCO_ADMINISTRATORS'))
+        self.assertEqual(members, set(['admin', 'GROUP_nested_admins', 'app']))
+
+        conf = {'adminAppUsers': [{'name': 'nested', 'password': 'secret'}, {'name': 'other', 'password': 'secret'}]}
+        changes = [str(c) for c in AcsPlanner(self.acsClient, conf).plan()]
+        self.assertFalse([c for c in changes if 'nested' in c])
+        self.assertTrue([c for c in changes if 'other to GROUP_ALFRESCO_ADMINISTRATORS' in c])
+
+    def testSimulatedErrors(self):
+        self.simulator.errorRate = 1.0
+        self.assertRaises(requests.exceptions.HTTPError, self.acsClient.getSite, 'mysite')
+        self.assertEqual(self.simulator.errorTotal, 1)
+
+###########################
+# main
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+# snapshot of the repository database, to reset it without the bootstrap of
+# the repository: the tables of a freshly bootstrapped schema are dropped, or
+# truncated, and loaded again from the snapshot.
+#
+# the snapshot is a directory of plain sql, two files per table:
+# * <table>.schema.sql: its CREATE TABLE statement
+# * <table>.rows.sql: its rows, one INSERT statement of up to LOAD_BATCH_SIZE
+#   rows per line (string literals are escaped, so that they never span lines,
+#   and binary values are hex literals)
+# the files can be read, diffed, or loaded with the mysql client. unlike a
+# pickle, loading them runs no python code; and a file whose statements are
+# not the CREATE TABLE or INSERT INTO of the table it is named after is
+# rejected before it is executed.
+
+import binascii
+import datetime
+import io
+import logging
+import os
+
+import util
+
+# rows inserted per statement
+LOAD_BATCH_SIZE = 1000
+
+SCHEMA_SUFFIX = '.schema.sql'
+ROWS_SUFFIX = '.rows.sql'
+
+try:
+    _text_type = unicode
+except NameError:  # python 3
+    _text_type = str
+
+_ESCAPES = {'\\': '\\\\', "'": "\\'", '"': '\\"', '\n': '\\n', '\r': '\\r', '\0': '\\0', '\x1a': '\\Z'}
+
+
+# sql literal of a column value, as written by mysqldump --hex-blob
+def sqlLiteral(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (bytes, bytearray)):
+        return "X'" + binascii.hexlify(bytes(value)).decode('ascii') + "'" if value else "''"
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, int) or type(value).__name__ in ('long', 'Decimal'):
+        return str(value)
+    if isinstance(value, datetime.timedelta):  # time columns
+        seconds = value.days * 86400 + value.seconds
+        sign, seconds = ('-', -seconds) if seconds < 0 else ('', seconds)
+        value = '%s%d:%02d:%02d' % (sign, seconds // 3600, seconds // 60 % 60, seconds % 60)
+    elif isinstance(value, (set, frozenset)):  # set columns
+        value = ','.join(sorted(value))
+    elif not isinstance(value, _text_type):  # dates
+        value = str(value)
+    return "'" + ''.join(_ESCAPES.get(c, c) for c in value) + "'"
+
+
+def _insert(table, columns):
+    return 'INSERT INTO `' + table + '` (' + ', '.join('`' + c + '`' for c in columns) + ') VALUES '
+
+
+#############################################
+def drop_alfresco_tables(optionfile, group='dev', schema='acs'):
+    logging.info('Dropping Alfresco tables')
+    stmt = """SET FOREIGN_KEY_CHECKS = 0;
+               SET GROUP_CONCAT_MAX_LEN=32768;
+               SET @tables = NULL;
+               SELECT GROUP_CONCAT('`', table_name, '`') INTO @tables
+               FROM information_schema.tables
+               WHERE table_schema = %s;
+
+               SELECT IFNULL(@tables,'dummy') INTO @tables;
+               SET @tables = CONCAT('DROP TABLE IF EXISTS ', @tables);
+
+               PREPARE stmt FROM @tables;
+               EXECUTE stmt;
+               DEALLOCATE PREPARE stmt;
+               SET FOREIGN_KEY_CHECKS = 1;
+            """
+    import mysql.connector
+    cnx = None
+    try:
+        cnx = mysql.connector.connect(option_files=optionfile, option_groups=group)
+        cur = cnx.cursor()
+        # one statement at a time; the session variables carry over
+        for s in stmt.split(';'):
+            if s.strip():
+                cur.execute(s, (schema,) if '%s' in s else None)
+    finally:
+        cnx and cnx.close()
+
+    logging.info('Dropped Alfresco tables')
+
+
+# mysql.connector is imported on the first connection, after the arguments are checked
+def _connect(optionfile, group, schema):
+    import mysql.connector
+    cnx = mysql.connector.connect(option_files=optionfile, option_groups=group, database=schema)
+    cur = cnx.cursor()
+    # rows are loaded in any table order, and were unique when saved
+    cur.execute('SET FOREIGN_KEY_CHECKS = 0')
+    cur.execute('SET UNIQUE_CHECKS = 0')
+    return cnx
+
+
+def _tables(cnx, schema):
+    cur = cnx.cursor()
+    cur.execute("SELECT table_name FROM information_schema.tables "
+                "WHERE table_schema = %s AND table_type = 'BASE TABLE'", (schema,))
+    return sorted(row[0] for row in cur.fetchall())
+
+
+# write the utf-8 text of path through a temporary file, so that an interrupted snapshot leaves no partial file.
+# write is called with a function that writes text
+def _writeAtomic(path, write):
+    with open(path + '.tmp', 'wb') as f:
+        write(lambda text: f.write(text.encode('utf-8')))
+    os.rename(path + '.tmp', path)
+
+
+#############################################
+# save the definition and rows of every table, workers tables at a time, each on its own connection
+def snapshot_tables(optionfile, group, schema, snapshotDir, workers=4):
+    util.make_dirs(snapshotDir)
+    cnx = _connect(optionfile, group, schema)
+    try:
+        tables = _tables(cnx, schema)
+    finally:
+        cnx.close()
+
+    def save(table):
+        cnx = _connect(optionfile, group, schema)
+        try:
+            cur = cnx.cursor()
+            cur.execute('SHOW CREATE TABLE `' + table + '`')
+            ddl = cur.fetchone()[1]
+            _writeAtomic(os.path.join(snapshotDir, table + SCHEMA_SUFFIX), lambda out: out(ddl + ';\n'))
+
+            cur.execute('SELECT * FROM `' + table + '`')
+            insert = _insert(table, [d[0] for d in cur.description])
+            counts = [0]
+
+            def writeRows(out):
+                while True:
+                    rows = cur.fetchmany(LOAD_BATCH_SIZE)
+                    if not rows:
+                        return
+                    out(insert + ', '.join('(' + ', '.join(sqlLiteral(v) for v in row) + ')' for row in rows) + ';\n')
+                    counts[0] += len(rows)
+            _writeAtomic(os.path.join(snapshotDir, table + ROWS_SUFFIX), writeRows)
+        finally:
+            cnx.close()
+        logging.info('  ' + table + ': ' + str(counts[0]) + ' row(s)')
+        return counts[0]
+
+    util.parallel_map(save, tables, workers)
+    return tables
+
+
+# the tables of a snapshot: name, CREATE TABLE statement and rows file, checked against the table name
+def read_snapshot(snapshotDir):
+    if not os.path.isdir(snapshotDir):
+        raise Exception('no snapshot in ' + snapshotDir + ', run with --mode snapshot first')
+    snapshot = []
+    for f in sorted(os.listdir(snapshotDir)):
+        if not f.endswith(SCHEMA_SUFFIX):
+            continue
+        table = f[:-len(SCHEMA_SUFFIX)]
+        with io.open(os.path.join(snapshotDir, f), 'r', encoding='utf-8') as handle:
+            ddl = handle.read().strip().rstrip(';')
+        if not ddl.startswith('CREATE TABLE `' + table + '` ('):
+            raise Exception(f + ' is not the CREATE TABLE statement of table ' + table)
+        rows = os.path.join(snapshotDir, table + ROWS_SUFFIX)
+        if not os.path.isfile(rows):
+            raise Exception('no rows file for table ' + table + ' in snapshot ' + snapshotDir)
+        snapshot.append({'table': table, 'ddl': ddl, 'rows': rows, 'size': os.path.getsize(rows)})
+    if not snapshot:
+        raise Exception('no tables in snapshot ' + snapshotDir)
+    return snapshot
+
+
+def create_tables(optionfile, group, schema, snapshot):
+    cnx = _connect(optionfile, group, schema)
+    try:
+        cur = cnx.cursor()
+        for table in snapshot:
+            cur.execute(table['ddl'])
+    finally:
+        cnx.close()
+
+
+def truncate_tables(optionfile, group, schema, snapshot):
+    cnx = _connect(optionfile, group, schema)
+    try:
+        existing = _tables(cnx, schema)
+        missing = sorted(set(t['table'] for t in snapshot) - set(existing))
+        if missing:
+            raise Exception('table(s) ' + ', '.join(missing) + ' of the snapshot do not exist, use --mode restore')
+        cur = cnx.cursor()
+        for table in existing:
+            cur.execute('TRUNCATE TABLE `' + table + '`')
+    finally:
+        cnx.close()
+
+
+# load the rows of the snapshot, workers tables at a time, each on its own connection
+def load_tables(optionfile, group, schema, snapshot, workers=4):
+    def load(table):
+        if not table['size']:
+            return 0
+        prefix = 'INSERT INTO `' + table['table'] + '` ('
+        statements = 0
+        cnx = None
+        try:
+            # lines end at \n only: string literals may hold other line breaks, e.g. u+2028
+            with io.open(table['rows'], 'r', encoding='utf-8', newline='\n') as f:
+                for line in f:
+                    if not line.startswith(prefix):
+                        raise Exception(table['rows'] + ': not an INSERT INTO statement of table ' + table['table'])
+                    if not cnx:
+                        cnx = _connect(optionfile, group, schema)
+                        cur = cnx.cursor()
+                    cur.execute(line.rstrip('\n').rstrip(';'))
+                    statements += 1
+            if cnx:
+                cnx.commit()
+        finally:
+            if cnx:
+                cnx.close()
+        return statements
+
+    # the largest tables first, so that they do not finish last
+    snapshot = sorted(snapshot, key=lambda t: -t['size'])
+    statements = util.parallel_map(load, snapshot, workers)
+    logging.info('loaded ' + str(len(snapshot)) + ' table(s) in ' + str(sum(statements)) + ' statement(s)')
+    return sum(statements)
@@ -0,0 +1,78 @@
+# local record (json) of the configuration acs.py last applied to a
+# repository: a fingerprint of the desired config of every resource (root
+# group, admins, each site, the rules of each folder, the file plan and each
+# root category) and the node ids it resolved to. a resource whose config
+# has the same fingerprint as at the last successful apply is skipped without
+# any request. the file is keyed by repository url, like the bulk import
+# tuning file.
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+# sha1 of a config value, independent of the order of dict keys
+def fingerprint(config):
+    text = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+#############################################
+class AcsState:
+    ######################################
+    # constructor
+    # path: state file shared by all repositories, keyed by url
+    def __init__(self, path, url):
+        self.path = path
+        self.url = url
+        self.lock = threading.Lock()
+        self.saved = {}
+        if path and os.path.isfile(path):
+            with open(path, 'r') as f:
+                self.saved = json.load(f)
+        self.resources = dict((self.saved.get(url) or {}).get('resources') or {})
+        self.seen = set()
+
+    ######################################
+    # whether config is the one applied for key by the last run
+    def unchanged(self, key, config):
+        with self.lock:
+            self.seen.add(key)
+            entry = self.resources.get(key)
+            return entry is not None and entry['fingerprint'] == fingerprint(config)
+
+    # record that config was applied for key, with the node ids it resolved to
+    def record(self, key, config, ids=None):
+        with self.lock:
+            self.seen.add(key)
+            self.resources[key] = {'fingerprint': fingerprint(config), 'ids': ids or {},
+                                   'appliedAt': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+    def get(self, key):
+        return self.resources.get(key)
+
+    # forget key, or every resource, so that the next run applies it again
+    def forget(self, key=None):
+        with self.lock:
+            if key is None:
+                self.resources.clear()
+            else:
+                self.resources.pop(key, None)
+
+    # drop the resources no longer in the configuration, i.e. not looked at in this run
+    def prune(self):
+        with self.lock:
+            for key in set(self.resources) - self.seen:
+                del self.resources[key]
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            self.saved[self.url] = {'resources': self.resources, 'updatedAt': time.strftime('%Y-%m-%dT%H:%M:%S')}
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.saved, f, indent=2, sort_keys=True)
+            os.rename(tmp, self.path)
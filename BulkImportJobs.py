@@ -0,0 +1,136 @@
+# bulk import jobs: the (sourceDirectory, targetPath) jobs of a bulk import
+# conf file, and their import, one after the other on a repository node or
+# scheduled on the nodes of a cluster. used by acs-bulk-import.py,
+# acs-migrate-import.py and acs-benchmark.py.
+
+import logging
+import os
+import sys
+import time
+
+from BulkImportMonitor import countImportSource
+from BulkImportScheduler import BulkImportScheduler
+from BulkImportTuner import jobSettings
+
+
+#############################################
+# list the (sourceDirectory, targetPath) jobs of the bulk import config
+def getImportJobs(conf, profile):
+    jobs = []
+    imports = conf
+    if imports:
+        for imp in imports:
+            sourceDirectoryBase = imp['sourceDirectoryBase']
+            sourceDirectories = imp['sourceDirectories']
+            targetPath = imp['targetPath']
+            if should_import_profile(profile, targetPath):
+                for srcdir in sourceDirectories:
+                    jobs.append({'name': srcdir, 'sourceDirectory': sourceDirectoryBase + '/' + srcdir,
+                                 'targetPath': targetPath, 'createTargetPath': imp.get('createTargetPath', False),
+                                 'nodes': imp.get('nodes') if len(sourceDirectories) == 1 else None,
+                                 'batchSize': imp.get('batchSize'), 'numThreads': imp.get('numThreads')})
+            else:
+                logging.debug('Skipping Import to "' + targetPath + '" for specified profile: "' + profile + '"')
+    return jobs
+
+
+#############################################
+# import the jobs one after the other. returns the final status of each job run
+def startBulkImport(acsClient, jobs, monitor=None, ledger=None, maxRetries=0, retryDelay=60, tuner=None):
+    if ledger:
+        completed = len(jobs) - len(ledger.pending(jobs))
+        if completed:
+            logging.info('Skipping ' + str(completed) + ' job(s) already completed according to ' + ledger.path)
+        jobs = ledger.pending(jobs)
+    createTargetPaths(acsClient, jobs)
+
+    results = []
+    for job in jobs:
+        for attempt in range(maxRetries + 1):
+            if attempt > 0:
+                delay = retryDelay * 2 ** (attempt - 1)
+                logging.info('Retrying ' + job['sourceDirectory'] + ' in ' + str(delay) + ' seconds')
+                time.sleep(delay)
+
+            settings = tuner.settingsFor(job) if tuner else jobSettings(job)
+            if ledger:
+                ledger.start(job, acsClient.urlbase)
+            status = runImportJob(acsClient, job, monitor, settings['batchSize'], settings['numThreads'])
+            if ledger:
+                ledger.finish(job, status)
+            if tuner:
+                tuner.record(settings, status)
+            if status['lastResult'].lower() == 'succeeded':
+                break
+        results.append(status)
+    return results
+
+
+# import one source directory and wait for the import to complete
+def runImportJob(acsClient, job, monitor=None, batchSize=20, numThreads=10):
+    sourceDirectory = job['sourceDirectory']
+    targetPath = job['targetPath']
+    logging.info('Uploading content from ' + sourceDirectory + ' to ' + targetPath + ' (batchSize ' +
+                 str(batchSize) + ', numThreads ' + str(numThreads) + ')')
+    expectedNodes = None
+    if monitor and os.path.isdir(sourceDirectory):
+        expectedNodes, expectedBytes = countImportSource(sourceDirectory)
+        logging.info('  ' + str(expectedNodes) + ' nodes, ' + str(expectedBytes) + ' bytes to import')
+    acsClient.startBulkImport(sourceDirectory, targetPath, batchSize, numThreads)
+
+    # alfresco allow one bulk import at a time, wait for bulk load to complete
+    if monitor:
+        status = monitor.wait(job['name'], expectedNodes)
+    else:
+        status = acsClient.getBulkImportStatus()
+        while status['currentStatus'].lower() != 'idle':
+            sys.stdout.write('.')
+            sys.stdout.flush()
+            time.sleep(1)
+            status = acsClient.getBulkImportStatus()
+        print("")  # new line
+
+    if status['lastResult'].lower() == 'succeeded':
+        logging.info('Uploaded content from ' + sourceDirectory + ' to ' + targetPath)
+        logging.info('Throughput: ' + status['nodesPerSecond'])
+        logging.info('Duration in ns: ' + status['durationInNS'])
+    else:
+        logging.error('Failed to upload content from ' + sourceDirectory + ' to ' + targetPath)
+        logging.error('Current Status: ' + status['currentStatus'])
+        logging.error('Last Result: ' + status['lastResult'])
+        logging.error('Exception: ' + status['exception'])
+    return status
+
+
+#############################################
+# run the jobs on several repository nodes, one import per node at a time,
+# largest (pre-scanned) jobs first
+def startClusterBulkImport(acsClients, jobs, pollInterval=5.0, ledger=None, maxRetries=0, tuner=None, retryDelay=60,
+                           maxWait=3600, monitor=None):
+    if ledger:
+        jobs = ledger.pending(jobs)
+    createTargetPaths(acsClients[0], jobs)
+    for job in jobs:
+        if job.get('nodes') is None:
+            job['nodes'] = 0
+            if os.path.isdir(job['sourceDirectory']):
+                job['nodes'] = countImportSource(job['sourceDirectory'])[0]
+
+    scheduler = BulkImportScheduler(acsClients, pollInterval, ledger, maxRetries, tuner, retryDelay, maxWait, monitor)
+    return scheduler.run(jobs)
+
+
+# the target of a job split from a larger source directory may not exist yet
+def createTargetPaths(acsClient, jobs):
+    for job in jobs:
+        if job.get('createTargetPath'):
+            acsClient.createFolderPath(job['targetPath'])
+
+
+def should_import_profile(profile, target_path):
+    import_profile = True
+    if profile is not None:
+        target_pieces = target_path.split('/')
+        import_profile = target_pieces[2] == profile
+
+    return import_profile
@@ -0,0 +1,97 @@
+# on-disk record of bulk import jobs (json), so that a rerun after the script
+# or the repository stopped skips the jobs that already succeeded and retries
+# the ones that failed or were interrupted.
+
+import json
+import os
+import threading
+import time
+
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+def jobKey(job):
+    return job['sourceDirectory'] + ' -> ' + job['targetPath']
+
+
+def _timestamp(t=None):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(t or time.time()))
+
+
+#############################################
+class BulkImportLedger:
+    ######################################
+    # constructor
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.jobs = {}
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                self.jobs = json.load(f).get('jobs', {})
+
+        # a job still running when the last run stopped was interrupted
+        for entry in self.jobs.values():
+            if entry['state'] == RUNNING:
+                entry['state'] = FAILED
+                entry['exception'] = 'interrupted'
+
+    ######################################
+    def get(self, job):
+        return self.jobs.get(jobKey(job))
+
+    def isCompleted(self, job):
+        entry = self.get(job)
+        return entry is not None and entry['state'] == SUCCEEDED
+
+    # jobs not yet succeeded, in their original order
+    def pending(self, jobs):
+        return [job for job in jobs if not self.isCompleted(job)]
+
+    def start(self, job, node=None):
+        with self.lock:
+            entry = self.jobs.setdefault(jobKey(job), {'sourceDirectory': job['sourceDirectory'],
+                                                       'targetPath': job['targetPath'], 'attempts': 0,
+                                                       'history': []})
+            entry.update({'state': RUNNING, 'node': node, 'startedAt': _timestamp(), 'finishedAt': None,
+                          'exception': ''})
+            entry['attempts'] += 1
+            entry['started'] = time.time()
+            self._save()
+
+    # record the final bulk import status of a job
+    def finish(self, job, status):
+        with self.lock:
+            entry = self.jobs[jobKey(job)]
+            succeeded = (status.get('lastResult') or '').lower() == 'succeeded'
+            seconds = round(time.time() - entry.pop('started', time.time()), 1)
+            entry.update({'state': SUCCEEDED if succeeded else FAILED, 'finishedAt': _timestamp(),
+                          'seconds': seconds, 'durationInNS': status.get('durationInNS', ''),
+                          'totalNodesWritten': status.get('totalNodesWritten', 0),
+                          'nodesPerSecond': status.get('nodesPerSecond', ''),
+                          'targetStatistics': status.get('targetStatistics', {}),
+                          'exception': '' if succeeded else (status.get('exception') or
+                                                             status.get('lastResult') or 'unknown')})
+            entry['history'].append(dict((k, entry[k]) for k in ('startedAt', 'finishedAt', 'node', 'state',
+                                                                  'seconds', 'totalNodesWritten', 'exception')))
+            self._save()
+            return succeeded
+
+    # nodes per second over all succeeded jobs, or None without history
+    def averageNodesPerSecond(self):
+        nodes = 0
+        seconds = 0.0
+        for entry in self.jobs.values():
+            if entry['state'] == SUCCEEDED and entry.get('seconds'):
+                nodes += entry.get('totalNodesWritten') or 0
+                seconds += entry['seconds']
+        return nodes / seconds if seconds > 0 and nodes > 0 else None
+
+    # write to a temporary file and rename, so the ledger is never half written
+    def _save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'jobs': self.jobs}, f, indent=2, sort_keys=True)
+        os.rename(tmp, self.path)
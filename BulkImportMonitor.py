@@ -0,0 +1,157 @@
+# monitor a running bulk import: poll status.xml with an interval that adapts
+# to the progress of the import, report instantaneous and average throughput
+# and an ETA, and record every poll as a time series (csv or json lines).
+
+import csv
+import json
+import logging
+import os
+import time
+
+METADATA_SUFFIX = '.metadata.properties.xml'
+
+# TargetStatistics counted as nodes written, as in AcsClient._calculate_total_nodes_written
+NODE_STATISTICS = ['SpaceNodesCreated', 'SpaceNodesReplaced', 'ContentNodesCreated', 'ContentNodesReplaced',
+                   'ContentVersionsCreated']
+
+SAMPLE_FIELDS = ['job', 'time', 'elapsed', 'status', 'nodes', 'bytes', 'nodesPerSecond', 'bytesPerSecond',
+                 'avgNodesPerSecond', 'avgBytesPerSecond', 'expectedNodes', 'etaSeconds', 'interval']
+
+
+#############################################
+# count the nodes (folders and content files) and content bytes below a bulk
+# import source directory. shadow metadata files are not nodes.
+def countImportSource(sourceDirectory):
+    nodes = 0
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(sourceDirectory, followlinks=True):
+        nodes += len(dirnames)
+        for f in filenames:
+            if not f.endswith(METADATA_SUFFIX):
+                nodes += 1
+                try:
+                    size += os.path.getsize(os.path.join(dirpath, f))
+                except OSError:
+                    pass  # broken link, reported by the import
+    return nodes, size
+
+
+def formatDuration(seconds):
+    seconds = int(seconds)
+    return '%d:%02d:%02d' % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+#############################################
+class BulkImportMonitor:
+    ######################################
+    # constructor
+    # out: optional .csv file, otherwise json lines, that every poll is appended to
+    def __init__(self, acsClient, minInterval=1.0, maxInterval=30.0, out=None, collapseRatio=0.25):
+        self.acsClient = acsClient
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.out = out
+        self.collapseRatio = collapseRatio
+        self.samples = []
+
+    ######################################
+    # poll until the repository reports Idle and return the final status.
+    # expectedNodes, e.g. from countImportSource, enables the ETA.
+    def wait(self, job='', expectedNodes=None):
+        start = time.time()
+        interval = self.minInterval
+        previous = None
+        avgNodesPerSecond = 0.0
+
+        status = self.acsClient.getBulkImportStatus()
+        while True:
+            sample = self._sample(job, start, status, previous, expectedNodes, interval)
+            self._record(sample)
+            if status['currentStatus'].lower() == 'idle':
+                return status
+
+            self._report(sample, expectedNodes, avgNodesPerSecond)
+            avgNodesPerSecond = sample['avgNodesPerSecond']
+            interval = self._nextInterval(interval, sample, previous)
+            previous = sample
+            time.sleep(interval)
+            status = self.acsClient.getBulkImportStatus()
+
+    # record and report a status polled elsewhere, e.g. by the BulkImportScheduler of a cluster.
+    # previous: the sample returned for the same job the last time, None on its first poll
+    def observe(self, job, start, status, previous=None, expectedNodes=None, interval=0.0):
+        sample = self._sample(job, start, status, previous, expectedNodes, interval)
+        self._record(sample)
+        if status['currentStatus'].lower() != 'idle':
+            self._report(sample, expectedNodes, previous['avgNodesPerSecond'] if previous else 0.0)
+        return sample
+
+    # shorter polls while nodes are being written and the end is near,
+    # backing off while nothing changes
+    def _nextInterval(self, interval, sample, previous):
+        if previous is not None and sample['nodes'] == previous['nodes']:
+            interval = interval * 2
+        elif sample['etaSeconds'] is not None:
+            interval = sample['etaSeconds'] / 10.0
+        else:
+            interval = interval * 1.5
+        return max(self.minInterval, min(self.maxInterval, interval))
+
+    def _sample(self, job, start, status, previous, expectedNodes, interval):
+        now = time.time()
+        stats = status.get('targetStatistics') or {}
+        nodes = sum(stats.get(name, 0) for name in NODE_STATISTICS)
+        size = stats.get('ContentBytesWritten', 0)
+
+        # average over the server side duration when it is known
+        elapsed = now - start
+        try:
+            elapsed = int(status['durationInNS']) / 1e9 or elapsed
+        except (KeyError, ValueError):
+            pass
+
+        sample = {'job': job, 'time': now, 'elapsed': round(elapsed, 3), 'status': status['currentStatus'],
+                  'nodes': nodes, 'bytes': size, 'nodesPerSecond': 0.0, 'bytesPerSecond': 0.0,
+                  'avgNodesPerSecond': round(nodes / elapsed, 2) if elapsed > 0 else 0.0,
+                  'avgBytesPerSecond': round(size / elapsed, 2) if elapsed > 0 else 0.0,
+                  'expectedNodes': expectedNodes, 'etaSeconds': None, 'interval': round(interval, 3)}
+        if previous is not None and now > previous['time']:
+            delta = now - previous['time']
+            sample['nodesPerSecond'] = round((nodes - previous['nodes']) / delta, 2)
+            sample['bytesPerSecond'] = round((size - previous['bytes']) / delta, 2)
+        if expectedNodes and sample['avgNodesPerSecond'] > 0:
+            sample['etaSeconds'] = round(max(0, expectedNodes - nodes) / sample['avgNodesPerSecond'], 1)
+        return sample
+
+    def _report(self, sample, expectedNodes, previousAvg):
+        message = '  ' + sample['job'] + ': ' + str(sample['nodes'])
+        if expectedNodes:
+            message += '/' + str(expectedNodes) + ' nodes (' + str(round(100.0 * sample['nodes'] / expectedNodes, 1)) + '%)'
+        else:
+            message += ' nodes'
+        message += ', ' + str(sample['nodesPerSecond']) + ' nodes/s (avg ' + str(sample['avgNodesPerSecond']) + ')'
+        message += ', ' + str(round(sample['bytesPerSecond'] / 1048576.0, 2)) + ' MB/s'
+        if sample['etaSeconds'] is not None:
+            message += ', ETA ' + formatDuration(sample['etaSeconds'])
+        logging.info(message)
+
+        if previousAvg > 0 and 0 <= sample['nodesPerSecond'] < self.collapseRatio * previousAvg and \
+                len(self.samples) > 3:
+            logging.warning('  throughput dropped to ' + str(sample['nodesPerSecond']) + ' nodes/s (avg ' +
+                            str(previousAvg) + ')')
+
+    def _record(self, sample):
+        self.samples.append(sample)
+        if not self.out:
+            return
+
+        isCsv = self.out.lower().endswith('.csv')
+        writeHeader = isCsv and not (os.path.isfile(self.out) and os.path.getsize(self.out) > 0)
+        with open(self.out, 'a') as f:
+            if isCsv:
+                writer = csv.DictWriter(f, SAMPLE_FIELDS)
+                if writeHeader:
+                    writer.writeheader()
+                writer.writerow(sample)
+            else:
+                f.write(json.dumps(sample, sort_keys=True) + '\n')
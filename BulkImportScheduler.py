@@ -0,0 +1,177 @@
+# run bulk import jobs on several repository nodes of a cluster at once.
+# each node runs one import at a time; the largest jobs are dispatched first
+# to whichever node is idle, so the nodes finish at about the same time.
+
+import logging
+import time
+
+from BulkImportTuner import jobSettings
+
+
+#############################################
+class BulkImportScheduler:
+    ######################################
+    # constructor
+    # clients: one AcsClient per repository node
+    # ledger: optional BulkImportLedger recording every attempt
+    # maxRetries: times a failed job is queued again
+    # retryDelay: seconds before a failed job is queued again, doubled for each further retry
+    # tuner: optional BulkImportTuner choosing batchSize and numThreads per job
+    # maxWait: seconds without any idle node after which the jobs not started fail
+    # monitor: optional BulkImportMonitor recording and reporting every poll of a running job
+    def __init__(self, clients, pollInterval=5.0, ledger=None, maxRetries=0, tuner=None, retryDelay=60,
+                 maxWait=3600, monitor=None):
+        self.clients = clients
+        self.pollInterval = pollInterval
+        self.maxWait = maxWait
+        self.ledger = ledger
+        self.maxRetries = maxRetries
+        self.retryDelay = retryDelay
+        self.tuner = tuner
+        self.monitor = monitor
+
+    ######################################
+    # jobs: list of {"sourceDirectory": ..., "targetPath": ..., "nodes": <pre-scanned size>}
+    # returns one result per job, in completion order
+    def run(self, jobs):
+        queue = sorted(jobs, key=lambda job: -(job.get('nodes') or 0))
+        workers = [{'client': c, 'job': None, 'start': None, 'available': True} for c in self.clients]
+        startFailures = {}
+        attempts = {}
+        # (time, job) of the failed jobs waiting to be retried
+        retries = []
+        results = []
+        start = time.time()
+        waitStart = None
+
+        while queue or retries or any(w['job'] for w in workers):
+            now = time.time()
+            for retry in [r for r in retries if r[0] <= now]:
+                retries.remove(retry)
+                queue.append(retry[1])
+
+            for worker in workers:
+                if queue and worker['available'] and not worker['job']:
+                    job = queue.pop(0)
+                    if self._start(worker, job):
+                        continue
+                    if self._busy(worker):
+                        # refused by a node running an import started elsewhere: tried again once a node is idle
+                        queue.insert(0, job)
+                        continue
+                    # refused by an idle node: the job itself cannot be started
+                    key = (job['sourceDirectory'], job['targetPath'])
+                    startFailures[key] = startFailures.get(key, 0) + 1
+                    if startFailures[key] < len(workers):
+                        queue.insert(0, job)
+                    else:
+                        results.append(self._result(job, None, {'lastResult': 'Failed',
+                                                                'exception': 'could not be started on any node'}))
+
+            if (queue or retries) and not any(w['job'] or w['available'] for w in workers):
+                # every node is running an import started elsewhere
+                waitStart = waitStart or time.time()
+                if time.time() - waitStart > self.maxWait:
+                    exception = 'no repository node became idle in ' + str(self.maxWait) + ' seconds'
+                    logging.error(exception + ', ' + str(len(queue) + len(retries)) + ' job(s) not started')
+                    for job in queue + [r[1] for r in retries]:
+                        results.append(self._result(job, None, {'lastResult': 'Failed', 'exception': exception}))
+                    del queue[:]
+                    del retries[:]
+                    break
+                logging.info('waiting for a repository node to become idle')
+            else:
+                waitStart = None
+
+            time.sleep(self.pollInterval)
+            for worker in workers:
+                self._poll(worker, results, attempts, retries)
+
+        logging.info('Imported ' + str(len(results)) + ' job(s) on ' + str(len(workers)) + ' node(s) in ' +
+                     str(round(time.time() - start, 1)) + ' seconds')
+        return results
+
+    def _start(self, worker, job):
+        client = worker['client']
+        logging.info('[' + client.urlbase + '] Uploading content from ' + job['sourceDirectory'] + ' to ' +
+                     job['targetPath'] + ' (' + str(job.get('nodes') or '?') + ' nodes)')
+        settings = self.tuner.settingsFor(job) if self.tuner else jobSettings(job)
+        try:
+            client.startBulkImport(job['sourceDirectory'], job['targetPath'], settings['batchSize'],
+                                   settings['numThreads'])
+        except Exception as ex:
+            logging.warning('[' + client.urlbase + '] could not start import: ' + str(ex))
+            if self.tuner:
+                self.tuner.putBack(settings)
+            worker['available'] = False
+            return False
+        worker['job'] = job
+        worker['start'] = time.time()
+        worker['settings'] = settings
+        worker['sample'] = None
+        if self.ledger:
+            self.ledger.start(job, client.urlbase)
+        return True
+
+    # whether a node is running an import, e.g. one started elsewhere
+    @staticmethod
+    def _busy(worker):
+        try:
+            return worker['client'].getBulkImportStatus()['currentStatus'].lower() != 'idle'
+        except Exception:
+            return False
+
+    def _poll(self, worker, results, attempts, retries):
+        client = worker['client']
+        try:
+            status = client.getBulkImportStatus()
+        except Exception as ex:
+            logging.warning('[' + client.urlbase + '] status unavailable: ' + str(ex))
+            return
+
+        idle = status['currentStatus'].lower() == 'idle'
+        job = worker['job']
+        if not job:
+            worker['available'] = idle
+            return
+        if self.monitor:
+            name = '[' + client.urlbase + '] ' + job.get('name', job['sourceDirectory'])
+            worker['sample'] = self.monitor.observe(name, worker['start'], status, worker['sample'], job.get('nodes'),
+                                                    self.pollInterval)
+        if not idle:
+            if not self.monitor:
+                progress = str(status.get('totalNodesWritten', 0))
+                if job.get('nodes'):
+                    progress += '/' + str(job['nodes'])
+                logging.info('[' + client.urlbase + '] ' + job['sourceDirectory'] + ': ' + progress + ' nodes')
+        else:
+            result = self._result(job, worker, status)
+            results.append(result)
+            if self.ledger:
+                self.ledger.finish(job, status)
+            if self.tuner:
+                self.tuner.record(worker['settings'], status)
+            if result['lastResult'].lower() == 'succeeded':
+                logging.info('[' + client.urlbase + '] Uploaded content from ' + job['sourceDirectory'] + ' to ' +
+                             job['targetPath'] + ' in ' + str(result['seconds']) + ' seconds, ' +
+                             str(result['nodesPerSecond']) + ' nodes/s')
+            else:
+                logging.error('[' + client.urlbase + '] Failed to upload content from ' + job['sourceDirectory'] +
+                              ' to ' + job['targetPath'] + ': ' + result['exception'])
+                key = (job['sourceDirectory'], job['targetPath'])
+                attempts[key] = attempts.get(key, 0) + 1
+                if attempts[key] <= self.maxRetries:
+                    delay = self.retryDelay * 2 ** (attempts[key] - 1)
+                    logging.info('Retrying ' + job['sourceDirectory'] + ' in ' + str(delay) + ' seconds')
+                    retries.append((time.time() + delay, job))
+            worker['job'] = None
+            worker['start'] = None
+
+    def _result(self, job, worker, status):
+        return {'sourceDirectory': job['sourceDirectory'], 'targetPath': job['targetPath'],
+                'node': worker['client'].urlbase if worker else None,
+                'seconds': round(time.time() - worker['start'], 1) if worker else 0,
+                'lastResult': status.get('lastResult') or '', 'durationInNS': status.get('durationInNS', ''),
+                'nodesPerSecond': status.get('nodesPerSecond', ''),
+                'totalNodesWritten': status.get('totalNodesWritten', 0),
+                'exception': status.get('exception') or ''}
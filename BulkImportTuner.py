@@ -0,0 +1,125 @@
+# pick the bulk import batchSize and numThreads for a repository: the first
+# jobs of a run each try one setting of a small grid, the nodes per second of
+# each trial is measured from TargetStatistics, and the remaining jobs use the
+# fastest setting. the best setting is saved per repository url (json), so
+# later runs start from it.
+
+import json
+import logging
+import os
+import threading
+import time
+
+DEFAULT_SETTINGS = {'batchSize': 20, 'numThreads': 10}
+DEFAULT_GRID = [(20, 4), (20, 10), (50, 10), (100, 10), (50, 20)]
+
+
+# parse '20x4,50x10' into [(20, 4), (50, 10)]
+def parseGrid(text):
+    grid = []
+    for item in text.split(','):
+        batchSize, numThreads = item.strip().lower().split('x')
+        grid.append((int(batchSize), int(numThreads)))
+    return grid
+
+
+# batchSize and numThreads set on a job, completed from defaults
+def jobSettings(job, defaults=None):
+    defaults = defaults or DEFAULT_SETTINGS
+    return {'batchSize': job.get('batchSize') or defaults['batchSize'],
+            'numThreads': job.get('numThreads') or defaults['numThreads']}
+
+
+def _nodesPerSecond(status):
+    try:
+        seconds = int(status.get('durationInNS') or 0) / 1e9
+    except ValueError:
+        return 0.0
+    return status.get('totalNodesWritten', 0) / seconds if seconds > 0 else 0.0
+
+
+#############################################
+class BulkImportTuner:
+    ######################################
+    # constructor
+    # path: tuning file shared by all repositories, keyed by url
+    # grid: (batchSize, numThreads) settings to try, None to only use saved settings
+    # defaults: settings used when none are saved for the url
+    def __init__(self, path, url, grid=None, defaults=None):
+        self.path = path
+        self.url = url
+        self.grid = list(grid or [])
+        self.defaults = dict(DEFAULT_SETTINGS, **(defaults or {}))
+        self.trials = []
+        self.lock = threading.Lock()
+        self.saved = {}
+        if path and os.path.isfile(path):
+            with open(path, 'r') as f:
+                self.saved = json.load(f)
+
+    ######################################
+    # settings for the next job: an untried grid setting while tuning,
+    # otherwise the best known setting
+    def next(self):
+        with self.lock:
+            if self.grid:
+                batchSize, numThreads = self.grid.pop(0)
+                settings = {'batchSize': batchSize, 'numThreads': numThreads, 'trial': True}
+                logging.info('Tuning bulk import with batchSize ' + str(batchSize) + ', numThreads ' +
+                             str(numThreads))
+                return settings
+            return dict(self.best())
+
+    # settings for a job: batchSize and numThreads set on the job itself (e.g. in
+    # its bulk import conf entry) are used as they are, otherwise next()
+    def settingsFor(self, job):
+        if job.get('batchSize') or job.get('numThreads'):
+            return jobSettings(job, self.best())
+        return self.next()
+
+    # return the settings of a job that could not be started, e.g. by a busy node,
+    # so that its grid setting is tried by the next job instead of being lost
+    def putBack(self, settings):
+        if not settings.get('trial'):
+            return
+        with self.lock:
+            self.grid.insert(0, (settings['batchSize'], settings['numThreads']))
+
+    # the fastest setting tried in this run, or the saved one for the url
+    def best(self):
+        measured = [t for t in self.trials if t['nodesPerSecond'] > 0]
+        if measured:
+            best = max(measured, key=lambda t: t['nodesPerSecond'])
+            return {'batchSize': best['batchSize'], 'numThreads': best['numThreads']}
+        saved = self.saved.get(self.url)
+        if saved:
+            return {'batchSize': saved['batchSize'], 'numThreads': saved['numThreads']}
+        return dict(self.defaults)
+
+    # record the final status of a job run with settings from next()
+    def record(self, settings, status):
+        if not settings.get('trial'):
+            return
+        succeeded = (status.get('lastResult') or '').lower() == 'succeeded'
+        with self.lock:
+            self.trials.append({'batchSize': settings['batchSize'], 'numThreads': settings['numThreads'],
+                                'nodes': status.get('totalNodesWritten', 0),
+                                'nodesPerSecond': round(_nodesPerSecond(status), 2) if succeeded else 0.0})
+            logging.info('  ' + str(self.trials[-1]['nodesPerSecond']) + ' nodes/s with batchSize ' +
+                         str(settings['batchSize']) + ', numThreads ' + str(settings['numThreads']))
+            if not self.grid:
+                self._save()
+
+    def _save(self):
+        measured = [t for t in self.trials if t['nodesPerSecond'] > 0]
+        if not self.path or not measured:
+            return
+        best = self.best()
+        logging.info('Best bulk import setting for ' + self.url + ': batchSize ' + str(best['batchSize']) +
+                     ', numThreads ' + str(best['numThreads']))
+        self.saved[self.url] = dict(best, trials=self.trials,
+                                    updatedAt=time.strftime('%Y-%m-%dT%H:%M:%S'))
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.saved, f, indent=2, sort_keys=True)
+        os.rename(tmp, self.path)
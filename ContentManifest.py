@@ -0,0 +1,181 @@
+# manifest of the primary (content) file of every migrated document: source
+# path, where it goes in the bulk import tree, its name in the repository, size, mtime, sha256, the
+# mimetype guessed from the name and the type found in the first bytes, and a
+# status: ok, missing (cannot be read) or duplicate (byte-identical to the
+# content of an earlier document, or the same file: duplicateOf).
+#
+# files are hashed on a pool of threads with large sequential reads; hashlib
+# releases the GIL while hashing. the manifest is a csv file, read again by the
+# next run: a source with the same size and mtime keeps its checksum without
+# being read again.
+
+import csv
+import hashlib
+import itertools
+import logging
+import mimetypes
+import os
+import threading
+import time
+
+import util
+
+# bytes read at a time while hashing
+READ_SIZE = 4 * 1024 * 1024
+
+FIELDS = ['seqno', 'dID', 'source', 'output', 'name', 'size', 'mtime', 'sha256', 'mimetype', 'detectedType', 'status',
+          'duplicateOf']
+
+# leading bytes of the content types found in the wcc archives
+MAGIC = [(b'%PDF', 'application/pdf'), (b'II*\x00', 'image/tiff'), (b'MM\x00*', 'image/tiff'),
+         (b'\x89PNG', 'image/png'), (b'\xff\xd8\xff', 'image/jpeg'), (b'GIF8', 'image/gif'),
+         (b'PK\x03\x04', 'application/zip'), (b'\xd0\xcf\x11\xe0', 'application/x-ole-storage'),
+         (b'{\\rtf', 'application/rtf'), (b'<?xml', 'application/xml')]
+
+
+def detectType(head):
+    for magic, mimetype in MAGIC:
+        if head.startswith(magic):
+            return mimetype
+    return ''
+
+
+#############################################
+# size, mtime, sha256 and detected type of a file, or None when it cannot be read
+def checksumFile(path, readSize=READ_SIZE):
+    try:
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            sha = hashlib.sha256()
+            buf = bytearray(readSize)
+            view = memoryview(buf)
+            head = b''
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                if not head:
+                    head = bytes(view[:16])
+                sha.update(view[:n])
+        return {'size': st.st_size, 'mtime': repr(st.st_mtime), 'sha256': sha.hexdigest(),
+                'detectedType': detectType(head)}
+    except (IOError, OSError) as ex:
+        logging.debug('cannot read ' + path + ': ' + str(ex))
+        return None
+
+
+#############################################
+class ContentManifest:
+    ######################################
+    # constructor
+    # path: csv file, loaded when it exists and written by save
+    def __init__(self, path, workers=8):
+        self.path = path
+        self.workers = workers
+        self.lock = threading.Lock()
+        # rows by seqno
+        self.sequences = {}
+        self.stats = {'hashed': 0, 'reused': 0, 'bytes': 0}
+        if path and os.path.isfile(path):
+            with open(path, 'r') as f:
+                for row in csv.DictReader(f):
+                    self.sequences.setdefault(row['seqno'], []).append(row)
+        # checksums of the last run, by source
+        self.previous = dict((row['source'], row) for row in self.rows() if row['sha256'])
+
+    # rows in sequence order, so that the first of duplicates is the earliest document
+    def rows(self):
+        seqnos = sorted(self.sequences, key=lambda seqno: int(seqno) if seqno.isdigit() else -1)
+        return itertools.chain(*[self.sequences[seqno] for seqno in seqnos])
+
+    # the recorded checksum of source, if the file is unchanged since
+    def _reuse(self, source):
+        row = self.previous.get(source)
+        if not row:
+            return None
+        try:
+            st = os.stat(source)
+        except OSError:
+            return None
+        if str(st.st_size) == row['size'] and repr(st.st_mtime) == row['mtime']:
+            return {'size': st.st_size, 'mtime': row['mtime'], 'sha256': row['sha256'],
+                    'detectedType': row['detectedType']}
+        return None
+
+    def _checksum(self, source):
+        result = self._reuse(source)
+        if result is not None:
+            with self.lock:
+                self.stats['reused'] += 1
+            return result
+        result = checksumFile(source)
+        if result:
+            with self.lock:
+                self.stats['hashed'] += 1
+                self.stats['bytes'] += result['size']
+        return result
+
+    ######################################
+    # hash the content of the documents of a sequence, replacing what an earlier
+    # run recorded for it. documents: dicts with dID, source, output and name
+    def addDocuments(self, seqno, documents):
+        start = time.time()
+        results = util.parallel_map(lambda d: self._checksum(d['source']), documents, self.workers)
+        self.sequences.pop(seqno, None)
+        rows = self.sequences[seqno] = []
+        missing = 0
+        for document, result in zip(documents, results):
+            row = dict.fromkeys(FIELDS, '')
+            row.update({'seqno': seqno, 'dID': document['dID'], 'source': document['source'],
+                        'output': document['output'], 'name': document.get('name', ''),
+                        'mimetype': mimetypes.guess_type(document['source'])[0] or ''})
+            if result:
+                row.update(result)
+                row['status'] = 'ok'
+            else:
+                row['status'] = 'missing'
+                missing += 1
+                logging.warn('  missing content of document ' + str(document['dID']) + ': ' + document['source'])
+            rows.append(row)
+        logging.info('  manifest: ' + str(len(documents)) + ' content file(s), ' + str(missing) + ' missing, in ' +
+                     str(round(time.time() - start, 2)) + ' seconds')
+        return missing
+
+    # mark the documents whose content is byte-identical to that of an earlier one
+    def _markDuplicates(self):
+        first = {}
+        for row in self.rows():
+            if row['status'] == 'missing':
+                continue
+            key = (str(row['size']), row['sha256'])
+            if key in first:
+                row['status'] = 'duplicate'
+                row['duplicateOf'] = first[key]
+            else:
+                first.setdefault(key, row['source'])
+                row['status'] = 'ok'
+                row['duplicateOf'] = ''
+
+    def summary(self):
+        counts = {'documents': 0, 'ok': 0, 'missing': 0, 'duplicate': 0}
+        for row in self.rows():
+            counts['documents'] += 1
+            counts[row['status']] += 1
+        counts.update(self.stats)
+        return counts
+
+    # write the manifest (atomically) and return the summary
+    def save(self):
+        self._markDuplicates()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            writer = csv.DictWriter(f, FIELDS)
+            writer.writeheader()
+            writer.writerows(self.rows())
+        os.rename(tmp, self.path)
+        summary = self.summary()
+        logging.info('manifest ' + self.path + ': ' + str(summary['documents']) + ' document(s), ' +
+                     str(summary['missing']) + ' missing, ' + str(summary['duplicate']) + ' duplicate(s); ' +
+                     str(summary['hashed']) + ' file(s) hashed (' + str(summary['bytes']) + ' bytes), ' +
+                     str(summary['reused']) + ' unchanged')
+        return summary
@@ -0,0 +1,213 @@
+import csv
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from xml.etree import ElementTree
+
+import migrate
+from ContentManifest import ContentManifest
+from SequenceArchive import SequenceArchive, archiveFile, readIndex, unpackArchive
+
+CONTENT_MODELS = """common:
+  aspects: ['cm:author']
+  fields:
+    - {name: 'cm:name', source_field: hdaName}
+    - {name: 'cm:title', source_field: hdaTitle}
+  record_fields: []
+content_models:
+  - {profile: P1, content_type: 'my:doc', fields: []}
+"""
+
+HDA_FIELDS = ['dID', 'hdaName', 'hdaTitle', 'primaryFile', 'dDocAccount', 'dDocCreatedDate', 'xIdcProfile',
+              'xuwScanDate']
+
+
+# wcc export below origin: origin/batch/export~<seqno>.hda and the content in origin/<seqno>/
+def writeWccExport(origin, sequences, documents):
+    os.makedirs(os.path.join(origin, 'batch'))
+    for seqno in range(1, sequences + 1):
+        lines = ['@Properties LocalData', 'blFieldTypes=dDocCreatedDate date,xuwScanDate date',
+                 "blDateFormat='{ts' ''yyyy-MM-dd HH:mm:ss{.SSS}[Z]'''}'!tAmerica/Los_Angeles",
+                 'NumRows=' + str(documents), '@end', '@ResultSet ExportResults', str(len(HDA_FIELDS))]
+        lines += [f + ' 6 0' for f in HDA_FIELDS]
+        os.makedirs(os.path.join(origin, str(seqno)))
+        for i in range(documents):
+            name = 'doc' + str(seqno) + '_' + str(i) + '.pdf'
+            with open(os.path.join(origin, str(seqno), name), 'w') as f:
+                f.write('%PDF ' + name)
+            lines += [str(seqno * 100 + i), name, 'title', str(seqno) + '/' + name, 'acct',
+                      "{ts '2018-02-01 10:00:00.000'}", 'P1', "{ts '2018-02-01 10:00:00.000'}"]
+        lines.append('@end')
+        with open(os.path.join(origin, 'batch', 'export~' + str(seqno) + '.hda'), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+    with open(os.path.join(origin, 'content_models.yml'), 'w') as f:
+        f.write(CONTENT_MODELS)
+
+
+class MigrateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.origin = os.path.join(self.directory, 'wcc')
+        self.output = os.path.join(self.directory, 'out')
+        writeWccExport(self.origin, 2, 3)
+        # names already given, kept by migrate across translations
+        migrate.name_field_value_count.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def translate(self, on_sequence_complete=None, **kwargs):
+        translator = migrate.HdaTranslator(os.path.join(self.origin, 'content_models.yml'), 'P1', None,
+                                           os.path.join(self.origin, 'batch'), None, False, self.output, False,
+                                           0, 0, None, on_sequence_complete=on_sequence_complete, **kwargs)
+        translator.run()
+        return translator
+
+    def testTranslate(self):
+        completed = []
+        self.translate(lambda seqno, output: completed.append(seqno))
+        self.assertEqual(completed, ['1', '2'])
+        self.assertTrue(os.path.isfile(migrate.sequence_complete_file(self.output, '2')))
+        metadata = os.path.join(self.output, '1', 'acct', '2018', '2', '1', 'doc1_0.pdf.metadata.properties.xml')
+        with open(metadata, 'rb') as f:
+            content = f.read()
+        # the DOCTYPE goes before the root element, after the xml declaration if there is one
+        doctype = content.index(b'<!DOCTYPE properties')
+        self.assertTrue(doctype < content.index(b'<properties>'))
+        self.assertEqual(content[:doctype].strip(b'\n').count(b'\n'), 0)
+        self.assertEqual(ElementTree.parse(metadata).getroot().find("entry[@key='cm:name']").text, 'doc1_0.pdf')
+
+    def testSkipCompletedSequences(self):
+        self.translate()
+        marker = migrate.sequence_complete_file(self.output, '1')
+        with open(marker) as f:
+            completedAt = f.read()
+        shutil.rmtree(os.path.join(self.output, '1', 'acct'))
+
+        completed = []
+        self.translate(lambda seqno, output: completed.append(seqno), skip_seqnos=['1'])
+        self.assertEqual(completed, ['2'])
+        with open(marker) as f:
+            self.assertEqual(f.read(), completedAt)
+        self.assertFalse(os.path.exists(os.path.join(self.output, '1', 'acct')))
+
+    def testManifest(self):
+        path = os.path.join(self.directory, 'manifest.csv')
+        self.translate(manifest=ContentManifest(path, workers=2)).manifest.save()
+        with open(path) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([(r['seqno'], r['dID'], r['status'], r['mimetype'], r['detectedType']) for r in rows[:2]],
+                         [('1', '100', 'ok', 'application/pdf', 'application/pdf'),
+                          ('1', '101', 'ok', 'application/pdf', 'application/pdf')])
+        self.assertEqual(len(rows), 6)
+
+    def manifestDocuments(self, seqno):
+        return [{'dID': str(int(seqno) * 100 + i), 'name': 'doc' + seqno + '_' + str(i) + '.pdf',
+                 'source': os.path.join(self.origin, seqno, 'doc' + seqno + '_' + str(i) + '.pdf'),
+                 'output': os.path.join(self.output, seqno, 'doc' + seqno + '_' + str(i) + '.pdf')}
+                for i in range(3)]
+
+    def testManifestDuplicatesAndMissing(self):
+        shutil.copy(os.path.join(self.origin, '1', 'doc1_0.pdf'), os.path.join(self.origin, '2', 'doc2_1.pdf'))
+        os.remove(os.path.join(self.origin, '2', 'doc2_2.pdf'))
+        manifest = ContentManifest(os.path.join(self.directory, 'manifest.csv'), workers=2)
+        # the later sequence is added first: duplicates are marked in sequence order
+        self.assertEqual(manifest.addDocuments('2', self.manifestDocuments('2')), 1)
+        self.assertEqual(manifest.addDocuments('1', self.manifestDocuments('1')), 0)
+        summary = manifest.save()
+        self.assertEqual((summary['documents'], summary['ok'], summary['duplicate'], summary['missing']), (6, 4, 1, 1))
+
+        rows = dict((r['dID'], r) for r in ContentManifest(manifest.path).rows())
+        self.assertEqual((rows['201']['status'], rows['201']['duplicateOf']),
+                         ('duplicate', os.path.join(self.origin, '1', 'doc1_0.pdf')))
+        self.assertEqual(rows['201']['sha256'], rows['100']['sha256'])
+        self.assertEqual((rows['202']['status'], rows['202']['sha256'], rows['202']['size']), ('missing', '', ''))
+        self.assertEqual(rows['100']['status'], 'ok')
+
+    def testManifestRerun(self):
+        path = os.path.join(self.directory, 'manifest.csv')
+        manifest = ContentManifest(path, workers=2)
+        manifest.addDocuments('1', self.manifestDocuments('1'))
+        self.assertEqual((manifest.save()['hashed'], manifest.stats['reused']), (3, 0))
+
+        # a file of the same size and mtime is not read again, a changed one is
+        changed = os.path.join(self.origin, '1', 'doc1_2.pdf')
+        with open(changed, 'w') as f:
+            f.write('%PDF changed content')
+        st = os.stat(changed)
+        os.utime(changed, (st.st_atime, st.st_mtime + 10))
+        manifest = ContentManifest(path, workers=2)
+        manifest.addDocuments('1', self.manifestDocuments('1'))
+        summary = manifest.save()
+        self.assertEqual((summary['hashed'], summary['reused'], summary['documents']), (1, 2, 3))
+        rows = dict((r['dID'], r) for r in ContentManifest(path).rows())
+        self.assertEqual(rows['102']['size'], str(len('%PDF changed content')))
+
+    def testCopyContentFile(self):
+        src = os.path.join(self.origin, '1', 'doc1_0.pdf')
+        dest = os.path.join(self.directory, 'doc1_0.pdf')
+        copy = migrate.WccFolderConverter.copy_content_file
+        self.assertEqual(copy((src, dest)), ('copied', os.path.getsize(src)))
+        self.assertEqual(copy((src, dest)), ('skipped', 0))
+
+        # a copy cut short by an earlier run is copied again
+        with open(dest, 'w') as f:
+            f.write('%PDF')
+        self.assertEqual(copy((src, dest)), ('copied', os.path.getsize(src)))
+        with open(dest) as f:
+            self.assertEqual(f.read(), '%PDF doc1_0.pdf')
+
+        self.assertEqual(copy((os.path.join(self.origin, 'gone.pdf'), os.path.join(self.directory, 'gone.pdf'))),
+                         ('failed', 0))
+        self.assertEqual(sorted(f for f in os.listdir(self.directory) if f.endswith('.part')), [])
+
+    def testArchiveRoundTrip(self):
+        source = os.path.join(self.origin, '1', 'doc1_0.pdf')
+        for mode, compression in (('dereference', 'gz'), ('reference', 'none')):
+            path = archiveFile(self.directory, 1, compression)
+            archive = SequenceArchive(path, '1', compression, mode == 'dereference')
+            archive.addBytes('1/acct/doc.pdf.metadata.properties.xml', b'<properties/>')
+            archive.addContent('1/acct/doc.pdf', source)
+            archive.addContent('1/acct/gone.pdf', os.path.join(self.origin, 'gone.pdf'))
+            archive.close()
+
+            unpacked = os.path.join(self.directory, mode)
+            stats = unpackArchive(path, unpacked, (self.origin, '/mnt/wcc'))
+            expected = readIndex(path)
+            for kind in ('metadata', 'content', 'link'):
+                self.assertEqual(stats[kind], expected[kind])
+            with open(os.path.join(unpacked, '1', 'acct', 'doc.pdf.metadata.properties.xml'), 'rb') as f:
+                self.assertEqual(f.read(), b'<properties/>')
+            doc = os.path.join(unpacked, '1', 'acct', 'doc.pdf')
+            if mode == 'dereference':
+                self.assertEqual(expected['missing'], 1)
+                with open(doc) as f:
+                    self.assertEqual(f.read(), '%PDF doc1_0.pdf')
+            else:
+                self.assertEqual(os.readlink(doc), '/mnt/wcc/1/doc1_0.pdf')
+
+    def testArchiveEscape(self):
+        path = os.path.join(self.directory, 'evil.tar')
+        outside = os.path.join(self.directory, 'outside')
+        os.makedirs(outside)
+        tar = tarfile.open(path, 'w')
+        link = tarfile.TarInfo('1/a')
+        link.type = tarfile.SYMTYPE
+        link.linkname = outside
+        tar.addfile(link)
+        info = tarfile.TarInfo('1/a/x')
+        info.size = 1
+        tar.addfile(info, io.BytesIO(b'x'))
+        tar.close()
+
+        self.assertRaises(Exception, unpackArchive, path, os.path.join(self.directory, 'unpacked'))
+        self.assertEqual(os.listdir(outside), [])
+
+
+###########################
+# main
+if __name__ == '__main__':
+    unittest.main()
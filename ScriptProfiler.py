@@ -0,0 +1,246 @@
+# profile the main function of a script, switched on with --profile-out DIR:
+# a cProfile of the main thread and of every thread started while it runs
+# (merged into one report), a wall-clock sample of the stacks of every
+# thread (which shows time spent waiting on requests, pools and disk, that a
+# cpu profile does not), and with --profile-memory the top allocation sites
+# (tracemalloc, python 3). every run writes its reports to a directory of its
+# own below DIR; wallclock.collapsed is in the collapsed stack format read by
+# flamegraph.pl and speedscope.
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+# cProfile, pstats and tracemalloc are imported by ScriptProfiler.run, so that
+# the scripts pay for them only when profiling
+
+DEFAULT_INTERVAL = 0.01
+
+# frames of this module are left out of the sampled stacks
+_MODULE_FILE = os.path.splitext(os.path.abspath(__file__))[0]
+
+# lines of the text reports
+TOP = 40
+
+
+#############################################
+# add the profiling options to the argument parser of a script, for --help;
+# they are read by profileMain before the script parses its arguments
+def addArguments(parser):
+    parser.add_argument('--profile-out', metavar='DIR',
+                        help='profile the run and write the reports to a new directory below DIR')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='with --profile-out, also report the top allocation sites (python 3)')
+    parser.add_argument('--profile-interval', type=float, default=DEFAULT_INTERVAL,
+                        help='with --profile-out, seconds between wall-clock stack samples')
+
+
+# value of an option given as '--name value' or '--name=value', or None
+def _option(argv, name):
+    for i, arg in enumerate(argv):
+        if arg == name and i + 1 < len(argv):
+            return argv[i + 1]
+        if arg.startswith(name + '='):
+            return arg[len(name) + 1:]
+    return None
+
+
+#############################################
+# run main, under the profiler when the command line has --profile-out
+def profileMain(main, argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    outDir = _option(argv, '--profile-out')
+    if not outDir:
+        return main()
+    name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    profiler = ScriptProfiler(outDir, name, memory='--profile-memory' in argv,
+                              interval=float(_option(argv, '--profile-interval') or DEFAULT_INTERVAL))
+    return profiler.run(main)
+
+
+# 'function (file:line)' of a frame, the same for every call of the function
+def _frameName(frame):
+    code = frame.f_code
+    return code.co_name + ' (' + os.path.basename(code.co_filename) + ':' + str(code.co_firstlineno) + ')'
+
+
+#############################################
+class StackSampler(threading.Thread):
+    ######################################
+    # constructor
+    # interval: seconds between samples of the stacks of every other thread
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        threading.Thread.__init__(self, name='stack-sampler')
+        self.daemon = True
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        own = threading.current_thread().ident
+        while not self.stopped.wait(self.interval):
+            names = dict((t.ident, t.name) for t in threading.enumerate())
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    if os.path.splitext(frame.f_code.co_filename)[0] != _MODULE_FILE:
+                        stack.append(_frameName(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, 'thread-' + str(ident)))
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    ######################################
+    # reports
+    # one 'thread;outer;...;inner count' line per distinct stack
+    def writeCollapsed(self, path):
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(stack + ' ' + str(count) + '\n')
+
+    # functions by samples on top of the stack (self) and anywhere in it (total)
+    def writeTop(self, path):
+        selfCounts = {}
+        totalCounts = {}
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')[1:]
+            if frames:
+                selfCounts[frames[-1]] = selfCounts.get(frames[-1], 0) + count
+            for frame in set(frames):
+                totalCounts[frame] = totalCounts.get(frame, 0) + count
+
+        with open(path, 'w') as f:
+            f.write(str(self.samples) + ' sample(s) every ' + str(self.interval) + ' seconds, all threads\n')
+            for title, counts in (('self', selfCounts), ('total', totalCounts)):
+                f.write('\n%10s  %s\n' % (title, 'function'))
+                for frame, count in sorted(counts.items(), key=lambda c: -c[1])[:TOP]:
+                    f.write('%10d  %s\n' % (count, frame))
+
+
+#############################################
+class ScriptProfiler:
+    ######################################
+    # constructor
+    # outDir: directory of the run directories; name: of the script, for the run directory
+    def __init__(self, outDir, name, memory=False, interval=DEFAULT_INTERVAL):
+        self.outDir = outDir
+        self.name = name
+        self.memory = memory
+        self.interval = interval
+        self.runDir = None
+        self.lock = threading.Lock()
+        self.threadProfiles = []
+        self.profile = None
+
+    # profile hook of the threads started while profiling: on its first event, the thread starts a profiler of
+    # its own, which replaces the hook
+    def _profileThread(self, frame, event, arg):
+        sys.setprofile(None)
+        cpu = self.profile.Profile()
+        try:
+            cpu.enable()
+        except ValueError:  # python 3.12+: the profiler of the main thread already sees every thread
+            return
+        with self.lock:
+            self.threadProfiles.append(cpu)
+
+    ######################################
+    # run func and write the reports, also when it raises or exits
+    def run(self, func, *args, **kwargs):
+        try:
+            import cProfile as profile
+        except ImportError:  # pypy without the c extension
+            import profile
+        try:
+            import tracemalloc
+        except ImportError:  # python 2
+            tracemalloc = None
+
+        self.runDir = os.path.join(self.outDir, self.name + '-' + time.strftime('%Y%m%d-%H%M%S') + '-' +
+                                   str(os.getpid()))
+        if not os.path.isdir(self.runDir):
+            os.makedirs(self.runDir)
+
+        memory = self.memory and tracemalloc is not None
+        if self.memory and not memory:
+            logging.warn('--profile-memory needs python 3 (tracemalloc); skipped')
+        if memory:
+            tracemalloc.start(25)
+        sampler = StackSampler(self.interval)
+        sampler.start()
+        self.profile = profile
+        cpu = profile.Profile()
+        start = time.time()
+        outcome = 'returned'
+        try:
+            threading.setprofile(self._profileThread)
+            cpu.enable()
+            return func(*args, **kwargs)
+        except SystemExit as ex:
+            outcome = 'exit ' + str(ex.code)
+            raise
+        except BaseException as ex:
+            outcome = 'raised ' + repr(ex)
+            raise
+        finally:
+            cpu.disable()
+            threading.setprofile(None)
+            seconds = time.time() - start
+            sampler.stop()
+            snapshot = None
+            if memory:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            self._writeCpu(cpu)
+            sampler.writeCollapsed(os.path.join(self.runDir, 'wallclock.collapsed'))
+            sampler.writeTop(os.path.join(self.runDir, 'wallclock.txt'))
+            if snapshot:
+                self._writeMemory(snapshot, peak)
+            with open(os.path.join(self.runDir, 'summary.json'), 'w') as f:
+                json.dump({'script': self.name, 'argv': sys.argv, 'seconds': round(seconds, 3), 'outcome': outcome,
+                           'samples': sampler.samples, 'interval': self.interval, 'memory': bool(snapshot),
+                           'profiledThreads': len(self.threadProfiles),
+                           'reports': sorted(os.listdir(self.runDir))}, f, indent=2)
+            logging.info('profile of ' + str(round(seconds, 1)) + ' seconds written to ' + self.runDir)
+
+    ######################################
+    # profile.prof (pstats, for snakeviz or pstats), and profile.txt: the profiles of the main thread and of the
+    # threads it started, merged. threads still running, e.g. idle pool workers, are included up to now
+    def _writeCpu(self, cpu):
+        import pstats
+        with self.lock:
+            threadProfiles = list(self.threadProfiles)
+        with open(os.path.join(self.runDir, 'profile.txt'), 'w') as f:
+            stats = pstats.Stats(cpu, stream=f)
+            for threadProfile in threadProfiles:
+                stats.add(threadProfile)
+            stats.dump_stats(os.path.join(self.runDir, 'profile.prof'))
+            f.write('cpu profile of the main thread and of the ' + str(len(threadProfiles)) +
+                    ' thread(s) started meanwhile, merged, by cumulative time\n')
+            stats.sort_stats('cumulative').print_stats(TOP)
+            f.write('by own time\n')
+            stats.sort_stats('tottime').print_stats(TOP)
+
+    # memory.txt: the lines that allocated the most memory still held at the end
+    def _writeMemory(self, snapshot, peak):
+        import tracemalloc
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        stats = snapshot.statistics('lineno')
+        with open(os.path.join(self.runDir, 'memory.txt'), 'w') as f:
+            f.write('peak traced memory: ' + str(peak) + ' bytes\n')
+            f.write('held at the end: ' + str(sum(s.size for s in stats)) + ' bytes\n\n')
+            for stat in stats[:TOP]:
+                frame = stat.traceback[0]
+                f.write('%12d bytes %8d blocks  %s:%d\n' % (stat.size, stat.count, frame.filename, frame.lineno))
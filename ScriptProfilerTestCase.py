@@ -0,0 +1,74 @@
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import unittest
+
+import ScriptProfiler
+import util
+
+
+def work(n):
+    return sum(i * i for i in range(n))
+
+
+def threadWork(results):
+    results.append(work(20000))
+
+
+class ScriptProfilerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def runDir(self):
+        runs = os.listdir(self.directory)
+        self.assertEqual(len(runs), 1)
+        return os.path.join(self.directory, runs[0])
+
+    def testNotProfiled(self):
+        self.assertEqual(ScriptProfiler.profileMain(lambda: 'done', ['--other']), 'done')
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def testProfileThreads(self):
+        def main():
+            results = []
+            thread = threading.Thread(target=threadWork, args=(results,))
+            thread.start()
+            thread.join()
+            return results + util.parallel_map(work, [1000, 2000, 3000], 3)
+
+        result = ScriptProfiler.profileMain(main, ['--profile-out', self.directory, '--profile-interval=0.001'])
+        self.assertEqual(result, [work(20000), work(1000), work(2000), work(3000)])
+
+        runDir = self.runDir()
+        with open(os.path.join(runDir, 'summary.json')) as f:
+            summary = json.load(f)
+        self.assertEqual(summary['outcome'], 'returned')
+        self.assertEqual(summary['interval'], 0.001)
+        for report in ('profile.prof', 'profile.txt', 'wallclock.collapsed', 'wallclock.txt'):
+            self.assertTrue(report in summary['reports'])
+        # the functions run by the other threads are in the merged profile
+        functions = set(name for filename, line, name in pstats.Stats(os.path.join(runDir, 'profile.prof')).stats)
+        self.assertTrue('threadWork' in functions)
+        self.assertTrue('work' in functions)
+
+    def testProfileExit(self):
+        def main():
+            raise SystemExit(3)
+
+        self.assertRaises(SystemExit, ScriptProfiler.profileMain, main, ['--profile-out=' + self.directory])
+        with open(os.path.join(self.runDir(), 'summary.json')) as f:
+            self.assertEqual(json.load(f)['outcome'], 'exit 3')
+        # threads started after the run are not profiled
+        self.assertEqual(threading._profile_hook, None)
+
+
+###########################
+# main
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+# pack the bulk import tree of a migrated sequence (the shadow metadata files
+# and the content below <seqno>/<account>/<year>/<month>/<day>) into one tar
+# stream, optionally compressed, instead of millions of small files and
+# symlinks, and unpack it into the same layout on the repository host.
+#
+# content is either stored in the archive (dereference) or recorded as a
+# symlink to the source file (reference), for a host that mounts the source.
+# next to <archive> an <archive>.index lists every member, one per line:
+# kind (metadata, content, link or missing), size, member name and source.
+
+import io
+import logging
+import os
+import tarfile
+import time
+
+# buffer of the archive file; members are written and read sequentially
+STREAM_BUFFER_SIZE = 1024 * 1024
+
+COMPRESSIONS = ['none', 'gz', 'bz2', 'xz']
+
+INDEX_HEADER = 'kind\tsize\tname\tsource\n'
+
+
+# archive file name of a sequence, e.g. <output>/12.tar.gz
+def archiveFile(outputDirectory, seqno, compression=None):
+    suffix = '' if compression in (None, 'none') else '.' + compression
+    return os.path.join(outputDirectory, str(seqno) + '.tar' + suffix)
+
+
+#############################################
+class SequenceArchive:
+    ######################################
+    # constructor
+    # path: archive file, written as <path>.part until closed
+    # prefix: directory of the members, the seqno
+    # dereference: store the content of the source files, otherwise symlinks to them
+    def __init__(self, path, prefix, compression=None, dereference=True):
+        self.path = path
+        self.prefix = prefix
+        self.compression = None if compression == 'none' else compression
+        self.dereference = dereference
+        self.names = set()
+        self.stats = {'metadata': 0, 'content': 0, 'link': 0, 'missing': 0, 'bytes': 0}
+        self.file = open(path + '.part', 'wb', STREAM_BUFFER_SIZE)
+        self.tar = tarfile.open(fileobj=self.file, mode='w|' + (self.compression or ''), dereference=True)
+        self.index = open(path + '.index.part', 'w')
+        self.index.write(INDEX_HEADER)
+        self.dirs = set()
+
+    def _record(self, kind, size, name, source=''):
+        self.stats[kind] += 1
+        self.stats['bytes'] += size
+        self.index.write(kind + '\t' + str(size) + '\t' + name + '\t' + source + '\n')
+
+    # a directory member for every new parent of name, so that tar xf restores the layout
+    def _addDirs(self, name):
+        parent = os.path.dirname(name)
+        missing = []
+        while parent and parent not in self.dirs:
+            missing.append(parent)
+            self.dirs.add(parent)
+            parent = os.path.dirname(parent)
+        for d in reversed(missing):
+            info = tarfile.TarInfo(d)
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            info.mtime = time.time()
+            self.tar.addfile(info)
+
+    ######################################
+    # add a metadata file written in memory, e.g. <name>.metadata.properties.xml
+    def addBytes(self, name, data):
+        self._addDirs(name)
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mode = 0o644
+        info.mtime = time.time()
+        self.tar.addfile(info, io.BytesIO(data))
+        self._record('metadata', len(data), name)
+
+    # add the content of a document, stored or linked; an existing name is
+    # kept, as a link is not replaced in the directory layout
+    def addContent(self, name, source):
+        if name in self.names:
+            return
+        self.names.add(name)
+        self._addDirs(name)
+        if not self.dereference:
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.SYMTYPE
+            info.linkname = os.path.abspath(source)
+            info.mtime = time.time()
+            self.tar.addfile(info)
+            self._record('link', 0, name, info.linkname)
+            return
+
+        try:
+            with open(source, 'rb') as f:
+                info = self.tar.gettarinfo(arcname=name, fileobj=f)
+                self.tar.addfile(info, f)
+        except (IOError, OSError) as ex:
+            logging.error('cannot add ' + source + ' to ' + self.path + ': ' + str(ex))
+            self._record('missing', 0, name, source)
+            return
+        self._record('content', info.size, name, source)
+
+    ######################################
+    # finish the archive and its index, and return the counts
+    def close(self):
+        self.tar.close()
+        self.file.close()
+        self.index.close()
+        os.rename(self.path + '.index.part', self.path + '.index')
+        os.rename(self.path + '.part', self.path)
+        return self.stats
+
+    # drop a partly written archive
+    def abort(self):
+        for f in (self.tar, self.file, self.index):
+            try:
+                f.close()
+            except Exception:
+                pass
+        for f in (self.path + '.part', self.path + '.index.part'):
+            if os.path.exists(f):
+                os.remove(f)
+
+
+# member names are relative paths, without '..'
+def _safeName(name):
+    parts = name.split('/')
+    return not os.path.isabs(name) and '..' not in parts
+
+
+# whether path, once its symlinks are resolved, is below the directory root (resolved)
+def _inside(root, path):
+    path = os.path.realpath(path)
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+#############################################
+# unpack an archive below outputDirectory, restoring <seqno>/<account>/... with
+# the content files or the symlinks to the source. relink: (old, new) prefix
+# of symlink targets, for a host that mounts the source elsewhere.
+# existing files and links are replaced, as the archive is the newer copy.
+# only directories, files and symlinks are unpacked, and never through a
+# symlink: a member below a link to outside outputDirectory is refused.
+def unpackArchive(path, outputDirectory, relink=None):
+    stats = {'archive': path, 'metadata': 0, 'content': 0, 'link': 0, 'folders': 0, 'bytes': 0}
+    start = time.time()
+    root = os.path.realpath(outputDirectory)
+    with open(path, 'rb', STREAM_BUFFER_SIZE) as f:
+        tar = tarfile.open(fileobj=f, mode='r|*')
+        for member in tar:
+            if not _safeName(member.name):
+                raise Exception('unsafe member ' + member.name + ' in ' + path)
+            if not (member.isdir() or member.isfile() or member.issym()):
+                raise Exception('unsupported member type of ' + member.name + ' in ' + path)
+            target = os.path.join(outputDirectory, member.name)
+            if not _inside(root, os.path.dirname(target)):
+                raise Exception('member ' + member.name + ' of ' + path + ' is outside ' + outputDirectory)
+            if member.isdir():
+                if not os.path.isdir(target):
+                    os.makedirs(target)
+                    stats['folders'] += 1
+                continue
+
+            parent = os.path.dirname(target)
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+            if os.path.lexists(target):
+                os.remove(target)
+            if member.issym():
+                linkname = member.linkname
+                if relink and linkname.startswith(relink[0]):
+                    linkname = relink[1] + linkname[len(relink[0]):]
+                os.symlink(linkname, target)
+                stats['link'] += 1
+            elif member.isfile():
+                source = tar.extractfile(member)
+                with open(target, 'wb') as out:
+                    while True:
+                        chunk = source.read(STREAM_BUFFER_SIZE)
+                        if not chunk:
+                            break
+                        out.write(chunk)
+                stats['metadata' if member.name.endswith('.metadata.properties.xml') else 'content'] += 1
+                stats['bytes'] += member.size
+        tar.close()
+    stats['seconds'] = round(time.time() - start, 3)
+    return stats
+
+
+# the counts of the index of an archive, to check an unpacked archive against
+def readIndex(path):
+    counts = {'metadata': 0, 'content': 0, 'link': 0, 'missing': 0, 'bytes': 0}
+    with open(path + '.index', 'r') as f:
+        f.readline()
+        for line in f:
+            kind, size = line.split('\t', 2)[:2]
+            counts[kind] += 1
+            counts['bytes'] += int(size)
+    return counts
@@ -0,0 +1,142 @@
+# pre-scan bulk import source directories and split them into import jobs of
+# about the same number of nodes, aligned to subdirectories (e.g. the
+# account/year/month/day layout written by migrate.py).
+#
+# a source directory is imported into its targetPath, so a subdirectory
+# imported on its own goes to targetPath/<relative path>, which is created
+# beforehand as a plain folder. only directories that hold nothing but
+# subdirectories are split: a content file or a shadow metadata file in a
+# directory ties it to the import of that directory.
+
+import logging
+import math
+import os
+
+import util
+from BulkImportMonitor import METADATA_SUFFIX, formatDuration
+
+
+#############################################
+# counts of one directory and everything below it
+def scanTree(path):
+    tree = {'path': path, 'files': 0, 'shadowFiles': 0, 'folders': 0, 'bytes': 0, 'splittable': True,
+            'children': []}
+    try:
+        entries = sorted(os.listdir(path))
+    except OSError as ex:
+        logging.warning('cannot list ' + path + ': ' + str(ex))
+        tree['splittable'] = False
+        return _total(tree)
+
+    for name in entries:
+        child = os.path.join(path, name)
+        if os.path.isdir(child):
+            tree['children'].append(scanTree(child))
+            continue
+
+        tree['splittable'] = False
+        if name.endswith(METADATA_SUFFIX):
+            tree['shadowFiles'] += 1
+        else:
+            tree['files'] += 1
+            try:
+                tree['bytes'] += os.path.getsize(child)
+            except OSError:
+                pass  # broken link, reported by the import
+    return _total(tree)
+
+
+def _total(tree):
+    tree['folders'] += len(tree['children'])
+    for child in tree['children']:
+        for key in ('files', 'shadowFiles', 'folders', 'bytes'):
+            tree[key] += child[key]
+    tree['nodes'] = tree['files'] + tree['folders']
+    return tree
+
+
+# scan the source directory of each job, workers directories at a time.
+# returns the jobs with their tree added
+def scanJobs(jobs, workers=4):
+    trees = util.parallel_map(lambda job: scanTree(job['sourceDirectory']), jobs, workers)
+    for job, tree in zip(jobs, trees):
+        job['tree'] = tree
+        job['nodes'] = tree['nodes']
+    return jobs
+
+
+#############################################
+# subtrees of about maxNodes nodes. a directory up to tolerance * maxNodes is
+# kept whole rather than split into much smaller jobs, as is a larger one that
+# cannot be split.
+def splitTree(tree, maxNodes, tolerance=1.5):
+    if tree['nodes'] <= maxNodes * tolerance or not tree['splittable'] or not tree['children']:
+        return [tree]
+    result = []
+    for child in tree['children']:
+        result.extend(splitTree(child, maxNodes, tolerance))
+    return result
+
+
+# split each scanned job into jobs of about maxNodes nodes, largest first
+def splitJobs(jobs, maxNodes, tolerance=1.5):
+    result = []
+    for job in jobs:
+        for tree in splitTree(job['tree'], maxNodes, tolerance):
+            relativePath = os.path.relpath(tree['path'], job['sourceDirectory'])
+            if relativePath == '.':
+                result.append(dict(job, tree=tree, nodes=tree['nodes']))
+                continue
+            relativePath = relativePath.replace(os.sep, '/')
+            result.append(dict(job, name=job['name'] + '/' + relativePath, sourceDirectory=tree['path'],
+                               targetPath=job['targetPath'].rstrip('/') + '/' + relativePath,
+                               createTargetPath=True, tree=tree, nodes=tree['nodes']))
+    return sorted(result, key=lambda job: -job['nodes'])
+
+
+# maxNodes for splitting the scanned jobs into about count jobs
+def nodesPerJob(jobs, count):
+    return max(1, int(math.ceil(sum(job['nodes'] for job in jobs) / float(max(1, count)))))
+
+
+# the jobs as a bulk import conf (acs-bulk-import.yml)
+def toImportConf(jobs):
+    conf = []
+    for job in jobs:
+        entry = {'sourceDirectoryBase': os.path.dirname(job['sourceDirectory']),
+                 'sourceDirectories': [os.path.basename(job['sourceDirectory'])],
+                 'targetPath': job['targetPath'], 'nodes': job['nodes']}
+        if job.get('createTargetPath'):
+            entry['createTargetPath'] = True
+        for key in ('batchSize', 'numThreads'):
+            if job.get(key):
+                entry[key] = job[key]
+        conf.append(entry)
+    return conf
+
+
+#############################################
+# estimated seconds to import the jobs on the given number of repository
+# nodes at nodesPerSecond each, or None without a rate
+def estimateSeconds(jobs, nodesPerSecond, repositoryNodes=1):
+    if not nodesPerSecond:
+        return None
+    total = sum(job['nodes'] for job in jobs) / float(nodesPerSecond)
+    largest = max([job['nodes'] for job in jobs] or [0]) / float(nodesPerSecond)
+    return max(largest, total / max(1, repositoryNodes))
+
+
+def report(jobs, nodesPerSecond=None, repositoryNodes=1):
+    logging.info('%-60s %10s %10s %10s %14s' % ('job', 'files', 'shadow', 'folders', 'bytes'))
+    for job in jobs:
+        tree = job['tree']
+        logging.info('%-60s %10d %10d %10d %14d' % (job['name'][-60:], tree['files'], tree['shadowFiles'],
+                                                    tree['folders'], tree['bytes']))
+    totalNodes = sum(job['nodes'] for job in jobs)
+    logging.info(str(len(jobs)) + ' job(s), ' + str(totalNodes) + ' nodes, ' +
+                 str(sum(job['tree']['bytes'] for job in jobs)) + ' bytes')
+
+    seconds = estimateSeconds(jobs, nodesPerSecond, repositoryNodes)
+    if seconds is not None:
+        logging.info('Estimated duration at ' + str(round(nodesPerSecond, 1)) + ' nodes/s on ' +
+                     str(repositoryNodes) + ' node(s): ' + formatDuration(seconds))
@@ -0,0 +1,291 @@
+#!/usr/bin/python2.7
+# benchmark acs.py, acs-bulk-import.py and AcsClient against the in-memory
+# repository in AcsSimulator.py, using generated acs.yml, rules.yml,
+# filePlan.yml and bulk import source trees.
+#
+# example:
+# ./acs-benchmark.py --sites 50 --folders 20 --latency 0.005 --out bench.json
+# ./acs-benchmark.py --startup 10
+#
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+import acs
+from AcsClient import AcsClient
+from AcsSimulator import AcsSimulator
+from BulkImportJobs import getImportJobs, startBulkImport
+import util
+
+# commands whose startup is timed by --startup, from the directory of this script
+STARTUP_COMMANDS = [['acs.py', '--help'], ['migrate.py', '--help'], ['acs-bulk-import.py', '--help'],
+                    ['convert-wcc-folders.py', '--help']]
+
+
+#############################################
+# get commandline arguments
+def getArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sites', type=int, default=20, help='number of generated sites')
+    parser.add_argument('--folders', type=int, default=10, help='folders per site')
+    parser.add_argument('--roles', type=int, default=2, help='group roles per site and per folder')
+    parser.add_argument('--rules', type=int, default=3, help='number of generated rules')
+    parser.add_argument('--rule-sites', type=int, default=10, help='sites each rule applies to')
+    parser.add_argument('--categories', type=int, default=5, help='file plan categories per level')
+    parser.add_argument('--depth', type=int, default=3, help='file plan depth')
+    parser.add_argument('--app-users', type=int, default=2, help='number of admin app users')
+    parser.add_argument('--import-files', type=int, default=500, help='files in the bulk import source (0 to skip)')
+    parser.add_argument('--import-jobs', type=int, default=2, help='bulk import source directories')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated seconds per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of simulated requests that fail')
+    parser.add_argument('--page-size', type=int, default=1000, help='simulated maximum page size')
+    parser.add_argument('--import-rate', type=float, default=2000.0, help='simulated bulk import nodes per second')
+    parser.add_argument('--startup', type=int, default=0,
+                        help='time this many starts of each script, and conf file loading, instead of the scenarios')
+    parser.add_argument('--workdir', help='keep generated configs and source trees in this directory')
+    parser.add_argument('--out', help='write results as json to this file')
+    return parser.parse_args()
+
+
+#############################################
+# generated configs
+def generateAcsConf(args, url):
+    def roles(prefix, n, role):
+        return [{'role': role, 'group': prefix + '-' + str(i)} for i in range(n)]
+
+    sites = []
+    for s in range(args.sites):
+        siteId = 'bench-site-' + str(s)
+        folders = [{'name': 'folder-' + str(f), 'roles': roles(siteId + '-folder-' + str(f), args.roles, 'Consumer')}
+                   for f in range(args.folders)]
+        sites.append({'id': siteId, 'title': 'Bench Site ' + str(s), 'description': 'generated site',
+                      'roles': roles(siteId, args.roles, 'SiteConsumer'), 'folders': folders})
+
+    conf = {'user': 'admin', 'password': 'admin', 'url': url, 'rootGroup': 'uw_groups',
+            'adminGroup': 'bench_admins', 'sites': sites,
+            'adminAppUsers': [{'name': 'bench-app-' + str(u), 'password': 'pw'} for u in range(args.app_users)]}
+    return {'default': conf}
+
+
+def generateRules(args):
+    rules = []
+    for r in range(args.rules):
+        rules.append({'folders': ['bench-site-' + str(s) for s in range(min(args.rule_sites, args.sites))],
+                      'rule': {'title': 'bench-rule-' + str(r), 'description': 'generated rule',
+                               'ruleType': ['inbound'], 'applyToChildren': True, 'executeAsynchronously': False,
+                               'disabled': False,
+                               'action': {'actionDefinitionName': 'composite-action', 'executeAsync': False,
+                                          'actions': [{'actionDefinitionName': 'Action' + str(r)}],
+                                          'conditions': [{'conditionDefinitionName': 'is-subtype',
+                                                          'parameterValues': {'type': 'cm:content'}}]}}})
+    return rules
+
+
+def generateFilePlan(args):
+    def categories(prefix, depth):
+        result = []
+        for c in range(args.categories):
+            name = prefix + '.' + str(c) if prefix else 'c' + str(c)
+            category = {'name': name}
+            if depth > 1:
+                category['children'] = categories(name, depth - 1)
+            else:
+                category['children'] = [{'name': 'default', 'nodeType': 'recordFolder'}]
+            result.append(category)
+        return result
+
+    return {'title': 'Records Management', 'description': 'generated file plan', 'compliance': 'DOD5015',
+            'roles': [{'role': 'SiteManager', 'group': 'bench-rm-managers'}],
+            'categories': categories('', args.depth)}
+
+
+# write a migrate.py style tree: <job>/<account>/<year>/<month>/<day>/<file> plus shadow files
+def generateImportSource(args, basedir):
+    jobs = []
+    for j in range(args.import_jobs):
+        jobs.append('seq' + str(j + 1))
+        for i in range(args.import_files // args.import_jobs):
+            folder = os.path.join(basedir, jobs[-1], 'account' + str(i % 3), '2018', str(i % 12 + 1), str(i % 28 + 1))
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            name = 'doc-' + str(j) + '-' + str(i) + '.txt'
+            with open(os.path.join(folder, name), 'w') as f:
+                f.write('generated content ' + str(i) + '\n' * 64)
+            with open(os.path.join(folder, name + '.metadata.properties.xml'), 'w') as f:
+                f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                        '<!DOCTYPE properties SYSTEM "http://java.sun.com/dtd/properties.dtd">\n'
+                        '<properties><entry key="type">cm:content</entry>'
+                        '<entry key="cm:name">' + name + '</entry></properties>\n')
+    return [{'sourceDirectoryBase': basedir, 'sourceDirectories': jobs,
+             'targetPath': '/Sites/bench-site-0/documentLibrary'}]
+
+
+def writeYml(path, data):
+    with open(path, 'w') as f:
+        yaml.safe_dump(data, f, default_flow_style=False)
+    return path
+
+
+#############################################
+# run one scenario and collect request counts from the simulator
+def runScenario(name, simulator, func):
+    simulator.resetStats()
+    start = time.time()
+    error = None
+    try:
+        func()
+    except Exception as ex:
+        error = repr(ex)
+    seconds = time.time() - start
+
+    counts = sorted(simulator.requestCounts.items(), key=lambda c: -c[1])
+    result = {'scenario': name, 'seconds': round(seconds, 3), 'requests': simulator.requestTotal,
+              'requestsPerSecond': round(simulator.requestTotal / seconds, 1) if seconds > 0 else 0,
+              'simulatedErrors': simulator.errorTotal, 'error': error,
+              'topEndpoints': [{'endpoint': e, 'requests': n} for e, n in counts[:5]]}
+    logging.info(name + ': ' + str(result['seconds']) + 's, ' + str(result['requests']) + ' requests' +
+                 (' FAILED ' + error if error else ''))
+    return result
+
+
+def printReport(results):
+    print('%-28s %10s %10s %10s %8s' % ('scenario', 'seconds', 'requests', 'req/s', 'status'))
+    for r in results:
+        print('%-28s %10.3f %10d %10.1f %8s' % (r['scenario'], r['seconds'], r['requests'], r['requestsPerSecond'],
+                                                'FAILED' if r['error'] else 'ok'))
+        for e in r['topEndpoints']:
+            print('    %-62s %8d' % (e['endpoint'], e['requests']))
+
+
+#############################################
+# startup: wall time of a new interpreter running each script to the end of
+# --help, which is the import and argument parsing cost paid by every run
+def measureStartup(runs):
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    with open(os.devnull, 'w') as devnull:
+        for command in STARTUP_COMMANDS:
+            times = []
+            for i in range(runs):
+                start = time.time()
+                subprocess.call([sys.executable, os.path.join(here, command[0])] + command[1:], cwd=here,
+                                stdout=devnull, stderr=devnull)
+                times.append(time.time() - start)
+            times.sort()
+            results.append({'command': ' '.join(command), 'runs': runs, 'min': round(times[0], 3),
+                            'median': round(times[len(times) // 2], 3)})
+    return results
+
+
+# conf file loading: the pure python loader and util.load_yaml, in this process,
+# and util.getConfig in a new process (as every script run is), parsing the conf
+# file, or reading the merged config it cached on disk in an earlier run
+def measureConfigLoad(confFile, runs):
+    def timed(func, before=None):
+        total = 0.0
+        for i in range(runs):
+            if before:
+                before()
+            start = time.time()
+            func()
+            total += time.time() - start
+        return round(total / runs * 1000, 3)
+
+    def pureLoad():
+        with open(confFile, 'r') as f:
+            yaml.load(f, Loader=yaml.SafeLoader)
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, '-c', 'import util; util.getConfig(%r, "dev", cache=True)' % confFile]
+    cacheFile = util._config_cache_file(confFile, 'dev')
+
+    def removeCache():
+        if os.path.exists(cacheFile):
+            os.remove(cacheFile)
+
+    return [{'loader': 'yaml.SafeLoader', 'milliseconds': timed(pureLoad)},
+            {'loader': 'util.load_yaml', 'milliseconds': timed(lambda: util.load_yaml(confFile))},
+            {'loader': 'getConfig, new process, parsed', 'milliseconds':
+                timed(lambda: subprocess.call(command, cwd=here), removeCache)},
+            {'loader': 'getConfig, new process, cached', 'milliseconds':
+                timed(lambda: subprocess.call(command, cwd=here))}]
+
+
+def printStartupReport(startup, configLoad):
+    print('%-36s %10s %10s' % ('startup', 'min', 'median'))
+    for r in startup:
+        print('%-36s %10.3f %10.3f' % (r['command'], r['min'], r['median']))
+    print('%-36s %10s' % ('conf file load', 'ms'))
+    for r in configLoad:
+        print('%-36s %10.3f' % (r['loader'], r['milliseconds']))
+
+
+#############################################
+# main
+def main():
+    logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s', datefmt='%m/%d/%Y %H:%M:%S',
+                        level=logging.INFO)
+    args = getArgs()
+
+    if args.startup > 0:
+        workdir = tempfile.mkdtemp(prefix='acs-benchmark-')
+        try:
+            confFile = writeYml(os.path.join(workdir, 'acs.yml'), generateAcsConf(args, 'http://localhost:8080'))
+            startup = measureStartup(args.startup)
+            configLoad = measureConfigLoad(confFile, args.startup)
+        finally:
+            shutil.rmtree(workdir)
+        printStartupReport(startup, configLoad)
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump({'arguments': vars(args), 'startup': startup, 'configLoad': configLoad}, f, indent=2)
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='acs-benchmark-')
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+
+    simulator = AcsSimulator(latency=args.latency, errorRate=args.error_rate, pageSize=args.page_size,
+                             importRate=args.import_rate).start()
+    results = []
+    try:
+        confFile = writeYml(os.path.join(workdir, 'acs.yml'), generateAcsConf(args, simulator.url))
+        rulesFile = writeYml(os.path.join(workdir, 'rules.yml'), generateRules(args))
+        filePlanFile = writeYml(os.path.join(workdir, 'filePlan.yml'), generateFilePlan(args))
+        argv = ['-c', confFile, '-r', rulesFile, '-f', filePlanFile, '-s', 'dev']
+
+        # keep acs.py progress logging out of the report
+        logging.getLogger().setLevel(logging.WARNING)
+        results.append(runScenario('provision (empty repo)', simulator, lambda: acs.main(argv)))
+        results.append(runScenario('provision (steady state)', simulator, lambda: acs.main(argv)))
+
+        if args.import_files > 0:
+            biconf = generateImportSource(args, os.path.join(workdir, 'import'))
+            writeYml(os.path.join(workdir, 'acs-bulk-import.yml'), {'default': biconf})
+            client = AcsClient(simulator.url, 'admin', 'admin')
+            results.append(runScenario('bulk import', simulator,
+                                       lambda: startBulkImport(client, getImportJobs(biconf, None))))
+        logging.getLogger().setLevel(logging.INFO)
+    finally:
+        simulator.stop()
+        if not args.workdir:
+            shutil.rmtree(workdir)
+
+    printReport(results)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'arguments': vars(args), 'results': results}, f, indent=2)
+
+
+#############################################
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,14 @@
 import argparse
 import logging
 import sys
-import time
 
 import util
-from AcsClient import AcsClient
+import ScriptProfiler
+from BulkImportJobs import getImportJobs, startBulkImport, startClusterBulkImport
+from BulkImportMonitor import BulkImportMonitor
+from BulkImportLedger import BulkImportLedger
+from BulkImportTuner import BulkImportTuner, DEFAULT_GRID, parseGrid
+import SourceScanner
 
 
 #############################################
@@ -20,53 +24,56 @@ def getArgs():
     parser.add_argument('-b', '--biconf', default='acs-bulk-import.yml', help='bulk import conf file')
     parser.add_argument('-s', '--stage', choices=['dev', 'local', 'test', 'prod'], default='dev')
     parser.add_argument('-p', '--profile', required='false', help='Limit importing to only the specified profile')
+    parser.add_argument('-m', '--monitor', action='store_true',
+                        help='report progress, throughput and ETA with an adaptive poll interval')
+    parser.add_argument('--monitor-out', help='append monitoring samples to this file (.csv, otherwise json lines)')
+    parser.add_argument('--poll-min', type=float, default=1.0, help='shortest poll interval in seconds')
+    parser.add_argument('--poll-max', type=float, default=30.0, help='longest poll interval in seconds')
+    parser.add_argument('-n', '--node-url', action='append', dest='node_urls',
+                        help='repository node to run imports on, repeat for each node of a cluster '
+                             '(default: bulkImportNodes in conf file, or its url)')
+    parser.add_argument('-l', '--ledger', help='job ledger file; completed jobs are skipped when rerun')
+    parser.add_argument('--max-retries', type=int, default=0, help='times a failed job is retried')
+    parser.add_argument('--retry-delay', type=float, default=60,
+                        help='seconds before the first retry of a job, doubled for each further retry')
+    parser.add_argument('--max-wait', type=float, default=3600,
+                        help='on a cluster, seconds without an idle node after which the jobs not started fail')
+    parser.add_argument('--scan', action='store_true',
+                        help='count the files, shadow files and bytes of each job, estimate the duration and exit')
+    parser.add_argument('--job-size', type=int, help='split the source directories into jobs of about this many nodes')
+    parser.add_argument('--jobs', type=int, help='split the source directories into about this many jobs')
+    parser.add_argument('--jobs-out', help='write the (split) jobs as a bulk import conf file and exit')
+    parser.add_argument('--nodes-per-second', type=float,
+                        help='import rate for the estimate (default: average of the jobs in the ledger)')
+    parser.add_argument('--scan-workers', type=int, default=4, help='source directories scanned at a time')
+    parser.add_argument('--batch-size', type=int,
+                        help='bulk import batchSize of jobs without one in the bulk import conf '
+                             '(default: bulkImportBatchSize in conf file, or the tuned value)')
+    parser.add_argument('--num-threads', type=int,
+                        help='bulk import numThreads of jobs without one in the bulk import conf '
+                             '(default: bulkImportNumThreads in conf file, or the tuned value)')
+    parser.add_argument('-a', '--autotune', action='store_true',
+                        help='try the settings of --tune-grid on the first jobs and use the fastest for the rest')
+    parser.add_argument('--tune-grid', type=parseGrid, default=DEFAULT_GRID,
+                        help='batchSize x numThreads settings to try, e.g. 20x4,50x10,100x10')
+    parser.add_argument('--tuning-file', default='acs-bulk-import-tuning.json',
+                        help='best settings per repository url, saved by --autotune and used by later runs')
+    ScriptProfiler.addArguments(parser)
     return parser.parse_args()
 
 
 #############################################
-def startBulkImport(acsClient, conf, profile):
-    # start bulk import
-    imports = conf
-    if imports:
-        for imp in imports:
-            sourceDirectoryBase = imp['sourceDirectoryBase']
-            sourceDirectories = imp['sourceDirectories']
-            targetPath = imp['targetPath']
-            if should_import_profile(profile, targetPath):
-                for srcdir in sourceDirectories:
-                    sourceDirectory = sourceDirectoryBase + '/' + srcdir
-                    logging.info('Uploading content from ' + sourceDirectory + ' to ' + targetPath)
-                    acsClient.startBulkImport(sourceDirectory, targetPath)
-
-                    # alfresco allow one bulk import at a time, wait for bulk load to complete
-                    status = acsClient.getBulkImportStatus()
-                    while status['currentStatus'].lower() != 'idle':
-                        sys.stdout.write('.')
-                        sys.stdout.flush()
-                        time.sleep(1)
-                        status = acsClient.getBulkImportStatus()
-                    print("")  # new line
-
-                    if status['lastResult'].lower() == 'succeeded':
-                        logging.info('Uploaded content from ' + sourceDirectory + ' to ' + targetPath)
-                        logging.info('Throughput: ' + status['nodesPerSecond'])
-                        logging.info('Duration in ns: ' + status['durationInNS'])
-                    else:
-                        logging.error('Failed to upload content from ' + sourceDirectory + ' to ' + targetPath)
-                        logging.error('Current Status: ' + status['currentStatus'])
-                        logging.error('Last Result: ' + status['lastResult'])
-                        logging.error('Exception: ' + status['exception'])
-            else:
-                logging.debug('Skipping Import to "' + targetPath + '" for specified profile: "' + profile + '"')
-
-
-def should_import_profile(profile, target_path):
-    import_profile = True
-    if profile is not None:
-        target_pieces = target_path.split('/')
-        import_profile = target_pieces[2] == profile
-
-    return import_profile
+# pre-scan the jobs, split them if asked and report their size
+def planJobs(jobs, args, ledger=None, repositoryNodes=1):
+    jobs = SourceScanner.scanJobs(jobs, args.scan_workers)
+    maxNodes = args.job_size or (args.jobs and SourceScanner.nodesPerJob(jobs, args.jobs))
+    if maxNodes:
+        logging.info('Splitting ' + str(len(jobs)) + ' job(s) into jobs of about ' + str(maxNodes) + ' nodes')
+        jobs = SourceScanner.splitJobs(jobs, maxNodes)
+
+    nodesPerSecond = args.nodes_per_second or (ledger and ledger.averageNodesPerSecond())
+    SourceScanner.report(jobs, nodesPerSecond, repositoryNodes)
+    return jobs
 
 
 #############################################
@@ -79,16 +86,56 @@ def main():
 
     logging.info('Start ' + sys.argv[0])
     args = getArgs()
+    # imported after the arguments are parsed: AcsClient loads requests
+    from AcsClient import AcsClient
     acsClient = AcsClient.fromConfig(args.conf, args.stage)
 
     # load bulk import config file
     biconf = util.getConfig(args.biconf)
 
-    startBulkImport(acsClient, biconf, args.profile)
+    # each node of a clustered repository can run its own import
+    conf = util.getConfig(args.conf, args.stage)
+    nodeUrls = args.node_urls or (conf and conf.get('bulkImportNodes')) or []
+    ledger = BulkImportLedger(args.ledger) if args.ledger else None
+
+    jobs = getImportJobs(biconf, args.profile)
+    for job in jobs:
+        job['batchSize'] = job['batchSize'] or args.batch_size
+        job['numThreads'] = job['numThreads'] or args.num_threads
+    stageSettings = {}
+    if conf and conf.get('bulkImportBatchSize'):
+        stageSettings['batchSize'] = conf['bulkImportBatchSize']
+    if conf and conf.get('bulkImportNumThreads'):
+        stageSettings['numThreads'] = conf['bulkImportNumThreads']
+    tuner = BulkImportTuner(args.tuning_file, acsClient.urlbase, args.tune_grid if args.autotune else None,
+                            stageSettings)
+    if args.scan or args.job_size or args.jobs or args.jobs_out:
+        jobs = planJobs(jobs, args, ledger, max(1, len(nodeUrls)))
+        if args.jobs_out:
+            import yaml
+            with open(args.jobs_out, 'w') as f:
+                yaml.safe_dump({'default': SourceScanner.toImportConf(jobs)}, f, default_flow_style=False)
+            logging.info('Wrote ' + str(len(jobs)) + ' job(s) to ' + args.jobs_out)
+        if args.scan or args.jobs_out:
+            return
+
+    if len(nodeUrls) == 1:
+        acsClient = AcsClient(nodeUrls[0], acsClient.user, acsClient.pw)
+    monitor = None
+    if args.monitor or args.monitor_out:
+        monitor = BulkImportMonitor(acsClient, args.poll_min, args.poll_max, args.monitor_out)
+
+    if len(nodeUrls) > 1:
+        # the scheduler polls every node, each --poll-min seconds, and hands the statuses to the monitor
+        acsClients = [AcsClient(url, acsClient.user, acsClient.pw) for url in nodeUrls]
+        startClusterBulkImport(acsClients, jobs, args.poll_min, ledger, args.max_retries, tuner, args.retry_delay,
+                               args.max_wait, monitor)
+    else:
+        startBulkImport(acsClient, jobs, monitor, ledger, args.max_retries, args.retry_delay, tuner)
 
     logging.info('End ' + sys.argv[0])
 
 
 #############################################
 if __name__ == "__main__":
-    main()
+    ScriptProfiler.profileMain(main)
@@ -5,39 +5,68 @@
 # * pip install mysql-connector-python (for connecting to DB to drop repository tables)
 # * mysql.cnf - mysql configuration to connect to repo DB.
 #
+# modes:
+# * drop (default): drop every table of the schema; the repository bootstraps it again
+# * snapshot: save the schema and rows of a freshly bootstrapped repository to a directory,
+#   as plain sql files, several tables at a time (see AcsSnapshot.py)
+# * restore: drop every table, create the tables of the snapshot and load their rows,
+#   several tables at a time
+# * truncate: empty every table in place and load the rows of the snapshot, several
+#   tables at a time; for a schema that is unchanged since the snapshot
+#
+# examples:
+# ./acs-drop-acs-tables.py DROP-ACS-TABLES
+# ./acs-drop-acs-tables.py --mode snapshot --snapshot-dir acs-snapshot
+# ./acs-drop-acs-tables.py DROP-ACS-TABLES --mode restore --snapshot-dir acs-snapshot --workers 8
+#
 import argparse
 import logging
+import time
+
+import sys
+
+import ScriptProfiler
+from AcsSnapshot import (create_tables, drop_alfresco_tables, load_tables, read_snapshot, snapshot_tables,
+                         truncate_tables)
+
+# modes that change the database, which need the safety argument
+DESTRUCTIVE_MODES = ('drop', 'restore', 'truncate')
 
-import sys 
-import mysql.connector
 
 #############################################
-def drop_alfresco_tables(optionfile, group='dev'):
-    logging.info('Dropping Alfresco tables')
-    stmt = """SET FOREIGN_KEY_CHECKS = 0;
-               SET GROUP_CONCAT_MAX_LEN=32768;
-               SET @tables = NULL;
-               SELECT GROUP_CONCAT('`', table_name, '`') INTO @tables
-               FROM information_schema.tables
-               WHERE table_schema = 'acs';
-
-               SELECT IFNULL(@tables,'dummy') INTO @tables;
-               SET @tables = CONCAT('DROP TABLE IF EXISTS ', @tables);
-
-               PREPARE stmt FROM @tables;
-               EXECUTE stmt;
-               DEALLOCATE PREPARE stmt;
-               SET FOREIGN_KEY_CHECKS = 1;
-            """
-    cnx = None
-    try:
-        cnx = mysql.connector.connect(option_files=optionfile, option_groups=group)
-        cur = cnx.cursor()
-        cur.execute(stmt)
-    finally:
-        cnx and cnx.close()
-
-    logging.info('Dropped Alfresco tables')
+# get commandline arguments
+def getArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('confirm', nargs='?', help="'DROP-ACS-TABLES', required to drop, restore or truncate")
+    parser.add_argument('--mode', choices=['drop', 'snapshot', 'restore', 'truncate'], default='drop')
+    parser.add_argument('--option-file', default='mysql.cnf', help='mysql option file')
+    parser.add_argument('--group', default='dev', help='option group of the option file')
+    parser.add_argument('--schema', default='acs', help='repository schema')
+    parser.add_argument('--snapshot-dir', default='acs-snapshot', help='directory of the schema snapshot')
+    parser.add_argument('--workers', type=int, default=4, help='tables saved or loaded at a time')
+    ScriptProfiler.addArguments(parser)
+    return parser.parse_args()
+
+
+#############################################
+# time and log the phases of a reset
+class PhaseTimer:
+    def __init__(self):
+        self.phases = []
+
+    def run(self, name, func, *args):
+        logging.info(name + '...')
+        start = time.time()
+        result = func(*args)
+        self.phases.append((name, time.time() - start))
+        logging.info(name + ': ' + str(round(self.phases[-1][1], 2)) + ' seconds')
+        return result
+
+    def report(self):
+        for name, seconds in self.phases:
+            logging.info('  ' + name.ljust(10) + str(round(seconds, 2)).rjust(10) + ' seconds')
+        logging.info('  ' + 'total'.ljust(10) + str(round(sum(s for n, s in self.phases), 2)).rjust(10) + ' seconds')
+
 
 #############################################
 # main
@@ -46,17 +75,34 @@ def main():
     logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s', datefmt='%m/%d/%Y %H:%M:%S',
                         level=logging.INFO
                         )
+    args = getArgs()
+
     # require command line arg 'DROP ACS TABLES' as a safety guard
-    if len(sys.argv)<2 or sys.argv[1] != 'DROP-ACS-TABLES':
-        print >>sys.stderr, "please include command line argument 'DROP-ACS-TABLES' to confirm that you want to drop ACS tables"
+    if args.mode in DESTRUCTIVE_MODES and args.confirm != 'DROP-ACS-TABLES':
+        sys.stderr.write("please include command line argument 'DROP-ACS-TABLES' to confirm that you want to " +
+                         args.mode + " ACS tables\n")
         exit(0)
-    
-    logging.info('start ' + sys.argv[0])
 
-    drop_alfresco_tables('mysql.cnf', 'dev')
+    logging.info('start ' + sys.argv[0] + ' (' + args.mode + ')')
+
+    timer = PhaseTimer()
+    if args.mode == 'drop':
+        timer.run('drop', drop_alfresco_tables, args.option_file, args.group, args.schema)
+    elif args.mode == 'snapshot':
+        timer.run('snapshot', snapshot_tables, args.option_file, args.group, args.schema, args.snapshot_dir,
+                  args.workers)
+    else:
+        snapshot = timer.run('read', read_snapshot, args.snapshot_dir)
+        if args.mode == 'restore':
+            timer.run('drop', drop_alfresco_tables, args.option_file, args.group, args.schema)
+            timer.run('create', create_tables, args.option_file, args.group, args.schema, snapshot)
+        else:
+            timer.run('truncate', truncate_tables, args.option_file, args.group, args.schema, snapshot)
+        timer.run('load', load_tables, args.option_file, args.group, args.schema, snapshot, args.workers)
+    timer.report()
 
     logging.info('end ' + sys.argv[0])
 
 #############################################
 if __name__ == "__main__":
-    main()
+    ScriptProfiler.profileMain(main)
@@ -0,0 +1,91 @@
+#!/usr/bin/python2.7
+# export the documents below a repository folder (or the documentLibrary of a
+# site) into a bulk import source directory, with shadow metadata files.
+# run again with the same ledger to resume: documents not modified since they
+# were exported are skipped.
+#
+# examples:
+# ./acs-export.py -c acs.yml -s prod --site mysite -o /export/mysite --download-workers 16
+# ./acs-export.py -c acs.yml -s prod /Sites/mysite/documentLibrary/hold -o /export/hold --ledger hold.ledger
+#
+# then, e.g. ./acs-bulk-import.py with sourceDirectory /export/mysite
+#
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+import ScriptProfiler
+
+
+#############################################
+# get commandline arguments
+def getArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', nargs='?', help='repository folder, e.g. /Sites/mysite/documentLibrary/folder')
+    parser.add_argument('--site', help='export the documentLibrary of this site instead of path')
+    parser.add_argument('-c', '--conf', default='acs.yml', help='conf file')
+    parser.add_argument('-s', '--stage', choices=['dev', 'local', 'test', 'prod'], default='dev')
+    parser.add_argument('-o', '--output', required=True, help='directory to export into')
+    parser.add_argument('--workers', type=int, default=4, help='pages listed at a time')
+    parser.add_argument('--download-workers', type=int, default=8, help='documents downloaded at a time')
+    parser.add_argument('--page-size', type=int, help='children requested per page (default: that of AcsClient)')
+    parser.add_argument('--ledger', help='documents exported, to resume from (default: <output>.ledger)')
+    parser.add_argument('--inventory', help='inventory of the exported tree (default: <output>.inventory.csv)')
+    parser.add_argument('--separator', default=',',
+                        help='separator of multiple values in the metadata files, that of the bulk import (default: ,)')
+    ScriptProfiler.addArguments(parser)
+    args = parser.parse_args()
+    if bool(args.path) == bool(args.site):
+        parser.error('give either path or --site')
+    output = args.output.rstrip('/')
+    args.ledger = args.ledger or output + '.ledger'
+    args.inventory = args.inventory or output + '.inventory.csv'
+    return args
+
+
+#############################################
+# main
+def main():
+    logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s', datefmt='%m/%d/%Y %H:%M:%S',
+                        level=logging.INFO)
+    logging.info('Start ' + sys.argv[0])
+    args = getArgs()
+
+    from AcsClient import AcsClient
+    from AcsExport import AcsExport, ExportLedger
+    acsClient = AcsClient.fromConfig(args.conf, args.stage, poolSize=args.workers + args.download_workers)
+    if args.site:
+        root = acsClient.getDocumentLibrary(args.site)
+    else:
+        root = acsClient.getNodeByPath(args.path.strip('/'), fields=['id', 'isFolder'])
+    if not (root and root.get('isFolder', True)):
+        logging.error('no folder ' + (args.path or 'documentLibrary of site ' + args.site))
+        sys.exit(1)
+
+    if os.path.isfile(args.ledger):
+        logging.info('resuming from ' + args.ledger)
+    ledger = ExportLedger(args.ledger)
+    try:
+        export = AcsExport(acsClient, args.output, args.workers, args.page_size, args.download_workers, ledger,
+                           args.separator)
+        stats = export.export(root['id'], args.inventory)
+    finally:
+        ledger.close()
+
+    failed = export.failed + export.failedDownloads
+    if failed:
+        logging.warning('the export is incomplete, run again to retry: ' + ', '.join(failed[:20]) +
+                        (' ...' if len(failed) > 20 else ''))
+    logging.info(json.dumps(dict(stats, output=args.output, inventory=args.inventory, ledger=args.ledger),
+                            sort_keys=True))
+    logging.info('End ' + sys.argv[0])
+    if failed:
+        sys.exit(1)
+
+
+#############################################
+if __name__ == "__main__":
+    ScriptProfiler.profileMain(main)
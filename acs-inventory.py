@@ -0,0 +1,80 @@
+#!/usr/bin/python2.7
+# inventory of a repository folder tree after a migration and bulk import,
+# reconciled with the migrate.py output directories or content manifest.
+#
+# examples:
+# ./acs-inventory.py -c acs.yml -s dev /Sites/mysite/documentLibrary -o inventory.csv --workers 16
+# ./acs-inventory.py -c acs.yml /Sites/mysite/documentLibrary -o inventory.csv --expected-dir /acs_import/1 --report diff.csv
+# ./acs-inventory.py /Sites/mysite/documentLibrary -o inventory.csv --no-crawl --manifest manifest.csv --report diff.csv
+#
+
+import argparse
+import json
+import logging
+import sys
+
+import AcsInventory
+import ScriptProfiler
+
+
+#############################################
+# get commandline arguments
+def getArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help='repository folder, e.g. /Sites/mysite/documentLibrary (the bulk import targetPath)')
+    parser.add_argument('-c', '--conf', default='acs.yml', help='conf file')
+    parser.add_argument('-s', '--stage', choices=['dev', 'local', 'test', 'prod'], default='dev')
+    parser.add_argument('-o', '--out', default='inventory.csv', help='inventory file (csv)')
+    parser.add_argument('--workers', type=int, default=8, help='pages listed at a time')
+    parser.add_argument('--page-size', type=int, help='children requested per page (default: that of AcsClient)')
+    parser.add_argument('--no-crawl', action='store_true', help='reconcile the existing inventory file')
+    parser.add_argument('--expected-dir', action='append', default=[],
+                        help='bulk import source directory imported into path, e.g. <migrate output>/<seqno>; repeat '
+                             'for every sequence imported into it')
+    parser.add_argument('--manifest', help='content manifest of migrate.py --manifest, instead of --expected-dir')
+    parser.add_argument('--seqno', action='append', help='only the documents of this sequence of the manifest')
+    parser.add_argument('--report', default='reconciliation.csv',
+                        help='missing, extra and mismatched documents (csv), with --expected-dir or --manifest')
+    ScriptProfiler.addArguments(parser)
+    return parser.parse_args()
+
+
+#############################################
+# main
+def main():
+    logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s', datefmt='%m/%d/%Y %H:%M:%S',
+                        level=logging.INFO)
+    logging.info('Start ' + sys.argv[0])
+    args = getArgs()
+
+    summary = {'path': args.path, 'inventory': args.out}
+    if not args.no_crawl:
+        from AcsClient import AcsClient
+        acsClient = AcsClient.fromConfig(args.conf, args.stage, poolSize=args.workers)
+        root = acsClient.getNodeByPath(args.path.strip('/'), fields=['id', 'isFolder'])
+        if not (root and root.get('isFolder')):
+            logging.error('no folder ' + args.path)
+            sys.exit(1)
+        inventory = AcsInventory.AcsInventory(acsClient, args.workers, args.page_size)
+        summary['crawl'] = inventory.crawl(root['id'], args.out)
+        if inventory.failed:
+            logging.warning('the inventory is incomplete, listing failed for: ' + ', '.join(inventory.failed))
+
+    if args.manifest or args.expected_dir:
+        if args.manifest:
+            expected = AcsInventory.expectedFromManifest(args.manifest, args.seqno)
+        else:
+            expected = AcsInventory.expectedFromTrees(args.expected_dir)
+        summary['reconciliation'] = AcsInventory.reconcile(args.out, expected, args.report)
+        summary['report'] = args.report
+
+    logging.info(json.dumps(summary, sort_keys=True))
+    logging.info('End ' + sys.argv[0])
+    reconciliation = summary.get('reconciliation') or {}
+    if (summary.get('crawl') or {}).get('errors') or reconciliation.get('missing') or reconciliation.get('mismatched'):
+        sys.exit(1)
+
+
+#############################################
+if __name__ == "__main__":
+    ScriptProfiler.profileMain(main)
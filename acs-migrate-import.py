@@ -0,0 +1,186 @@
+#!/usr/bin/python2.7
+# translate wcc archives with migrate.py and bulk import each output/<seqno>
+# directory as soon as its sequence is complete, while the later sequences are
+# still being translated. a sequence is imported only after migrate.py wrote
+# its output/<seqno>.complete marker.
+#
+# example:
+# ./acs-migrate-import.py -i ./hda_files/ -m ./content_models.yml -o ./acs_import -p PROFILE_1 \
+#     --conf acs.yml --stage dev -t /Sites/mysite/documentLibrary --max-pending 2 --ledger jobs.json
+#
+
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    from Queue import Queue
+except ImportError:  # python 3
+    from queue import Queue
+
+import migrate
+import ScriptProfiler
+import util
+from AcsClient import AcsClient
+from BulkImportJobs import startBulkImport
+from BulkImportLedger import BulkImportLedger
+from BulkImportMonitor import BulkImportMonitor
+from BulkImportTuner import BulkImportTuner
+
+
+#############################################
+# get commandline arguments: those of migrate.py and the bulk import ones
+def getArgs():
+    parser = migrate.get_argument_parser()
+    parser.add_argument('--conf', default='acs.yml', help='conf file')
+    parser.add_argument('--stage', choices=['dev', 'local', 'test', 'prod'], default='dev')
+    parser.add_argument('-t', '--targetPath', required=True, help='repository folder the sequences are imported to')
+    parser.add_argument('--max-pending', type=int, default=2,
+                        help='translated sequences waiting to be imported before translation pauses')
+    parser.add_argument('--ledger', help='job ledger file; completed jobs are skipped when rerun')
+    parser.add_argument('--max-retries', type=int, default=0, help='times a failed import is retried')
+    parser.add_argument('--retry-delay', type=float, default=60,
+                        help='seconds before the first retry of an import, doubled for each further retry')
+    parser.add_argument('--import-completed', action='store_true',
+                        help='first import the sequences already marked complete in the output directory, '
+                             'e.g. after an interrupted run (use with --ledger to skip those already imported)')
+    parser.add_argument('--monitor', action='store_true', help='report import progress, throughput and ETA')
+    parser.add_argument('--tuning-file', default='acs-bulk-import-tuning.json',
+                        help='best bulk import settings per repository url, saved by acs-bulk-import.py --autotune')
+    args = parser.parse_args()
+    if args.archive:
+        parser.error('--archive is not supported: the sequences are imported from the output directory')
+    return args
+
+
+#############################################
+# import the sequences put on the queue, one at a time, until None is put
+class SequenceImporter(threading.Thread):
+    def __init__(self, acsClient, targetPath, queue, monitor=None, ledger=None, tuner=None, maxRetries=0,
+                 retryDelay=60):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.acsClient = acsClient
+        self.targetPath = targetPath
+        self.queue = queue
+        self.monitor = monitor
+        self.ledger = ledger
+        self.tuner = tuner
+        self.maxRetries = maxRetries
+        self.retryDelay = retryDelay
+        self.imported = []
+        self.failed = []
+        self.idleSeconds = 0.0
+
+    def run(self):
+        while True:
+            waitStart = time.time()
+            item = self.queue.get()
+            self.idleSeconds += time.time() - waitStart
+            if item is None:
+                return
+
+            seqno, output = item
+            if not os.path.isfile(migrate.sequence_complete_file(os.path.dirname(output), seqno)):
+                logging.error('Sequence ' + seqno + ' is not marked complete, not importing ' + output)
+                self.failed.append(seqno)
+                continue
+
+            job = {'name': seqno, 'sourceDirectory': output, 'targetPath': self.targetPath}
+            try:
+                results = startBulkImport(self.acsClient, [job], self.monitor, self.ledger, self.maxRetries,
+                                          self.retryDelay, self.tuner)
+                # no result when the ledger has it completed by an earlier run
+                if all(status['lastResult'].lower() == 'succeeded' for status in results):
+                    self.imported.append(seqno)
+                else:
+                    self.failed.append(seqno)
+            except Exception as ex:
+                # keep importing, so that the translation is never blocked on a full queue
+                logging.error('Failed to import sequence ' + seqno + ': ' + str(ex))
+                self.failed.append(seqno)
+
+
+# (seqno, output directory) of the sequences marked complete, in sequence order
+def completedSequences(outputDirectory):
+    sequences = []
+    for f in os.listdir(outputDirectory):
+        seqno = f[:-len('.complete')]
+        if f.endswith('.complete') and seqno.isdigit() and os.path.isdir(os.path.join(outputDirectory, seqno)):
+            sequences.append((seqno, outputDirectory + '/' + seqno))
+    return sorted(sequences, key=lambda s: int(s[0]))
+
+
+#############################################
+# main
+def main():
+    logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s', datefmt='%m/%d/%Y %H:%M:%S',
+                        level=logging.INFO)
+    logging.info('Start ' + sys.argv[0])
+    args = getArgs()
+
+    acsClient = AcsClient.fromConfig(args.conf, args.stage)
+    conf = util.getConfig(args.conf, args.stage)
+    ledger = BulkImportLedger(args.ledger) if args.ledger else None
+    monitor = BulkImportMonitor(acsClient) if args.monitor else None
+    stageSettings = {}
+    if conf and conf.get('bulkImportBatchSize'):
+        stageSettings['batchSize'] = conf['bulkImportBatchSize']
+    if conf and conf.get('bulkImportNumThreads'):
+        stageSettings['numThreads'] = conf['bulkImportNumThreads']
+    tuner = BulkImportTuner(args.tuning_file, acsClient.urlbase, defaults=stageSettings)
+
+    # put blocks while max-pending sequences wait, pausing the translation
+    # until the import catches up
+    queue = Queue(maxsize=max(1, args.max_pending))
+    importer = SequenceImporter(acsClient, args.targetPath, queue, monitor, ledger, tuner, args.max_retries,
+                                args.retry_delay)
+    importer.start()
+
+    blocked = [0.0]
+
+    def on_sequence_complete(seqno, output):
+        start = time.time()
+        if queue.full():
+            logging.info('Import is behind, waiting to queue sequence ' + seqno)
+        queue.put((seqno, output))
+        blocked[0] += time.time() - start
+
+    # the completed sequences are imported as they are, and not translated again:
+    # that would rewrite their directories while they are being imported
+    completed = []
+    if args.import_completed and os.path.isdir(args.output):
+        completed = completedSequences(args.output)
+    translator = migrate.HdaTranslator(args.contentModelDefinition, args.profile, args.csv, args.input,
+                                       args.numberToProcess, args.printToScreen, args.output, args.validate,
+                                       args.seqStart, args.seqEnd, args.countFile, args.sampleFilesDir,
+                                       on_sequence_complete, manifest=migrate.create_manifest(args),
+                                       skip_seqnos=[seqno for seqno, output in completed])
+    start = time.time()
+    try:
+        for seqno, output in completed:
+            on_sequence_complete(seqno, output)
+        translator.run()
+    finally:
+        if translator.manifest:
+            translator.manifest.save()
+        queue.put(None)
+        translationSeconds = time.time() - start
+        importer.join()
+
+    logging.info('Translation time: ' + str(round(translationSeconds, 1)) + ' seconds, ' +
+                 str(round(blocked[0], 1)) + ' of them waiting for the import')
+    logging.info('Total time: ' + str(round(time.time() - start, 1)) + ' seconds, import idle ' +
+                 str(round(importer.idleSeconds, 1)) + ' seconds')
+    logging.info('Imported ' + str(len(importer.imported)) + ' sequence(s)' +
+                 (', failed: ' + ', '.join(importer.failed) if importer.failed else ''))
+    logging.info('End ' + sys.argv[0])
+    if importer.failed:
+        sys.exit(1)
+
+
+#############################################
+if __name__ == "__main__":
+    ScriptProfiler.profileMain(main)
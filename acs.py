@@ -5,15 +5,16 @@ import logging
 from os.path import isfile
 import sys
 
-import yaml
-
-from AcsClient import AcsClient
 import util
+import ScriptProfiler
+
+# AcsClient (and requests), AcsPlanner and AcsState are imported where they are
+# used, so that --help, a bad argument or a missing conf file do not load them
 
 
 #############################################
 # get commandline arguments
-def getArgs():
+def getArgs(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--conf', default='acs.yml', help='conf file')
     parser.add_argument('-f', '--filePlan', help='records management file plan definition', default='filePlan.yml')
@@ -27,7 +28,20 @@ def getArgs():
     use_session_parser.add_argument('--no-use-session', dest='use_session', help='Do not Use session', action='store_false')
     parser.set_defaults(use_session=True)
     parser.add_argument('--url', help='urlbase, e.g. http://localhost:8080')
-    return parser.parse_args()
+    plan_parser = parser.add_mutually_exclusive_group(required=False)
+    plan_parser.add_argument('--plan', action='store_true',
+                             help='read the current state in bulk and print the changes, without making them')
+    plan_parser.add_argument('--apply', action='store_true',
+                             help='read the current state in bulk and make only the changes')
+    plan_parser.add_argument('--verify', action='store_true',
+                             help='read the current state in bulk and report drift from the configuration; '
+                                  'the --state file is cleared when there is any')
+    parser.add_argument('--state', help='state file: resources whose configuration is unchanged since the last '
+                                        'successful run are skipped without any request')
+    parser.add_argument('--parallel', type=int, help='concurrent requests: sites, and the folders within them, are provisioned on this many workers in all '
+                             '(default: 1, or 4 with --plan/--apply)')
+    ScriptProfiler.addArguments(parser)
+    return parser.parse_args(argv)
 
 
 #############################################
@@ -37,11 +51,7 @@ def load_yml_file(file_name):
     if not file_name or not isfile(file_name):
         return None
 
-    ret = {}
-    with open(file_name, 'r') as file:
-        ret = yaml.load(file)
-
-    return ret
+    return util.load_yaml(file_name)
 
 
 #############################################
@@ -54,7 +64,8 @@ def getAcsClient(args, conf):
     if not (user and pw and urlbase):
         return None
     else:
-        return AcsClient(urlbase, user, pw, args.use_session)
+        from AcsClient import AcsClient, POOL_SIZE
+        return AcsClient(urlbase, user, pw, args.use_session, poolSize=max(POOL_SIZE, args.parallel or 4))
 
 
 #############################################
@@ -67,23 +78,28 @@ def syncFolderRules(acs, folder, rules):
     if folder.find("/documentLibrary") < 0:
        folderPath = folder + '/documentLibrary'  # folder path
 
-    folderNode = acs.getNodeByPath(folderPath)
+    folderNode = acs.getNodeByPath(folderPath, fields=['id'])
     if not folderNode:
         logging.warn('folder ' + folder + ' does not exist')
-        return
+        return None
 
     logging.info('sync rules for folder "' + folder)
 
     folderId = folderNode['id']
 
+    from AcsPlanner import ruleChanged
     existingRules = acs.getRules(folderId)
     existingRuleIds = {rule['title']: rule['id'] for rule in existingRules}
+    existingRuleSummaries = {rule['title']: rule for rule in existingRules}
     for rule in rules:
         title = rule['title']
         if title in existingRuleIds:
-            # it is a lot easier and cheap to always update than trying to find if the rule config has changed
-            logging.info('  update rule "' + title + '"for folder ' + folder)
-            result = acs.updateRule(folderId, existingRuleIds[title], rule)
+            # an update makes the repository evaluate the rule again, so only changed rules are updated
+            if ruleChanged(acs, folderId, existingRuleSummaries[title], rule):
+                logging.info('  update rule "' + title + '"for folder ' + folder)
+                result = acs.updateRule(folderId, existingRuleIds[title], rule)
+            else:
+                logging.info('  rule "' + title + '" is unchanged for folder ' + folder)
             del existingRuleIds[title] # delete processed rule
         else:
             logging.info('  create rule "' + title + '" for folder: ' + folder)
@@ -94,49 +110,98 @@ def syncFolderRules(acs, folder, rules):
         logging.info('  delete rule "' + title + '" from folder: ' + folder)
         acs.deleteRule(folderId, ruleId)
 
+    return folderId
+
+#############################################
+# collect rules for each folder
+def collectFolderRules(allRules):
+    folderRules = {}
+    for rule in allRules or []:
+        folders = rule['folders']
+        for f in folders:
+            if f in folderRules:
+                folderRules[f].append(rule['rule'])
+            else:
+                folderRules[f] = [rule['rule']]
+    return folderRules
+
 #############################################
-def syncAllRules(acs, allRules):
+# folders are synced on workers threads
+def syncAllRules(acs, allRules, workers=1, state=None):
     if allRules:
-        # collect rules for each folder
-        folderRules = {}
-        for rule in allRules:
-            folders = rule['folders']
-            for f in folders:
-                if f in folderRules:
-                    folderRules[f].append(rule['rule'])
-                else:
-                    folderRules[f] = [rule['rule']]
+        folderRules = sorted(collectFolderRules(allRules).items())
+        if state:
+            folderRules = skipUnchanged(state, 'rules', folderRules)
+
+        def sync(item):
+            folderId = syncFolderRules(acs, item[0], item[1])
+            if state and folderId:
+                state.record('rules:' + item[0], item[1], {'folder': folderId})
 
         # sync folder rules
-        for f, rules in folderRules.items():
-            syncFolderRules(acs, f, rules)
+        util.parallel_map(sync, folderRules, workers)
 
 #############################################
-# set folder permissions
-def setFolderPermissions(acs, folderId, folderRoles):
-    if not folderRoles:
+# log messages prefixed with the site they belong to, so that the output of
+# sites provisioned concurrently can be told apart
+class SiteLogger(logging.LoggerAdapter):
+    def process(self, msg, kwargs):
+        return '[' + self.extra['site'] + '] ' + msg, kwargs
+
+
+#############################################
+# create a group unless it exists. a concurrent worker may create it first.
+def ensureGroup(acs, group):
+    import requests
+    if acs.getGroup(group, fields=['id']):
         return
+    try:
+        acs.createGroup(group, group)
+    except requests.exceptions.HTTPError as ex:
+        if ex.response.status_code != requests.codes.conflict:
+            raise
+
+
+#############################################
+# set folder permissions, unless the folder has them already: a write makes the
+# repository re-evaluate the ACLs of the whole folder tree.
+# current: the folder permissions (include=permissions), read when None
+def setFolderPermissions(acs, folderId, folderRoles, current=None):
+    if not folderRoles:
+        return False
 
     locallySet = []
     for r in folderRoles:
         if 'role' in r and 'group' in r:
             g = r['group']
-            if not acs.getGroup(g):
-                acs.createGroup(g, g)
             locallySet.append({"authorityId": g if g.startswith('GROUP_') else 'GROUP_' + g,
                                "name": r['role'],
                                "accessStatus": "ALLOWED"
                                })
 
     if len(locallySet) > 0:
+        # the groups are ensured also when the permissions are already set: a group
+        # deleted since is created again, as the run without the check did
+        for r in folderRoles:
+            if 'role' in r and 'group' in r:
+                ensureGroup(acs, r['group'])
         permissions = {"isInheritanceEnabled": "false", "locallySet": locallySet}
+        if current is None:
+            current = acs.getPermissions(folderId)
+        from AcsClient import permissionsChanged
+        if not permissionsChanged(current, permissions):
+            return False
         acs.setPermissions(folderId, permissions)
+        return True
+    return False
 
 
 #############################################
 # create and update sites
+# site -> documentLibrary -> folders stay in order; the folders are created,
+# and their permissions set, on workers threads
 # TODO handle site update
-def createOrUpdateSite(acs, site):
+def createOrUpdateSite(acs, site, workers=1):
     # sanity check
     if not site:
         logging.warn('no site. noop')
@@ -144,11 +209,12 @@ def createOrUpdateSite(acs, site):
 
     # create site if it does not exist
     siteId = site['id']
-    s = acs.getSite(siteId)
+    log = SiteLogger(logging.getLogger(), {'site': siteId})
+    s = acs.getSite(siteId, fields=['id'])
     if s:
-        logging.info('site ' + siteId + ' already exists.')
+        log.info('site ' + siteId + ' already exists.')
     else:
-        logging.info('create site ' + siteId)
+        log.info('create site ' + siteId)
         s = acs.createSite(siteId, site['title'], site['description']);
 
     # add group roles to site
@@ -157,58 +223,167 @@ def createOrUpdateSite(acs, site):
         if 'role' in r and 'group' in r:
             g = acs.getSiteGroup(siteId, r['group'])
             if g and 'role' in g and g['role'] == r['role']:
-                logging.info(
+                log.info(
                     'group ' + r['group'] + ' with role ' + r['role'] + ' already exists on site ' +
                     siteId)
             else:
-                logging.info(
+                log.info(
                     'add group ' + r['group'] + ' with role ' + r['role'] + ' to site ' + siteId)
                 acs.addSiteGroup(siteId, r['group'], r['role'])
 
     # create folders
     folders = site['folders'] if 'folders' in site else []
-    for folder in folders:
-        folderName = folder['name']
-        folderObj = acs.getNodeByPath(siteId + '/documentLibrary/' + folderName)
-        if (folderObj):
-            logging.info('folder ' + folderName + ' already exists')
+    if not folders:
+        return {'site': s['id']}
+
+    docLib = acs.getDocumentLibrary(s['id'])
+    folderNames = [folder['name'] for folder in folders]
+    folderObjs, created = acs.ensureFolders(docLib['id'], folderNames, workers, include=['permissions'])
+    for folderName in folderNames:
+        if folderName in created:
+            log.info('created folder ' + folderName + ' in ' + siteId)
         else:
-            docLib = acs.getDocumentLibrary(s['id'])
-            folderObj = acs.createFolder(docLib['id'], folderName);
-            logging.info('creating folder ' + folderName + ' in ' + siteId)
+            log.info('folder ' + folderName + ' already exists')
+
+    # every folder exists at this point, so their permissions are independent. the
+    # listing has the permissions of the existing folders; a created folder inherits.
+    folders = [folder for folder in folders if 'roles' in folder]
+
+    def setPermissions(folder):
+        folderObj = folderObjs[folder['name']]
+        return setFolderPermissions(acs, folderObj['id'], folder['roles'], folderObj.get('permissions') or {})
+
+    changed = util.parallel_map(setPermissions, folders, workers)
+    if folders:
+        log.info('set permissions of ' + str(sum(changed)) + ' folder(s), ' + str(len(changed) - sum(changed)) +
+                 ' already set')
 
-        if 'roles' in folder:
-            setFolderPermissions(acs, folderObj['id'], folder['roles'])
+    return {'site': s['id'], 'documentLibrary': docLib['id'],
+            'folders': dict((name, folderObjs[name]['id']) for name in folderNames)}
 
 
 #############################################
-# createOrUpdate category
-def createOrUpdateChildCategories(acs, parentId, children):
-    existingChildren = acs.getRecordCategoriesAndFolders(parentId)
-    existingChildrenMap = {c['entry']['name']: {'id': c['entry']['id'], 'nodeType': c['entry']['nodeType']} for c in
-                           existingChildren}
-
-    for child in children:
-        if child['name'] in existingChildrenMap:
-            logging.info('Category ' + child['name'] + ' already exists.')
-            childCategory = existingChildrenMap[child['name']]
-        elif 'nodeType' in child and child['nodeType'] == 'recordFolder':
-            logging.info('Creating folder ' + child['name'])
-            childCategory = acs.createRecordFolder(parentId, child['name'])
-        else:
-            logging.info('Creating category ' + child['name'])
-            childCategory = acs.createRecordCategory(parentId, child['name'])
+# create and update sites on workers threads sharing acs. the workers are split
+# between the sites and the folders within a site, so that there are never more
+# than workers requests at a time.
+def createOrUpdateSites(acs, sites, workers=1, state=None):
+    if state:
+        sites = [site for siteId, site in skipUnchanged(state, 'site', [(site['id'], site) for site in sites])]
+    siteWorkers = max(1, min(workers, len(sites)))
+    folderWorkers = max(1, workers // siteWorkers)
+    if workers > 1:
+        logging.info('provisioning ' + str(len(sites)) + ' site(s) on ' + str(siteWorkers) + ' workers, ' +
+                     str(folderWorkers) + ' for the folders of each')
+
+    def provision(site):
+        ids = createOrUpdateSite(acs, site, folderWorkers)
+        if state:
+            state.record('site:' + site['id'], site, ids)
+
+    util.parallel_map(provision, sites, siteWorkers)
+
+
+#############################################
+# the (name, config) items whose resource kind:name changed since the last
+# run recorded in state
+def skipUnchanged(state, kind, configs):
+    changed = [(name, config) for name, config in configs if not state.unchanged(kind + ':' + name, config)]
+    if len(changed) < len(configs):
+        logging.info(str(len(configs) - len(changed)) + ' ' + kind + '(s) unchanged since the last run, skipped')
+    return changed
+
 
-        if 'children' in child and ('nodeType' not in child or child['nodeType'] != 'recordFolder'):
-            createOrUpdateChildCategories(acs, childCategory['id'], child['children'])  # recursive call
+#############################################
+# create the missing categories and record folders of the file plan level by
+# level. the children of all the parents of a level are listed on workers
+# threads, and then the missing ones are created on workers threads. the
+# children of a category created by this run are not listed, as there are none.
+def createOrUpdateCategories(acs, categories, workers=1):
+    # (parent id or None for the file plan, configured children, whether the parent is new)
+    level = [(None, categories, False)]
+    depth = 0
+    while level:
+        def listChildren(item):
+            parentId, children, new = item
+            if new:
+                return {}
+            existing = acs.getRootRecordCategories() if parentId is None \
+                else acs.getRecordCategoriesAndFolders(parentId)
+            return {c['entry']['name']: {'id': c['entry']['id'], 'nodeType': c['entry']['nodeType']} for c in
+                    existing or []}
+
+        listings = util.parallel_map(listChildren, level, workers)
+
+        nextLevel = []
+        missing = []
+        for (parentId, children, new), existingChildrenMap in zip(level, listings):
+            for child in children:
+                if child['name'] in existingChildrenMap:
+                    logging.info(('Root category ' if parentId is None else 'Category ') + child['name'] +
+                                 ' already exists.')
+                    childCategory = existingChildrenMap[child['name']]
+                    if childCategory['nodeType'] != 'rma:recordFolder':
+                        nextLevel.append((childCategory['id'], child, False))
+                else:
+                    missing.append((parentId, child))
+
+        def create(item):
+            parentId, child = item
+            if parentId is None:
+                logging.info('Creating root category ' + child['name'])
+                return acs.createRootRecordCategory(child['name'])
+            elif 'nodeType' in child and child['nodeType'] == 'recordFolder':
+                logging.info('Creating folder ' + child['name'])
+                return acs.createRecordFolder(parentId, child['name'])
+            else:
+                logging.info('Creating category ' + child['name'])
+                return acs.createRecordCategory(parentId, child['name'])
+
+        for (parentId, child), childCategory in zip(missing, util.parallel_map(create, missing, workers)):
+            nextLevel.append((childCategory['id'], child, True))
+
+        logging.info('file plan level ' + str(depth) + ': ' + str(len([item for item in level if not item[2]])) +
+                     ' listing(s), ' + str(sum(len(item[1]) for item in level) - len(missing)) +
+                     ' existing, ' + str(len(missing)) + ' created')
+
+        # record folders are leaves
+        level = [(childId, child['children'], new) for childId, child, new in nextLevel
+                 if 'children' in child and ('nodeType' not in child or child['nodeType'] != 'recordFolder')]
+        depth += 1
 
 
 #############################################
 # process file plan
-def createOrUpdateFilePlan(acs, filePlan):
+def createOrUpdateFilePlan(acs, filePlan, workers=1, state=None):
     if not filePlan:
         return
 
+    if state and state.unchanged('filePlan', filePlanSite(filePlan)):
+        logging.info('RM site unchanged since the last run, skipped')
+    else:
+        createOrUpdateRmSite(acs, filePlan)
+        if state:
+            state.record('filePlan', filePlanSite(filePlan))
+
+    # add categories and folders
+    categories = [(c['name'], c) for c in filePlan['categories'] or []]
+    if state:
+        categories = skipUnchanged(state, 'category', categories)
+    if categories:
+        createOrUpdateCategories(acs, [c for name, c in categories], workers)
+    if state:
+        for name, category in categories:
+            state.record('category:' + name, category)
+
+
+# the rm site part of a file plan, without its categories
+def filePlanSite(filePlan):
+    return dict((k, v) for k, v in filePlan.items() if k != 'categories')
+
+
+#############################################
+# create the rm site and add its roles
+def createOrUpdateRmSite(acs, filePlan):
     # create RM site if necessary
     siteId = 'rm'
     if acs.getRmSite():
@@ -230,26 +405,6 @@ def createOrUpdateFilePlan(acs, filePlan):
                 logging.info('add group ' + r['group'] + ' with role ' + r['role'] + ' to site ' + siteId)
                 acs.addSiteGroup(siteId, r['group'], r['role'])
 
-    # add categories and folders
-    rootCategories = acs.getRootRecordCategories()
-    rootCategoriesMap = {}
-    if rootCategories:
-        rootCategoriesMap = {c['entry']['name']: {'id': c['entry']['id'], 'nodeType': c['entry']['nodeType']} for c in
-                             rootCategories}
-
-    if filePlan and filePlan['categories']:
-        for rc in filePlan['categories']:
-            category = None
-            if rc['name'] in rootCategoriesMap:
-                category = rootCategoriesMap[rc['name']]
-                logging.info('Root category ' + rc['name'] + ' already exists.')
-            else:
-                logging.info('Creating root category ' + rc['name'])
-                category = acs.createRootRecordCategory(rc['name'])
-
-            if 'children' in rc:
-                createOrUpdateChildCategories(acs, category['id'], rc['children']);
-
 
 #############################################
 # create app user
@@ -262,21 +417,106 @@ def createAdminAppUser(acs, user):
     # create user if it does not exist
     name = user['name']
     password = user['password']
-    u = acs.getUser(name)
+    u = acs.getUser(name, fields=['id', 'capabilities'])
     if u:
         logging.info('app user "' + name + '" already exists')
     else:
         logging.info('create app user "' + name + '"')
         u = acs.createAdminAppUser(name, password)
 
-    if u and not u['capabilities']['isAdmin']:
-        logging.info('add app user "' + name + '" to admin group')
-        acs.addGroupMember('GROUP_ALFRESCO_ADMINISTRATORS', name, 'PERSON')
+    return u
+
+
+#############################################
+# add missing members to a group in one pass. existing members are kept.
+def syncGroupMembers(acs, groupId, members):
+    report = acs.syncGroupMembers(groupId, members, removeExtra=False)
+    for memberId in report['add']:
+        logging.info('add "' + memberId + '" to group ' + groupId)
+    logging.info(str(report['unchanged']) + ' member(s) already in group ' + groupId)
+    return report
+
+
+#############################################
+# admin group and app users are members of ALFRESCO_ADMINISTRATORS. an app user
+# already admin (capabilities.isAdmin), e.g. through a nested group, is not added.
+def syncAdmins(acs, conf):
+    adminMembers = []
+    if conf and conf['adminGroup']:
+        adminGroup = conf['adminGroup'] if conf['adminGroup'].startswith('GROUP_') else 'GROUP_' + conf['adminGroup']
+        if not acs.getGroup(adminGroup, fields=['id']):
+            acs.createGroup(adminGroup, adminGroup)
+        adminMembers.append({"id": adminGroup, "memberType": "GROUP"})
+
+    # create app users
+    if conf and 'adminAppUsers' in conf and conf['adminAppUsers']:
+        for user in conf['adminAppUsers']:
+            u = createAdminAppUser(acs, user)
+            if u and not (u.get('capabilities') or {}).get('isAdmin'):
+                adminMembers.append({"id": user['name'], "memberType": "PERSON"})
+
+    if adminMembers:
+        syncGroupMembers(acs, 'GROUP_ALFRESCO_ADMINISTRATORS', adminMembers)
+
+
+#############################################
+# diff the configuration against the current state and print, or make, the changes
+# with --verify, changes are drift from the configuration last applied: the
+# state is cleared, so that the next run with --state applies everything again
+def planProvisioning(acs, conf, args, state=None):
+    rules = load_yml_file(args.rules) if args.rules else None
+    filePlan = load_yml_file(args.filePlan) if args.filePlan else None
+    from AcsPlanner import AcsPlanner
+    planner = AcsPlanner(acs, conf, rules, filePlan, args.parallel or 4)
+
+    logging.info('reading current state')
+    changes = planner.plan()
+    planner.report(changes)
+    if args.verify and changes:
+        logging.warn('drift: the repository differs from the configuration in ' + str(len(changes)) + ' change(s)')
+        if state:
+            state.forget()
+            state.save()
+    if args.apply and changes:
+        failed = planner.apply(changes)
+        if failed:
+            raise Exception(str(len(failed)) + ' of ' + str(len(changes)) + ' change(s) failed')
+    if args.apply and state:
+        for key, config in stateResources(conf, rules, filePlan):
+            state.record(key, config)
+        state.prune()
+        state.save()
+    return changes
+
+
+#############################################
+# the resources recorded in the state file: (key, desired config)
+def stateResources(conf, rules, filePlan):
+    resources = []
+    if conf and conf.get('rootGroup'):
+        resources.append(('rootGroup', conf['rootGroup']))
+    if conf and (conf.get('adminGroup') or conf.get('adminAppUsers')):
+        resources.append(('admins', adminsConfig(conf)))
+    for site in (conf and conf.get('sites')) or []:
+        resources.append(('site:' + site['id'], site))
+    for folder, folderRules in sorted(collectFolderRules(rules).items()):
+        resources.append(('rules:' + folder, folderRules))
+    if filePlan:
+        resources.append(('filePlan', filePlanSite(filePlan)))
+        for category in filePlan['categories'] or []:
+            resources.append(('category:' + category['name'], category))
+    return resources
+
+
+# admin group and app user names; passwords are left out of the state
+def adminsConfig(conf):
+    return {'adminGroup': conf and conf.get('adminGroup'),
+            'adminAppUsers': [user['name'] for user in (conf and conf.get('adminAppUsers')) or []]}
 
 
 #############################################
 # main
-def main():
+def main(argv=None):
     # config logging
     # TODO get log file and level from config file
     logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s', datefmt='%m/%d/%Y %H:%M:%S',
@@ -285,38 +525,46 @@ def main():
     logging.info('start ' + sys.argv[0])
 
     # get commandline arguments
-    args = getArgs()
+    args = getArgs(argv)
     conf = util.getConfig(args.conf, args.stage)
 
     # get ACS client
     acs = getAcsClient(args, conf)
+    state = None
+    if args.state:
+        from AcsState import AcsState
+        state = AcsState(args.state, acs.urlbase)
+
+    if args.plan or args.apply or args.verify:
+        changes = planProvisioning(acs, conf, args, state)
+        logging.info('end ' + sys.argv[0])
+        if args.verify and changes:
+            sys.exit(1)
+        return acs
 
     # create root group if it does not exist
-    if conf and conf['rootGroup']:
-        if not acs.getGroup(conf['rootGroup']):
+    if conf and conf['rootGroup'] and not (state and state.unchanged('rootGroup', conf['rootGroup'])):
+        if not acs.getGroup(conf['rootGroup'], fields=['id']):
             acs.createRootGroup(conf['rootGroup'], conf['rootGroup'])
+        if state:
+            state.record('rootGroup', conf['rootGroup'])
 
-    if conf and conf['adminGroup']:
-        adminGroup = conf['adminGroup'] if conf['adminGroup'].startswith('GROUP_') else 'GROUP_' + conf['adminGroup']
-        if not acs.getGroup(adminGroup):
-            acs.createGroup(adminGroup, adminGroup)
-        acs.addGroupMember('ALFRESCO_ADMINISTRATORS', adminGroup)
-
-    # create app users
-    if conf and 'adminAppUsers' in conf and conf['adminAppUsers']:
-        for user in conf['adminAppUsers']:
-            createAdminAppUser(acs, user);
+    if state and state.unchanged('admins', adminsConfig(conf)):
+        logging.info('admins unchanged since the last run, skipped')
+    else:
+        syncAdmins(acs, conf)
+        if state:
+            state.record('admins', adminsConfig(conf))
 
     # create and update sites
     if conf and conf['sites']:
-        for site in conf['sites']:
-            createOrUpdateSite(acs, site);
+        createOrUpdateSites(acs, conf['sites'], args.parallel or 1, state)
 
     # create and update rules
     rules = None
     if args.rules:
         rules = load_yml_file(args.rules)
-        syncAllRules(acs, rules)
+        syncAllRules(acs, rules, args.parallel or 1, state)
 
     # file plan
     filePlan = None
@@ -324,7 +572,12 @@ def main():
         filePlan = load_yml_file(args.filePlan)
 
     if filePlan:
-        createOrUpdateFilePlan(acs, filePlan)
+        createOrUpdateFilePlan(acs, filePlan, args.parallel or 1, state)
+
+    # resources removed from the configuration are forgotten
+    if state:
+        state.prune()
+        state.save()
 
     logging.info('end ' + sys.argv[0])
 
@@ -333,4 +586,4 @@ def main():
 
 #############################################
 if __name__ == "__main__":
-    main()
+    ScriptProfiler.profileMain(main)
@@ -0,0 +1,77 @@
+#!/usr/bin/python2.7
+# translate every <name>~<seqno>.hda file below a wcc origin folder into
+# <output>/<seqno>, and copy the content of <origin>/<seqno> next to it, in one
+# process (see prepare_wcc_for_acs/convertWccFolders.sh). a summary of the run
+# is written as json.
+#
+# example:
+# ./convert-wcc-folders.py /origin/folder /output/folder PROFILE_1 -m content_models.yml --validate
+#
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from ContentManifest import ContentManifest
+import migrate
+import ScriptProfiler
+import util
+
+
+#############################################
+# get commandline arguments
+def getArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('origin', help='wcc folder with the *~*.hda files and a <seqno> content folder for each')
+    parser.add_argument('output', help='output directory, with a <seqno> directory for each .hda file')
+    parser.add_argument('profile', help='the profile to load from the content model definition')
+    parser.add_argument('-m', '--contentModelDefinition', default='content_models.yml',
+                        help='the definition of the content model')
+    parser.add_argument('--csvDir', help='directory for an export-<seqno>.csv of the data of each .hda file')
+    parser.add_argument('-c', '--countFile', help='name_field_value_count file to start from')
+    parser.add_argument('--validate', action='store_true', help='validate data based on field type')
+    parser.add_argument('--manifest', help='csv file recording size, sha256 and type of the content of every '
+                                           'document, and the missing and duplicate ones; reused by the next run')
+    parser.add_argument('--manifest-workers', type=int, default=8, help='content files hashed at a time')
+    parser.add_argument('--copy-workers', type=int, default=8, help='content files copied at a time')
+    parser.add_argument('--summary', help='summary file (json), default <output>/convert_summary.json')
+    ScriptProfiler.addArguments(parser)
+    return parser.parse_args()
+
+
+#############################################
+# main
+def main():
+    logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s', datefmt='%m/%d/%Y %H:%M:%S',
+                        level=logging.INFO)
+    logging.info('Start ' + sys.argv[0])
+    args = getArgs()
+
+    if args.csvDir:
+        util.make_dirs(args.csvDir)
+    manifest = ContentManifest(args.manifest, args.manifest_workers) if args.manifest else None
+    translator = migrate.HdaTranslator(args.contentModelDefinition, args.profile, None, args.origin, None, False,
+                                       args.output, args.validate, 1, -1, args.countFile, manifest=manifest)
+    converter = migrate.WccFolderConverter(translator, args.origin, args.output, args.csvDir, args.copy_workers)
+    try:
+        summary = converter.run()
+    finally:
+        manifestSummary = manifest.save() if manifest else None
+    if manifestSummary:
+        summary['manifest'] = manifestSummary
+
+    summaryFile = args.summary or os.path.join(args.output, 'convert_summary.json')
+    with open(summaryFile, 'w') as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
+    logging.info('Summary: ' + summaryFile)
+    logging.info('End ' + sys.argv[0])
+    if summary['failed']:
+        sys.exit(1)
+
+
+#############################################
+if __name__ == "__main__":
+    ScriptProfiler.profileMain(main)
@@ -7,19 +7,23 @@
 
 import argparse
 import csv
+import fnmatch
 import logging
 import os
 import time
 from datetime import datetime
-from xml.dom import minidom
 from xml.etree import ElementTree
 from xml.etree.ElementTree import Element, SubElement
 
-import yaml
-
 import util
+import ScriptProfiler
+from ContentManifest import ContentManifest
+from SequenceArchive import COMPRESSIONS, SequenceArchive, archiveFile
 
-import cPickle as pickle
+try:
+    import cPickle as pickle
+except ImportError:  # python 3
+    import pickle
 
 # script version and run time
 __version__ = '1.0'
@@ -190,7 +194,8 @@ class HdaParser:
 
 
 class WccXmlWriter:
-    def __init__(self, wcc_data, should_validate_field_value, sample_files):
+    # archive: SequenceArchive the files are written to, instead of below output_base
+    def __init__(self, wcc_data, should_validate_field_value, sample_files, archive=None):
         self.wcc_data = wcc_data
         self.primary_file_field_index = self.wcc_data.field_names.index('primaryFile')
         self.account_field_index = self.wcc_data.field_names.index('dDocAccount')
@@ -199,6 +204,9 @@ class WccXmlWriter:
         self.scan_date_field_index = self.wcc_data.field_names.index('xuwScanDate')
         self.should_validate_field_value = should_validate_field_value
         self.sample_files = sample_files
+        self.archive = archive
+        # name (cm:name) of each document written, by index
+        self.document_names = {}
 
     def write_xml_files(self, output_base, print_to_screen):
         for i in range(0, self.wcc_data.number_of_data_rows):
@@ -212,17 +220,39 @@ class WccXmlWriter:
                     if self.sample_files.get(file_ext, i):
                         self.__write_xml_file(xml_doc, primary_file_name, output)
                         self.__link_content_file(primary_file_name, file_ext, output, i)
+                        self.document_names[i] = document_name(xml_doc, primary_file_name)
                     else:
                         logging.debug("  missing ext " + file_ext + " in sample files")
                 else:
                     primary_file = self.wcc_data.data_rows[i][self.primary_file_field_index]
                     self.__write_xml_file(xml_doc, primary_file_name, output)
                     self.__link_content_file(primary_file_name, file_ext, output, i)
+                    self.document_names[i] = document_name(xml_doc, primary_file_name)
 
             except InvalidDocument as error:
                 #if there is an invalid document, don't write the file and just return an error message
                 logging.error(error.get_error_message())
 
+    # dID, content file, path in the output and name in the repository of every
+    # document, for the content manifest; the name is blank for a document not written
+    def content_documents(self, output_base):
+        id_field_index = self.wcc_data.field_names.index('dID') if 'dID' in self.wcc_data.field_names else None
+        documents = []
+        for i in range(0, self.wcc_data.number_of_data_rows):
+            file_ext = self.__get_primary_file_ext(i)
+            if self.sample_files:
+                source = self.sample_files.get(file_ext, i)
+                if not source:
+                    continue
+            else:
+                source = os.path.join(self.wcc_data.basedir, self.wcc_data.data_rows[i][self.primary_file_field_index])
+            documents.append({'dID': self.wcc_data.data_rows[i][id_field_index] if id_field_index is not None else i,
+                              'source': source,
+                              'output': os.path.join(self.__get_doc_output_dir(i, output_base),
+                                                     self.__get_primary_file_name(i)),
+                              'name': self.document_names.get(i, '')})
+        return documents
+
     def __get_primary_file_name(self, document_index):
         primary_file = self.wcc_data.data_rows[document_index][self.primary_file_field_index]
         primary_file_name = os.path.basename(primary_file)
@@ -255,35 +285,28 @@ class WccXmlWriter:
         primary_file = os.path.join(self.wcc_data.basedir, self.wcc_data.data_rows[idx][self.primary_file_field_index])
         srcfile = self.sample_files.get(file_ext, idx) if self.sample_files else primary_file
         dest = os.path.join(xml_file_output_dir, primary_file_name)
-        if not os.path.exists(dest):
+        if self.archive:
+            self.archive.addContent(dest, srcfile)
+        elif not os.path.exists(dest):
             os.system('ln -s ' + srcfile + ' ' +  dest)  # os.symlink does not work with '@' in path
 
     def __write_xml_file(self, xml_doc, primary_file_name, xml_file_output_dir):
-        def append_doc_type(xml_file):  # ElemenTree is unable to add DOCTYPE
-            with open(xml_file, 'r') as f:
-                content = f.readlines()
-
-            final_content = content[:1]
-            final_content.append(
-                '<!DOCTYPE properties SYSTEM "http://java.sun.com/dtd/properties.dtd">')
-            final_content.extend(content[1:])
-
-            with open(xml_file, 'w') as f:
-                f.writelines(final_content)
-
-        util.make_dirs(xml_file_output_dir)
-
         xml_file_name = primary_file_name + ".metadata.properties.xml"
         xml_file = os.path.join(xml_file_output_dir, xml_file_name)
         logging.debug('  writing to xml: ' + xml_file)
 
-        # xml_declaration=True is not supported by python 2.6.6 on uwctprod01
-        ElementTree.ElementTree(xml_doc).write(xml_file, encoding='UTF-8')
-        append_doc_type(xml_file)
+        content = util.metadata_xml(xml_doc)
+
+        if self.archive:
+            self.archive.addBytes(xml_file, content)
+            return
+        util.make_dirs(xml_file_output_dir)
+        with open(xml_file, 'wb') as f:
+            f.write(content)
 
     def __print_xml_to_screen(self, xml_doc, print_to_screen):
         if print_to_screen:
-            print self.__prettify_xml(xml_doc)
+            print(self.__prettify_xml(xml_doc))
 
     def __create_xml(self, document_index):
         def add_content_type(document):
@@ -365,6 +388,7 @@ class WccXmlWriter:
 
     def __prettify_xml(self, elem):
         rough_string = ElementTree.tostring(elem, 'utf-8')
+        from xml.dom import minidom
         reparsed = minidom.parseString(rough_string)
         return reparsed.toprettyxml(indent="  ")
 
@@ -372,7 +396,9 @@ class WccXmlWriter:
 class HdaTranslator:
     def __init__(self, content_model_definition_file, content_model_profile, csv_file,
                  wcc_archives_input_dir, number_of_docs_to_process, print_to_screen, output_directory,
-                 should_validate_field_value, seqStart, seqEnd, countFile, sample_files_dir=None):
+                 should_validate_field_value, seqStart, seqEnd, countFile, sample_files_dir=None,
+                 on_sequence_complete=None, archive_mode=None, archive_compression=None, manifest=None,
+                 skip_seqnos=None):
         self.content_model_definition_file = content_model_definition_file
         self.content_model_profile = content_model_profile
         self.csv_file = csv_file
@@ -387,7 +413,21 @@ class HdaTranslator:
 
         self.sample_files = SampleFiles(sample_files_dir) if sample_files_dir else None
 
-    def process_one_hda_file(self, parser, hda_input_file, output_directory):
+        # called with (seqno, output directory) once a sequence is completely written
+        self.on_sequence_complete = on_sequence_complete
+
+        # 'dereference' or 'reference': write each sequence as one archive (see SequenceArchive)
+        self.archive_mode = archive_mode
+        self.archive_compression = archive_compression
+
+        # ContentManifest the content of each sequence is recorded in
+        self.manifest = manifest
+
+        # seqnos not translated again, e.g. complete sequences already being imported
+        self.skip_seqnos = set(skip_seqnos or [])
+
+    # archive: SequenceArchive the sequence is written to, instead of below output_directory
+    def process_one_hda_file(self, parser, hda_input_file, output_directory, archive=None):
         start_time = time.time()
 
         # Translate Results
@@ -396,24 +436,31 @@ class HdaTranslator:
 
         logging.info('Processing ' + hda_input_file)
         logging.info('  number of data rows: ' + str(wcc_data.number_of_data_rows))
-        logging.info('  output directory: ' + output_directory)
+        logging.info('  output ' + ('archive: ' + archive.path if archive else 'directory: ' + output_directory))
 
         if self.csv_file:
             wcc_data.write_csv(self.csv_file)
 
-        if output_directory:
-            wcc_xml_writer = WccXmlWriter(wcc_data, self.should_validate_field_value, self.sample_files)
-            wcc_xml_writer.write_xml_files(output_directory, self.print_to_screen)
+        if output_directory or archive:
+            wcc_xml_writer = WccXmlWriter(wcc_data, self.should_validate_field_value, self.sample_files, archive)
+            wcc_xml_writer.write_xml_files(archive.prefix if archive else output_directory, self.print_to_screen)
+            if self.manifest:
+                seqno = hda_seqno(os.path.basename(hda_input_file))
+                self.manifest.addDocuments(seqno, wcc_xml_writer.content_documents(seqno))
 
         end_time = time.time()
         logging.info('  duration: ' + str(end_time - start_time) + ' seconds')
+        return wcc_data
 
-    def run(self):
-        # Load Content Model
+    # parser for the content model profile, loaded once for all .hda files
+    def create_parser(self):
         content_model_definition = self.__load_content_model(self.content_model_definition_file,
                                                              self.content_model_profile)
-        # Parse HDA File
-        parser = HdaParser(content_model_definition)
+        return HdaParser(content_model_definition)
+
+    def run(self):
+        # Load Content Model and Parse HDA File
+        parser = self.create_parser()
 
         # nested function used to sort files on sequence number
         def take_seq(f):
@@ -434,7 +481,7 @@ class HdaTranslator:
                 seqno = f.split('~')[1].split('.')[0]
                 iSeqno = int(seqno)   # seqno is always an integer
                 count_file = count_file_dir + '/' + f + '.count'
-                if iSeqno < self.seqStart or (self.seqEnd > 0 and iSeqno > self.seqEnd):
+                if iSeqno < self.seqStart or (self.seqEnd > 0 and iSeqno > self.seqEnd) or seqno in self.skip_seqnos:
                     prev_count_file = count_file
                     continue
 
@@ -445,16 +492,43 @@ class HdaTranslator:
                     with open(prev_count_file, 'rb') as handle:
                         name_field_value_count = pickle.load(handle)
 
-                if not os.path.exists(output):
-                    os.makedirs(output)
+                # a sequence being (re)written is not complete
+                complete_file = sequence_complete_file(self.output_directory, seqno)
+                if os.path.exists(complete_file):
+                    os.remove(complete_file)
 
-                self.process_one_hda_file(parser, inputFile, output)
+                if self.archive_mode:
+                    self.__process_one_hda_file_to_archive(parser, inputFile, seqno)
+                else:
+                    if not os.path.exists(output):
+                        os.makedirs(output)
+                    self.process_one_hda_file(parser, inputFile, output)
 
                 # save count file for use by next .hda file
                 with open(count_file, 'wb') as handle:
                     pickle.dump(name_field_value_count, handle, protocol=pickle.HIGHEST_PROTOCOL)
                 prev_count_file = count_file
 
+                # mark the sequence complete, so that it can be imported
+                with open(complete_file, 'w') as handle:
+                    handle.write(str(datetime.now()) + '\n')
+                if self.on_sequence_complete:
+                    self.on_sequence_complete(seqno, output)
+
+    # write a sequence as <output>/<seqno>.tar[.<compression>] and its index
+    def __process_one_hda_file_to_archive(self, parser, hda_input_file, seqno):
+        archive = SequenceArchive(archiveFile(self.output_directory, seqno, self.archive_compression), seqno,
+                                  self.archive_compression, self.archive_mode == 'dereference')
+        try:
+            self.process_one_hda_file(parser, hda_input_file, None, archive)
+        except BaseException:
+            archive.abort()
+            raise
+        stats = archive.close()
+        logging.info('  archived ' + str(stats['metadata']) + ' metadata file(s), ' + str(stats['content']) +
+                     ' content file(s), ' + str(stats['link']) + ' link(s), ' + str(stats['missing']) +
+                     ' missing, ' + str(stats['bytes']) + ' bytes')
+
     # derive wcc field name from from acs field name, if wcc field name is not specified
     def __get_fields(self, rawfields):
         processed_fields = []
@@ -475,7 +549,7 @@ class HdaTranslator:
     def __load_content_model(self, file_name, profile_name):
         content_model_definition = None
         with open(file_name, 'r') as file:
-            content_model_yml = yaml.load(file)
+            content_model_yml = util.load_yaml(file)
 
             # common section
             common_section = content_model_yml['common']
@@ -505,7 +579,132 @@ class HdaTranslator:
         return content_model_definition
 
 
-def parse_arguments():
+# marker written next to <output>/<seqno> when all files of the sequence are written
+def sequence_complete_file(output_directory, seqno):
+    return output_directory + '/' + seqno + '.complete'
+
+
+# the cm:name of a document's metadata, which the bulk import names the node with, or default
+def document_name(xml_doc, default):
+    for entry in xml_doc.findall('entry'):
+        if entry.get('key') == 'cm:name' and entry.text:
+            return entry.text
+    return default
+
+
+# seqno of a wcc archive file <name>~<seqno>.hda
+def hda_seqno(f):
+    return f.split('~')[1].split('.')[0]
+
+
+# translate every <name>~<seqno>.hda file found below an origin directory into
+# <output>/<seqno> and copy the content files of <origin>/<seqno> next to it, in
+# one process: the content model is loaded once and name_field_value_count
+# carries over from one sequence to the next. content is copied on a pool of
+# copy_workers threads while the next sequences are translated.
+class WccFolderConverter:
+    def __init__(self, translator, origin_directory, output_directory, csv_directory=None, copy_workers=8):
+        self.translator = translator
+        self.origin_directory = origin_directory
+        self.output_directory = output_directory
+        self.csv_directory = csv_directory
+        self.copy_workers = copy_workers
+
+    # .hda files in sequence order
+    def find_hda_files(self):
+        hda_files = []
+        for dirpath, dirnames, filenames in os.walk(self.origin_directory):
+            for f in filenames:
+                if fnmatch.fnmatch(f, '*~*.hda') and hda_seqno(f).isdigit():
+                    hda_files.append(os.path.join(dirpath, f))
+        return sorted(hda_files, key=lambda f: int(hda_seqno(os.path.basename(f))))
+
+    # content files of a sequence and where they are copied to
+    def content_files(self, seqno, output):
+        files = []
+        for dirpath, dirnames, filenames in os.walk(os.path.join(self.origin_directory, seqno)):
+            for f in filenames:
+                files.append((os.path.join(dirpath, f), os.path.join(output, f)))
+        return files
+
+    # ('copied', bytes), ('skipped', 0) for a file already copied, or ('failed', 0).
+    # the copy goes to <dest>.part, renamed when complete, so that a copy cut short
+    # by a failed or interrupted run is never taken for a copied file
+    @staticmethod
+    def copy_content_file(paths):
+        src, dest = paths
+        part = dest + '.part'
+        try:
+            if os.path.exists(dest) and os.path.getsize(dest) == os.path.getsize(src):
+                return 'skipped', 0
+            size = util.copy_file(src, part)
+            os.rename(part, dest)
+            return 'copied', size
+        except (IOError, OSError) as ex:
+            logging.error('failed to copy ' + src + ': ' + str(ex))
+            if os.path.exists(part):
+                os.remove(part)
+            return 'failed', 0
+
+    def run(self):
+        global name_field_value_count
+        start_time = time.time()
+        parser = self.translator.create_parser()
+        hda_files = self.find_hda_files()
+        logging.info('found ' + str(len(hda_files)) + ' .hda file(s) in ' + self.origin_directory)
+
+        count_file_dir = self.output_directory + '/count_files'
+        util.make_dirs(count_file_dir)
+        if self.translator.countFile and os.path.isfile(self.translator.countFile):
+            with open(self.translator.countFile, 'rb') as handle:
+                name_field_value_count = pickle.load(handle)
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(max(1, self.copy_workers))
+        sequences = []
+        try:
+            for hda_file in hda_files:
+                seqno = hda_seqno(os.path.basename(hda_file))
+                output = self.output_directory + '/' + seqno
+                util.make_dirs(output)
+                if self.csv_directory:
+                    self.translator.csv_file = self.csv_directory + '/export-' + seqno + '.csv'
+
+                translate_start = time.time()
+                wcc_data = self.translator.process_one_hda_file(parser, hda_file, output)
+                with open(count_file_dir + '/' + os.path.basename(hda_file) + '.count', 'wb') as handle:
+                    pickle.dump(name_field_value_count, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+                files = self.content_files(seqno, output)
+                sequences.append({'seqno': seqno, 'hdaFile': hda_file, 'rows': wcc_data.number_of_data_rows,
+                                  'translationSeconds': round(time.time() - translate_start, 3),
+                                  'copies': pool.map_async(self.copy_content_file, files, chunksize=16)})
+        finally:
+            pool.close()
+            pool.join()
+
+        summary = {'origin': self.origin_directory, 'output': self.output_directory, 'sequences': [],
+                   'rows': 0, 'copied': 0, 'skipped': 0, 'failed': 0, 'bytes': 0}
+        for sequence in sequences:
+            results = sequence.pop('copies').get()
+            for key in ('copied', 'skipped', 'failed'):
+                sequence[key] = len([r for r in results if r[0] == key])
+                summary[key] += sequence[key]
+            sequence['bytes'] = sum(r[1] for r in results)
+            summary['bytes'] += sequence['bytes']
+            summary['rows'] += sequence['rows']
+            summary['sequences'].append(sequence)
+        summary['seconds'] = round(time.time() - start_time, 3)
+        summary['finishedAt'] = str(datetime.now())
+
+        logging.info('converted ' + str(len(sequences)) + ' sequence(s), ' + str(summary['rows']) + ' row(s); ' +
+                     'copied ' + str(summary['copied']) + ' file(s) (' + str(summary['bytes']) + ' bytes), ' +
+                     str(summary['skipped']) + ' existing, ' + str(summary['failed']) + ' failed, in ' +
+                     str(summary['seconds']) + ' seconds')
+        return summary
+
+
+def get_argument_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', '--input', help='The input directory', required=True)
     parser.add_argument('--csv', help='An optional csv file for output of all the migrated data')
@@ -525,7 +724,25 @@ def parse_arguments():
     parser.add_argument('-c', '--countFile', help='name_field_value_count file to use for sequence 1')
     parser.add_argument('--validate', help='Validate data based on field type, and print to screen',
                         action='store_true')
-    return parser.parse_args()
+    parser.add_argument('--archive', choices=['dereference', 'reference'],
+                        help='write each sequence as one <output>/<seqno>.tar archive with an index, with the '
+                             'content stored in it (dereference) or linked to (reference)')
+    parser.add_argument('--archiveCompression', choices=COMPRESSIONS, default='none',
+                        help='compression of the --archive files')
+    parser.add_argument('--manifest', help='csv file recording size, sha256 and type of the content of every '
+                                           'document, and the missing and duplicate ones; reused by the next run')
+    parser.add_argument('--manifestWorkers', type=int, default=8, help='content files hashed at a time')
+    ScriptProfiler.addArguments(parser)
+    return parser
+
+
+# the content manifest of the --manifest argument, or None
+def create_manifest(args):
+    return ContentManifest(args.manifest, args.manifestWorkers) if args.manifest else None
+
+
+def parse_arguments():
+    return get_argument_parser().parse_args()
 
 
 def configure_logging():
@@ -553,14 +770,21 @@ def main():
                                args.seqStart,
                                args.seqEnd,
                                args.countFile,
-                               args.sampleFilesDir)
+                               args.sampleFilesDir,
+                               archive_mode=args.archive,
+                               archive_compression=args.archiveCompression,
+                               manifest=create_manifest(args))
     start_time = time.time()
 
-    translator.run()
+    try:
+        translator.run()
+    finally:
+        if translator.manifest:
+            translator.manifest.save()
 
     end_time = time.time()
     logging.info('Translation time: ' + str(end_time - start_time) + " seconds")
 
 
 if __name__ == "__main__":
-    main()
+    ScriptProfiler.profileMain(main)
@@ -41,19 +41,14 @@ fi
 
 rm -rf $OUTPUT_FOLDER/*
 
-find $ORIGIN_FOLDER -name "*~*.hda" | while read hdaFile; do
-    echo "$hdaFile"
-    FOLDER_NUMBER=`echo "$hdaFile" | sed 's/.*~\(.*\).hda/\1/'`
-    echo "$FOLDER_NUMBER"
-    
-    mkdir $OUTPUT_FOLDER/$FOLDER_NUMBER
-    
-    ACTUAL_ORIGIN_FOLDER=$ORIGIN_FOLDER/$FOLDER_NUMBER
-    ACTUAL_OUTPUT_FOLDER=$OUTPUT_FOLDER/$FOLDER_NUMBER
-    
-    python2 ../migrate.py -i  $hdaFile --contentModelDefinition=../content_models.yml --csv=./export-$(date +%s).csv -o $ACTUAL_OUTPUT_FOLDER -p $PROFILE --validate
-    
-    find $ACTUAL_ORIGIN_FOLDER -type f -exec cp -i {} $ACTUAL_OUTPUT_FOLDER \;
-done
-
+# python 3 copies the content in the kernel (os.sendfile); python 2 copies it
+# through the process. PYTHON=python2 ./convertWccFolders.sh ... forces one.
+PYTHON=${PYTHON:-$(command -v python3 || command -v python2)}
+if ! "$PYTHON" -c 'import os, sys; sys.exit(not hasattr(os, "sendfile"))'; then
+    echo "$PYTHON has no os.sendfile, the content is copied through the process (slower)" 1>&2
+fi
 
+# one process for all the .hda files: the content model is loaded once, the
+# name counts carry over between files and the content is copied in parallel
+"$PYTHON" ../convert-wcc-folders.py "$ORIGIN_FOLDER" "$OUTPUT_FOLDER" "$PROFILE" \
+    --contentModelDefinition=../content_models.yml --csvDir=./export-$(date +%s) --validate
@@ -0,0 +1,102 @@
+#!/usr/bin/python2.7
+# unpack the sequence archives written by migrate.py --archive into the bulk
+# import layout <output>/<seqno>/<account>/<year>/<month>/<day>, check each
+# against its index, and mark the sequence complete (<output>/<seqno>.complete)
+# for acs-bulk-import.py or acs-migrate-import.py --import-completed.
+#
+# example:
+# ./unpack-sequence-archives.py /transfer/*.tar.gz -o /acs_import --relink /wcc/archives=/mnt/wcc/archives
+#
+
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+
+import ScriptProfiler
+import migrate
+import util
+from SequenceArchive import readIndex, unpackArchive
+
+
+#############################################
+# get commandline arguments
+def getArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('archives', nargs='+', help='<seqno>.tar[.gz|.bz2|.xz] files written by migrate.py --archive')
+    parser.add_argument('-o', '--output', required=True, help='bulk import source directory to unpack into')
+    parser.add_argument('--relink', metavar='OLD=NEW',
+                        help='replace the OLD prefix of linked content (--archive reference) with NEW')
+    parser.add_argument('--workers', type=int, default=2, help='archives unpacked at a time')
+    ScriptProfiler.addArguments(parser)
+    args = parser.parse_args()
+    if args.relink and '=' not in args.relink:
+        parser.error('--relink takes OLD=NEW')
+    return args
+
+
+# seqno of an archive file, e.g. 12 for /transfer/12.tar.gz
+def archiveSeqno(path):
+    return os.path.basename(path).split('.tar')[0]
+
+
+#############################################
+# unpack one archive; its sequence is marked complete when every member of the index is there
+def unpackSequence(path, output, relink=None):
+    seqno = archiveSeqno(path)
+    completeFile = migrate.sequence_complete_file(output, seqno)
+    if os.path.exists(completeFile):
+        os.remove(completeFile)
+
+    try:
+        stats = unpackArchive(path, output, relink)
+    except Exception as ex:
+        logging.error('failed to unpack ' + path + ': ' + str(ex))
+        return {'archive': path, 'error': str(ex)}
+
+    if os.path.isfile(path + '.index'):
+        expected = readIndex(path)
+        for kind in ('metadata', 'content', 'link'):
+            if stats[kind] != expected[kind]:
+                stats['error'] = (kind + ': ' + str(stats[kind]) + ' unpacked, ' + str(expected[kind]) +
+                                  ' in the index')
+                logging.error(path + ': ' + stats['error'])
+                return stats
+        if expected['missing']:
+            logging.warn(path + ': ' + str(expected['missing']) + ' content file(s) were missing when archived')
+    else:
+        logging.warn('no index for ' + path + ', not checked')
+
+    with open(completeFile, 'w') as handle:
+        handle.write(str(datetime.now()) + '\n')
+    logging.info('unpacked ' + path + ': ' + str(stats['metadata']) + ' metadata file(s), ' +
+                 str(stats['content']) + ' content file(s), ' + str(stats['link']) + ' link(s) in ' +
+                 str(stats['seconds']) + ' seconds')
+    return stats
+
+
+#############################################
+# main
+def main():
+    logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s', datefmt='%m/%d/%Y %H:%M:%S',
+                        level=logging.INFO)
+    logging.info('Start ' + sys.argv[0])
+    args = getArgs()
+
+    util.make_dirs(args.output)
+    relink = tuple(args.relink.split('=', 1)) if args.relink else None
+    archives = sorted(args.archives, key=lambda a: int(archiveSeqno(a)) if archiveSeqno(a).isdigit() else -1)
+    results = util.parallel_map(lambda a: unpackSequence(a, args.output, relink), archives, args.workers)
+
+    failed = [r['archive'] for r in results if r.get('error')]
+    logging.info('unpacked ' + str(len(results) - len(failed)) + ' archive(s)' +
+                 (', failed: ' + ', '.join(failed) if failed else ''))
+    logging.info('End ' + sys.argv[0])
+    if failed:
+        sys.exit(1)
+
+
+#############################################
+if __name__ == "__main__":
+    ScriptProfiler.profileMain(main)
@@ -1,5 +1,10 @@
-import os, errno
-import yaml
+import os, errno, shutil
+import hashlib
+import io
+import json
+
+# yaml and multiprocessing are imported when first needed, which keeps them out
+# of the startup of the scripts (e.g. --help) and of the modules that never use them
 
 def make_dirs(path):
     try:
@@ -10,20 +15,128 @@ def make_dirs(path):
         else:
             raise
 
-# load conf file (yml)
-def getConfig(filename, stage='dev'):
+# copy the content of src to dst and return the bytes copied. sendfile (python 3)
+# copies in the kernel, without reading the file into the process.
+def copy_file(src, dst, chunk_size=1024 * 1024):
+    with open(src, 'rb') as fsrc:
+        with open(dst, 'wb') as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            if hasattr(os, 'sendfile'):
+                try:
+                    offset = 0
+                    while offset < size:
+                        sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, size - offset)
+                        if not sent:
+                            break
+                        offset += sent
+                    return offset
+                except OSError:  # e.g. not supported by the file system
+                    fsrc.seek(0)
+                    fdst.seek(0)
+                    fdst.truncate()
+            shutil.copyfileobj(fsrc, fdst, chunk_size)
+            return size
+
+# content of a shadow metadata file: the properties element with its DOCTYPE
+def metadata_xml(xml_doc):
+    import io
+    from xml.etree import ElementTree
+    # xml_declaration=True is not supported by python 2.6.6 on uwctprod01
+    buf = io.BytesIO()
+    ElementTree.ElementTree(xml_doc).write(buf, encoding='UTF-8')
+    content = buf.getvalue()
+    # ElemenTree is unable to add DOCTYPE, add it after the xml declaration
+    end = content.find(b'\n') + 1 if content.startswith(b'<?xml') else 0
+    return content[:end] + b'<!DOCTYPE properties SYSTEM "http://java.sun.com/dtd/properties.dtd">' + content[end:]
+
+# call func for each item on a bounded pool of threads. results keep the order
+# of items, and the first exception raised by func is re-raised.
+def parallel_map(func, items, workers=4):
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(func, items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+# parse yaml from a file name or an open file, with the C LibYAML loader when
+# PyYAML was built with it. either loader is a safe one: plain yaml types only.
+def load_yaml(source):
+    import yaml
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    if hasattr(source, 'read'):
+        return yaml.load(source, Loader=loader)
+    with open(source, 'r') as file:
+        return yaml.load(file, Loader=loader)
+
+# environment variable that switches on the config cache of getConfig, when set to 1
+CONFIG_CACHE_ENV = 'ACS_CONFIG_CACHE'
+
+# file the merged config of a conf file and stage is kept in between runs,
+# next to the conf file: .<name>.<stage>.cache.json (ignored by git)
+def _config_cache_file(filename, stage):
+    directory, name = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, '.' + name + '.' + str(stage) + '.cache.json')
+
+def _read_config_cache(cache_file, key):
+    try:
+        with open(cache_file, 'r') as f:
+            cached = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    return cached['config'] if isinstance(cached, dict) and cached.get('key') == key else None
+
+# written atomically and readable by the owner only, as a conf file holds passwords;
+# a config that json cannot hold as is (e.g. dates, number keys), or a directory that is
+# not writable, is not cached
+def _write_config_cache(cache_file, key, config):
+    tmp = cache_file + '.' + str(os.getpid()) + '.tmp'
+    try:
+        data = json.dumps({'key': key, 'config': config})
+        if json.loads(data)['config'] != config:
+            return
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.rename(tmp, cache_file)
+    except (TypeError, ValueError, IOError, OSError):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+# load conf file (yml): the default section with the stage section merged over it.
+# every script run is a new process: with cache (default: the ACS_CONFIG_CACHE
+# environment variable set to 1), the merged config is cached on disk (json, much
+# faster to load than yaml) until the content of the conf file changes. the cache
+# holds the passwords of the conf file, which is why it is opt-in.
+def getConfig(filename, stage='dev', cache=None):
     # sanity check
     if not filename:
         return None
+    if cache is None:
+        cache = os.environ.get(CONFIG_CACHE_ENV) == '1'
+
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if cache:
+        cache_key = [os.path.abspath(filename), stage, hashlib.sha1(data).hexdigest()]
+        cache_file = _config_cache_file(filename, stage)
+        ret = _read_config_cache(cache_file, cache_key)
+        if ret is not None:
+            return ret
+
+    conf = load_yaml(io.BytesIO(data))
+    ret = conf
+    if conf['default']:
+        ret = conf['default']
+        if stage and stage in conf:  # override default
+            for key in conf[stage]:
+                ret[key] = conf[stage][key]
 
-    ret = None
-    with open(filename, 'r') as file:
-        conf = yaml.load(file)
-        ret = conf
-        if conf['default']:
-            ret = conf['default']
-            if stage and stage in conf:  # override default
-                for key in conf[stage]:
-                    ret[key] = conf[stage][key]
-
-    return ret;
+    if cache:
+        _write_config_cache(cache_file, cache_key, ret)
+    return ret